@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+# Под ASGI логин и регистрация обслуживаются async-views с отдельным пулом для bcrypt
+os.environ.setdefault('AUTH_ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
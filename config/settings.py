@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import importlib.util
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -38,23 +40,32 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'rest_framework',
-    'drf_spectacular',
+    # drf_spectacular не подключён как приложение: воркер его не импортирует,
+    # схему собирает build_schema (см. core/schema.py)
     'corsheaders',
     'core',
 ]
 
 REST_FRAMEWORK = {
-    # Указываем схему для документации
-    'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    # Указываем схему для документации. Лёгкая заглушка:
+    # на время генерации core.schema_generator.LazySchemaGenerator переключает её на AutoSchema drf_spectacular
+    'DEFAULT_SCHEMA_CLASS': 'core.schema.AutoSchema',
 }
 
 SPECTACULAR_SETTINGS = {
     'TITLE': 'My Cool Order API',
     'DESCRIPTION': 'API with Custom RBAC & JWT',
     'VERSION': '1.0.0',
+    # Переключает DEFAULT_SCHEMA_CLASS на AutoSchema drf_spectacular и применяет аннотации core.schema.extend_schema
+    'DEFAULT_GENERATOR_CLASS': 'core.schema_generator.LazySchemaGenerator',
 }
 
+# Предсобранная схема (python manage.py build_schema) и срок кэширования /api/schema/
+SCHEMA_DIR = Path(os.environ.get('SCHEMA_DIR', BASE_DIR / 'schema'))
+SCHEMA_MAX_AGE = 3600
+
 MIDDLEWARE = [
+    'core.metrics.MetricsMiddleware',  # первой: замеряет всю цепочку
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -63,6 +74,7 @@ MIDDLEWARE = [
 
     # 'django.contrib.auth.middleware.AuthenticationMiddleware',
     'core.middleware.JWTAuthenticationMiddleware',  # <--- ДОЛЖНО БЫТЬ АКТИВНО
+    'core.db_router.ReadReplicaMiddleware',
 
 ]
 ROOT_URLCONF = 'config.urls'
@@ -70,7 +82,8 @@ ROOT_URLCONF = 'config.urls'
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
-        'DIRS': [],
+        # Шаблоны Swagger UI из пакета drf_spectacular (find_spec находит пакет, не импортируя его)
+        'DIRS': [Path(importlib.util.find_spec('drf_spectacular').origin).parent / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
@@ -95,6 +108,164 @@ DATABASES = {
     }
 }
 
+# Production-профиль SQLite для небольших edge-узлов: WAL, mmap, busy_timeout и т.д.
+# (см. core/sqlite.py, применяются при открытии соединения) плюс переиспользование соединений.
+# Сравнить с обычным режимом: python manage.py sqlite_bench
+SQLITE_PRODUCTION = os.environ.get('SQLITE_PRODUCTION') == '1'
+SQLITE_PRAGMAS = {}  # Переопределения для core.sqlite.DEFAULT_PRAGMAS
+
+# Настройки соединения production-профиля (их же использует sqlite_bench)
+SQLITE_PRODUCTION_DATABASE = {
+    'CONN_MAX_AGE': 600,
+    'CONN_HEALTH_CHECKS': True,
+    'OPTIONS': {
+        'timeout': 5,
+        # Писатель сразу берёт блокировку: без "database is locked" при апгрейде чтения до записи
+        'transaction_mode': 'IMMEDIATE',
+    },
+}
+
+if SQLITE_PRODUCTION:
+    DATABASES['default'].update(SQLITE_PRODUCTION_DATABASE)
+
+# Реплика для чтения (например, второй SQLite-файл локально, синхронизируемый с основным).
+# Тесты гоняются без неё: маршрутизация проверяется отдельно в ReadReplicaRoutingTests.
+if os.environ.get('DB_REPLICA_NAME'):
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ['DB_REPLICA_NAME'],
+        'TEST': {'MIRROR': 'default'},
+    }
+
+# Чтения безопасных методов идут в реплику (core.db_router.ReadReplicaMiddleware),
+# после записи клиент столько секунд читает с основной БД. Отметка передаётся в cookie
+# DATABASE_REPLICA_STICKY_COOKIE, поэтому работает при любом воркере и без общего кэша.
+DATABASE_ROUTERS = ['core.db_router.PrimaryReplicaRouter']
+DATABASE_REPLICA_ALIAS = 'replica'
+DATABASE_REPLICA_STICKY_SECONDS = 5
+DATABASE_REPLICA_STICKY_COOKIE = 'db_primary_until'
+
+# Кэш: счётчики версий (права, заказы) и in-process кэши сверяются с ним.
+# На нескольких воркерах замените на общий backend (Redis/Memcached).
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    # Кэш ответов списка/карточек заказов. Подойдёт и FileBasedCache, и общий Redis.
+    'orders': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'orders-responses',
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+}
+
+# Счётчики версий (core/versions.py) хранятся в общем кэше, если он общий для воркеров.
+# С LocMemCache они хранятся в таблице VersionCounter, а воркер перечитывает их раз в VERSIONS_LOCAL_TTL
+# секунд: изменения из других процессов (воркеры, manage.py shell, seed_db) доходят с этой задержкой.
+VERSIONS_SHARED_CACHE = CACHES['default']['BACKEND'] != 'django.core.cache.backends.locmem.LocMemCache'
+VERSIONS_LOCAL_TTL = 1
+
+# Ключ кэша ответов включает версию заказов — после записи старые ответы не отдаются.
+# Без общего кэша версий (VERSIONS_SHARED_CACHE) запись в другом воркере становится видна
+# не позже чем через VERSIONS_LOCAL_TTL — так же, как и в ETag.
+ORDERS_RESPONSE_CACHE = {
+    'ENABLED': True,
+    'ALIAS': 'orders',
+    'TIMEOUT': 300,
+}
+
+# Кэш проверенных JWT и снимков пользователей в памяти воркера (core/auth_cache.py).
+# Снимок сверяется с версией пользователя в кэше Django, которую поднимает любое сохранение User:
+# с общим backend'ом кэша деактивация и смена роли сразу доходят до всех воркеров.
+AUTH_PRINCIPAL_CACHE_SIZE = 10000
+AUTH_PRINCIPAL_CACHE_TTL = 60  # секунд
+
+# Stateless-авторизация: короткие access-токены несут маски прав роли и версию прав ('pv').
+# Пока версия актуальна, запрос авторизуется без обращений к БД (без общего кэша воркер лишь
+# перечитывает счётчики версий раз в VERSIONS_LOCAL_TTL).
+JWT_STATELESS_AUTH = False
+JWT_ACCESS_TOKEN_LIFETIME = 300  # секунд, только для stateless-режима
+JWT_REFRESH_TOKEN_LIFETIME = 60 * 60 * 24  # секунд
+
+# Отзыв токенов (/api/logout/, core/revocation.py). Каждый воркер держит Bloom-фильтр отозванных jti:
+# догружает его при смене версии в кэше или раз в REVOCATION_SYNC_INTERVAL секунд,
+# пересобирает раз в REVOCATION_REBUILD_INTERVAL. Истёкшие записи удаляются при отзыве пачками
+# по REVOCATION_PRUNE_BATCH не чаще раза в REVOCATION_PRUNE_INTERVAL на все воркеры.
+REVOCATION_BLOOM_CAPACITY = 100000
+REVOCATION_BLOOM_ERROR_RATE = 0.01
+REVOCATION_SYNC_INTERVAL = 5 * 60
+REVOCATION_REBUILD_INTERVAL = 60 * 60
+REVOCATION_PRUNE_INTERVAL = 600
+REVOCATION_PRUNE_BATCH = 1000
+# Общий ли кэш у воркеров (Redis/Memcached). С LocMemCache у каждого процесса свой кэш и версия
+# отзыва до других воркеров не доходит: фильтр догружается из БД раз в REVOCATION_LOCAL_SYNC_INTERVAL.
+REVOCATION_SHARED_CACHE = VERSIONS_SHARED_CACHE
+REVOCATION_LOCAL_SYNC_INTERVAL = 1
+
+# Keyset-пагинация списка заказов (?page_size= не больше максимума)
+ORDERS_PAGE_SIZE = 50
+ORDERS_MAX_PAGE_SIZE = 1000
+
+# Потоковая выгрузка /api/orders/export/: строк на одну выборку из БД
+ORDERS_EXPORT_CHUNK_SIZE = 2000
+
+# Пакетный endpoint /api/orders/bulk/: максимум операций в одном запросе
+ORDERS_BULK_MAX_OPERATIONS = 5000
+
+# Group commit для POST /api/orders/: одновременные вставки коммитятся одной транзакцией
+# раз в ORDERS_GROUP_COMMIT_MAX_DELAY_MS или по ORDERS_GROUP_COMMIT_MAX_BATCH строк
+ORDERS_GROUP_COMMIT = os.environ.get('ORDERS_GROUP_COMMIT') == '1'
+ORDERS_GROUP_COMMIT_MAX_BATCH = 200
+ORDERS_GROUP_COMMIT_MAX_DELAY_MS = 5
+ORDERS_GROUP_COMMIT_TIMEOUT = 10  # секунд ожидания коммита; потом 503 (снят с очереди) или 504 (исход неизвестен)
+
+# Idempotency-Key для POST /api/orders/: ответ первого запроса хранится IDEMPOTENCY_KEY_TTL,
+# повтор ждёт выполняющийся запрос до IDEMPOTENCY_WAIT_TIMEOUT (потом 409); запрос, не завершившийся
+# за IDEMPOTENCY_IN_FLIGHT_TIMEOUT, считается брошенным. Истёкшие ключи удаляются пачками по
+# IDEMPOTENCY_SWEEP_BATCH не чаще раза в IDEMPOTENCY_SWEEP_INTERVAL.
+IDEMPOTENCY_KEY_TTL = 24 * 3600  # секунд
+IDEMPOTENCY_WAIT_TIMEOUT = 10
+IDEMPOTENCY_IN_FLIGHT_TIMEOUT = 60
+IDEMPOTENCY_SWEEP_INTERVAL = 600
+IDEMPOTENCY_SWEEP_BATCH = 1000
+
+# /api/orders/stats/: максимальная глубина разбивки по дням
+ORDERS_STATS_MAX_DAYS = 366
+
+# Инструментирование запросов (core/metrics.py): Server-Timing и /api/metrics/ в формате Prometheus.
+# Число запросов к БД и общее время пишутся всегда, разбивка по фазам — для доли METRICS_SAMPLE_RATE.
+METRICS_ENABLED = True
+METRICS_SAMPLE_RATE = float(os.environ.get('METRICS_SAMPLE_RATE', '0.1'))
+METRICS_SERVER_TIMING = True
+# Кто может читать /api/metrics/: с METRICS_TOKEN — только с Authorization: Bearer <token>,
+# без него — только с адресов METRICS_ALLOWED_IPS; по умолчанию никто.
+# За nginx/балансировщиком на той же машине все запросы приходят с 127.0.0.1, поэтому loopback
+# добавляйте, только если приложение слушает адрес, недоступный снаружи в обход прокси.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+METRICS_ALLOWED_IPS = []
+
+# Async-версии логина/регистрации (включаются в config/asgi.py).
+# bcrypt считается в пуле из AUTH_HASHING_WORKERS потоков (None — по числу ядер),
+# сверх AUTH_HASHING_QUEUE_SIZE ожидающих запросы сразу получают 503.
+AUTH_ASYNC_VIEWS = os.environ.get('AUTH_ASYNC_VIEWS') == '1'
+AUTH_HASHING_WORKERS = None
+AUTH_HASHING_QUEUE_SIZE = 64
+
+# Массовый импорт пользователей (manage.py import_users, POST /api/users/import/):
+# записей на пачку (одна транзакция), процессов для bcrypt (None — по доступным ядрам),
+# максимум записей за один HTTP-запрос — дальше клиент продолжает с checkpoint.
+USERS_IMPORT_BATCH_SIZE = 1000
+USERS_IMPORT_WORKERS = None
+USERS_IMPORT_MAX_ROWS = 300  # bcrypt на запись: больше не уложится во время ответа HTTP
+
+# Стоимость bcrypt. Подбирается под железо: python manage.py calibrate_bcrypt.
+# Хеши с другой стоимостью перехешируются при успешном логине.
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', 12))
+
+# Тесты: bcrypt с cost=4 (core/test_runner.py)
+TEST_RUNNER = 'core.test_runner.TestRunner'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -1,12 +1,14 @@
 from django.contrib import admin
 from django.urls import path, include
-from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
+from core.schema import schema_view, swagger_view
 
 urlpatterns = [
     # path('admin/', admin.site.urls), # Админка выключена, помнишь?
     path('api/', include('core.urls')),
 
     # --- SWAGGER ---
-    path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
-    path('api/docs/', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
-]
\ No newline at end of file
+    # Схема собирается заранее (manage.py build_schema), drf_spectacular грузится только по запросу
+    path('api/schema/', schema_view, name='schema'),
+    path('api/schema/<str:digest>/', schema_view, name='schema-immutable'),
+    path('api/docs/', swagger_view, name='swagger-ui'),
+]
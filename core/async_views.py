@@ -0,0 +1,99 @@
+import json
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from .hashing import get_hashing_pool, HashingPoolFull
+from .models import User, hash_password, verify_password
+from .serializers import RegistrationSerializer, LoginSerializer
+from .utils import issue_tokens
+
+
+def _request_data(request):
+    if request.content_type == 'application/json':
+        try:
+            return json.loads(request.body or b'{}')
+        except ValueError:
+            return None
+    return request.POST
+
+
+def _busy():
+    response = JsonResponse({"error": "Authentication service is busy, retry later"}, status=503)
+    response['Retry-After'] = '1'
+    return response
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncRegisterView(View):
+    """
+    Async-версия RegisterView для ASGI: bcrypt считается в ограниченном пуле,
+    при переполненной очереди сразу отвечаем 503.
+    """
+
+    async def post(self, request):
+        data = _request_data(request)
+        if data is None:
+            return JsonResponse({"error": "Invalid JSON"}, status=400)
+
+        serializer = RegistrationSerializer(data=data)
+        # Проверка уникальности email ходит в БД
+        if not await sync_to_async(serializer.is_valid)():
+            return JsonResponse(serializer.errors, status=400)
+
+        validated = dict(serializer.validated_data)
+        validated.pop('password_repeat')
+        password = validated.pop('password')
+
+        try:
+            password_hash = await get_hashing_pool().run(hash_password, password)
+        except HashingPoolFull:
+            return _busy()
+
+        user = User(**validated, password_hash=password_hash)
+        await user.asave()
+        return JsonResponse({"message": "User registered successfully", "user_id": user.id}, status=201)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncLoginView(View):
+    """
+    Async-версия LoginView для ASGI.
+    """
+
+    async def post(self, request):
+        data = _request_data(request)
+        if data is None:
+            return JsonResponse({"error": "Invalid JSON"}, status=400)
+
+        serializer = LoginSerializer(data=data)
+        if not serializer.is_valid():
+            return JsonResponse(serializer.errors, status=400)
+
+        email = serializer.validated_data['email']
+        password = serializer.validated_data['password']
+
+        try:
+            user = await User.objects.select_related('role').aget(email=email)
+        except User.DoesNotExist:
+            return JsonResponse({"error": "Invalid credentials"}, status=401)
+
+        if not user.is_active:
+            return JsonResponse({"error": "Account is disabled"}, status=403)
+
+        try:
+            password_ok, new_hash = await get_hashing_pool().run(verify_password, password, user.password_hash)
+        except HashingPoolFull:
+            return _busy()
+
+        if not password_ok:
+            return JsonResponse({"error": "Invalid credentials"}, status=401)
+
+        if new_hash:
+            user.password_hash = new_hash
+            await user.asave(update_fields=['password_hash'])
+
+        role_name = user.role.name if user.role else 'guest'
+        tokens = await sync_to_async(issue_tokens)(user)
+        return JsonResponse({**tokens, "user_id": user.id, "role": role_name}, status=200)
@@ -0,0 +1,74 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+
+
+class LRUCache:
+    """
+    Ограниченный по размеру LRU-кэш с TTL на запись. Потокобезопасный, живёт в памяти воркера.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_where(self, predicate):
+        """
+        Удаляет записи, значение которых удовлетворяет условию.
+        """
+        with self._lock:
+            for key in [k for k, (value, _) in self._data.items() if predicate(value)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+def token_digest(token):
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+# Кэш проверенных токенов: digest -> (payload, снимок пользователя или None)
+principal_cache = LRUCache(
+    max_size=getattr(settings, 'AUTH_PRINCIPAL_CACHE_SIZE', 10000),
+    ttl=getattr(settings, 'AUTH_PRINCIPAL_CACHE_TTL', 60),
+)
+
+
+def evict_user(user_id):
+    # Снимок хранится вторым элементом: (payload, snapshot); у stateless-токенов его нет
+    principal_cache.delete_where(lambda entry: entry[1] is not None and entry[1]['id'] == user_id)
@@ -0,0 +1,122 @@
+import contextvars
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Алиас БД для чтения в текущем запросе (None — основная)
+_read_alias = contextvars.ContextVar('read_alias', default=None)
+
+
+def sticky_seconds():
+    return getattr(settings, 'DATABASE_REPLICA_STICKY_SECONDS', 5)
+
+
+def sticky_cookie():
+    return getattr(settings, 'DATABASE_REPLICA_STICKY_COOKIE', 'db_primary_until')
+
+
+def use_primary():
+    """
+    Переключает оставшиеся чтения текущего запроса на основную БД.
+    """
+    _read_alias.set(None)
+
+
+def reading_from_replica():
+    return _read_alias.get() is not None
+
+
+def pin_primary_if_recent(modified_at):
+    """
+    Если данные менялись недавно (в пределах окна отставания реплики),
+    читаем их с основной БД: иначе под новой версией закэшируется старое состояние.
+    """
+    if reading_from_replica() and modified_at is not None and time.time() - modified_at < sticky_seconds():
+        use_primary()
+
+
+class PrimaryReplicaRouter:
+    """
+    Запись — всегда в основную БД, чтение — в реплику, если middleware разрешила это для запроса.
+    """
+
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплика — копия основной БД, связи между ними допустимы
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схему на реплику приносит репликация, migrate туда ничего не применяет
+        if db == getattr(settings, 'DATABASE_REPLICA_ALIAS', 'replica'):
+            return False
+        return None
+
+
+class ReadReplicaMiddleware:
+    """
+    Отправляет чтения безопасных методов в реплику.
+    После успешной записи клиент на DATABASE_REPLICA_STICKY_SECONDS читает с основной БД —
+    чтобы видеть собственные изменения. Отметка об этом живёт в cookie клиента, а не в кэше
+    воркера: следующий запрос может попасть в другой процесс.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        alias = getattr(settings, 'DATABASE_REPLICA_ALIAS', 'replica')
+        self.replica_alias = alias if alias in connections.settings else None
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _read_alias.set(self.choose_alias(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            _read_alias.reset(token)
+        self.process_response(request, response)
+        return response
+
+    async def __acall__(self, request):
+        token = _read_alias.set(self.choose_alias(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            _read_alias.reset(token)
+        self.process_response(request, response)
+        return response
+
+    def is_sticky(self, request):
+        # В cookie — момент (в мс), до которого читаем с основной БД; значения дальше окна не принимаем
+        try:
+            until = int(request.COOKIES.get(sticky_cookie(), '')) / 1000
+        except ValueError:
+            return False
+        return 0 < until - time.time() <= sticky_seconds()
+
+    def choose_alias(self, request):
+        if self.replica_alias is None or request.method not in SAFE_METHODS:
+            return None
+        if self.is_sticky(request):
+            return None
+        return self.replica_alias
+
+    def process_response(self, request, response):
+        if self.replica_alias is None or request.method in SAFE_METHODS or response.status_code >= 400:
+            return
+        seconds = sticky_seconds()
+        response.set_cookie(
+            sticky_cookie(), str(int((time.time() + seconds) * 1000)), max_age=seconds,
+            secure=settings.SESSION_COOKIE_SECURE, httponly=True, samesite='Lax',
+        )
@@ -0,0 +1,155 @@
+import atexit
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from .models import Order
+from .signals import orders_bulk_created
+
+
+# Метка в очереди: дописать всё, что перед ней, и остановить поток
+_STOP = object()
+
+
+class GroupCommitCancelled(Exception):
+    """
+    Заказ снят с очереди до записи (таймаут или остановка писателя) — он точно не сохранён.
+    """
+
+
+class GroupCommitOutcomeUnknown(Exception):
+    """
+    Таймаут, когда пачка с заказом уже пишется: заказ может оказаться сохранён.
+    """
+
+
+def flush_orders(orders):
+    """
+    Вставляет пачку заказов одной транзакцией (один коммит на всю пачку).
+    Исключение означает, что транзакция откатилась: ошибки повторного подъёма версий
+    после коммита on_commit-хуки только логируют (core/versions.py).
+    """
+    with transaction.atomic():
+        Order.objects.bulk_create(orders)
+        orders_bulk_created(orders)
+
+
+class GroupCommitWriter:
+    """
+    Писатель заказов на процесс: копит одновременные вставки до max_batch строк
+    или max_delay секунд и коммитит их вместе. Каждый вызывающий получает свой id
+    уже после коммита, так что ответ 201 по-прежнему означает, что заказ сохранён.
+    """
+
+    def __init__(self, max_batch, max_delay, flush=flush_orders):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.flush = flush
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def submit(self, order, timeout=None):
+        """
+        Ставит заказ в очередь и ждёт коммита его пачки. Возвращает тот же объект с id.
+        По таймауту заказ, ещё не взятый в пачку, снимается с очереди (GroupCommitCancelled);
+        если пачка уже пишется, исход неизвестен (GroupCommitOutcomeUnknown).
+        """
+        if self._closed:
+            raise GroupCommitCancelled()
+        self._ensure_started()
+        future = Future()
+        self._queue.put((order, future))
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            if future.cancel():
+                raise GroupCommitCancelled()
+            if future.done():
+                return future.result()
+            raise GroupCommitOutcomeUnknown()
+
+    def close(self, timeout=None):
+        """
+        Дописывает уже поставленные в очередь заказы и останавливает поток.
+        Поток — daemon, поэтому при выходе процесса close вызывается через atexit.
+        """
+        with self._lock:
+            self._closed = True
+            thread = self._thread
+        if thread is not None and thread.is_alive():
+            self._queue.put(_STOP)
+            thread.join(timeout)
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='order-group-commit', daemon=True)
+                    self._thread.start()
+                    atexit.register(self.close)
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(item)
+            if item is _STOP:
+                break
+        return batch
+
+    def _run(self):
+        stop = False
+        while not stop:
+            batch = self._collect()
+            stop = batch[-1] is _STOP
+            if stop:
+                batch.pop()
+            # Снятые по таймауту заказы не пишем; остальные с этого момента отменить нельзя
+            batch = [(order, future) for order, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            close_old_connections()
+            try:
+                self.flush([order for order, _ in batch])
+            except Exception:
+                # Пачка откатилась целиком (flush_orders не бросает после коммита).
+                # Одна плохая строка не должна ронять соседей: повторяем поштучно
+                for order, future in batch:
+                    order.pk = None
+                    try:
+                        self.flush([order])
+                    except Exception as exc:
+                        future.set_exception(exc)
+                    else:
+                        future.set_result(order)
+            else:
+                for order, future in batch:
+                    future.set_result(order)
+        connection.close()
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_group_writer():
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = GroupCommitWriter(
+                    max_batch=getattr(settings, 'ORDERS_GROUP_COMMIT_MAX_BATCH', 200),
+                    max_delay=getattr(settings, 'ORDERS_GROUP_COMMIT_MAX_DELAY_MS', 5) / 1000,
+                )
+    return _writer
@@ -0,0 +1,53 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+
+
+class HashingPoolFull(Exception):
+    """
+    Очередь на хеширование переполнена — запрос нужно отклонить сразу (503).
+    """
+
+
+class HashingPool:
+    """
+    Ограниченный пул потоков для bcrypt.
+    bcrypt отпускает GIL, поэтому потоки реально считают параллельно,
+    а event loop и остальные запросы не ждут хеширования.
+    Одновременно в пуле не больше workers + queue_size задач, остальные получают HashingPoolFull.
+    """
+
+    def __init__(self, workers, queue_size):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bcrypt')
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+
+    async def run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HashingPoolFull()
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        # Слот освобождается, когда задача действительно завершилась: отмена запроса
+        # не останавливает уже запущенный bcrypt, а задача из очереди отменяется вместе с ним
+        future.add_done_callback(lambda _: self._slots.release())
+        return await asyncio.wrap_future(future)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_hashing_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = HashingPool(
+                    workers=getattr(settings, 'AUTH_HASHING_WORKERS', None) or os.cpu_count() or 1,
+                    queue_size=getattr(settings, 'AUTH_HASHING_QUEUE_SIZE', 64),
+                )
+    return _pool
@@ -0,0 +1,106 @@
+import datetime
+import hashlib
+import json
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, router, transaction
+from django.db.models import Subquery
+from django.utils import timezone
+from .models import IdempotencyKey
+
+SWEEP_LOCK_KEY = 'idempotency:sweep'
+
+
+class IdempotencyKeyMismatch(Exception):
+    """
+    Ключ уже использован для запроса с другим телом (422).
+    """
+
+
+class IdempotencyKeyInProgress(Exception):
+    """
+    Первый запрос с этим ключом не завершился за IDEMPOTENCY_WAIT_TIMEOUT (409).
+    """
+
+
+def request_fingerprint(request):
+    # Тело уже разобрано DRF — хешируем данные, а не сырые байты
+    payload = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(f'{request.method} {request.path}\n{payload}'.encode('utf-8')).hexdigest()
+
+
+def _keys():
+    # Ожидание и захват — только по основной БД: реплика может не видеть свежий ключ
+    return IdempotencyKey.objects.using(router.db_for_write(IdempotencyKey))
+
+
+def claim_idempotency_key(user_id, key, fingerprint):
+    """
+    Захватывает ключ для запроса. Возвращает None, если запрос должен выполниться
+    (потом вызвать store_idempotent_response или release_idempotency_key),
+    или запись с сохранённым ответом первого запроса.
+    Пока первый запрос выполняется, повторы ждут его ответ, а не выполняются параллельно.
+    """
+    sweep_expired_keys()
+    deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_TIMEOUT
+    delay = 0.02
+    while True:
+        now = timezone.now()
+        expires_at = now + datetime.timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+        try:
+            # Уникальный индекс (user_id, key) решает, кто из одновременных запросов первый
+            with transaction.atomic(using=router.db_for_write(IdempotencyKey)):
+                _keys().create(user_id=user_id, key=key, request_hash=fingerprint,
+                               created_at=now, expires_at=expires_at)
+            return None
+        except IntegrityError:
+            pass
+
+        record = _keys().filter(user_id=user_id, key=key).first()
+        if record is None:
+            # Ключ только что удалили (истёк) — пробуем занять снова
+            continue
+        abandoned_before = now - datetime.timedelta(seconds=settings.IDEMPOTENCY_IN_FLIGHT_TIMEOUT)
+        if record.expires_at <= now or (record.status_code is None and record.created_at <= abandoned_before):
+            # Истёкший ключ или брошенный упавшим воркером: перехватываем условным UPDATE,
+            # из нескольких претендентов его выиграет один
+            taken = _keys().filter(pk=record.pk, created_at=record.created_at).update(
+                request_hash=fingerprint, status_code=None, response=None, created_at=now, expires_at=expires_at,
+            )
+            if taken:
+                return None
+            continue
+
+        if record.request_hash != fingerprint:
+            raise IdempotencyKeyMismatch()
+        if record.status_code is not None:
+            return record
+        if time.monotonic() >= deadline:
+            raise IdempotencyKeyInProgress()
+        time.sleep(delay)
+        delay = min(delay * 2, 0.5)
+
+
+def store_idempotent_response(user_id, key, status_code, data):
+    _keys().filter(user_id=user_id, key=key, status_code__isnull=True).update(status_code=status_code, response=data)
+
+
+def release_idempotency_key(user_id, key):
+    # Запрос не удался — ключ освобождается, повтор выполнится заново
+    _keys().filter(user_id=user_id, key=key, status_code__isnull=True).delete()
+
+
+def sweep_expired_keys(force=False):
+    """
+    Удаляет истёкшие ключи — не больше IDEMPOTENCY_SWEEP_BATCH за раз (по индексу expires_at)
+    и не чаще раза в IDEMPOTENCY_SWEEP_INTERVAL на все воркеры (замок в кэше).
+    """
+    if not force and not cache.add(SWEEP_LOCK_KEY, 1, timeout=settings.IDEMPOTENCY_SWEEP_INTERVAL):
+        return 0
+    expired = (
+        _keys().filter(expires_at__lte=timezone.now())
+        .order_by('expires_at').values('pk')[:settings.IDEMPOTENCY_SWEEP_BATCH]
+    )
+    deleted, _ = _keys().filter(pk__in=Subquery(expired)).delete()
+    return deleted
@@ -0,0 +1,314 @@
+import json
+import random
+import resource
+import statistics
+import threading
+import time
+import uuid
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, close_old_connections, transaction
+from django.test import Client, override_settings
+from core.models import Role, Resource, Permission, User, Order, hash_password
+from core.signals import orders_bulk_created
+
+BENCH_PASSWORD = 'bench-password'
+BENCH_DOMAIN = 'bench.local'
+
+DEFAULT_MIX = 'login=1,list=10,retrieve=5,create=3,update=2,delete=1,register=0.5'
+# Сколько ждать, пока залогинятся все потоки: упавший логин не должен вешать прогон
+BARRIER_TIMEOUT = 60
+CLEANUP_BATCH = 500
+
+
+class QueryCounter:
+    """
+    execute_wrapper: считает запросы к БД в текущем потоке.
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный прогон API в процессе: смесь register/login/CRUD заказов с заданной конкуренцией. '
+        'Создаёт свою роль, пользователей (@bench.local) и заказы и удаляет в конце только их, '
+        'даже если прогон упал. Запускайте на отдельной БД.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--duration', type=float, default=10, help='Секунд нагрузки')
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--orders-per-user', type=int, default=100, help='Заказов на пользователя до старта')
+        parser.add_argument('--role', choices=['admin', 'user'], default='user',
+                            help='admin — scope ALL, user — scope OWN')
+        parser.add_argument('--mix', default=DEFAULT_MIX, help='Веса операций: op=вес,...')
+        parser.add_argument('--output', help='Куда сохранить результаты (JSON)')
+        parser.add_argument('--keep', action='store_true', help='Не удалять данные прогона')
+
+    def parse_mix(self, value):
+        mix = {}
+        for part in value.split(','):
+            name, _, weight = part.partition('=')
+            if name not in OPERATIONS:
+                raise CommandError(f'Неизвестная операция: {name}')
+            mix[name] = float(weight or 1)
+        return mix
+
+    @transaction.atomic
+    def seed(self, options):
+        resource_obj, created_resource = Resource.objects.get_or_create(code='orders')
+        # Своя роль на каждый прогон: чужие Permission не трогаем
+        role = Role.objects.create(name=f'bench-{options["role"]}-{uuid.uuid4().hex[:8]}')
+        flags = (
+            {'can_create': True, 'can_read_all': True, 'can_update_all': True, 'can_delete_all': True}
+            if options['role'] == 'admin' else
+            {'can_create': True, 'can_read_own': True, 'can_update_own': True, 'can_delete_own': True}
+        )
+        Permission.objects.create(role=role, resource=resource_obj, **flags)
+
+        # Один bcrypt на всех — хешировать каждого незачем
+        password_hash = hash_password(BENCH_PASSWORD)
+        users = User.objects.bulk_create([
+            User(first_name='Bench', email=f'bench-{uuid.uuid4().hex}@{BENCH_DOMAIN}',
+                 password_hash=password_hash, role=role)
+            for _ in range(options['users'])
+        ])
+        orders = Order.objects.bulk_create(
+            [Order(description=f'Bench order {i}', owner=user)
+             for user in users for i in range(options['orders_per_user'])],
+            batch_size=1000,
+        )
+        # bulk_create не шлёт post_save: без этого каскадное удаление в cleanup вычло бы
+        # из статистики заказы, которые в неё не попадали
+        orders_bulk_created(orders)
+        return role, users, resource_obj if created_resource else None
+
+    def cleanup(self, role, users, registered_emails, resource_obj):
+        # Только пользователи этого прогона: созданные seed и зарегистрированные op_register.
+        # Параллельный прогон на той же БД своих не теряет. Заказы и права уходят каскадом;
+        # ресурс удаляем, только если его создал прогон
+        User.objects.filter(id__in=[user.id for user in users]).delete()
+        # Пачками: за длинный прогон регистраций больше, чем параметров в одном запросе SQLite
+        for start in range(0, len(registered_emails), CLEANUP_BATCH):
+            User.objects.filter(email__in=registered_emails[start:start + CLEANUP_BATCH]).delete()
+        role.delete()
+        if resource_obj is not None:
+            resource_obj.delete()
+
+    def handle(self, *args, **options):
+        mix = self.parse_mix(options['mix'])
+
+        role, users, resource_obj = self.seed(options)
+        self.stdout.write(f"Данные: {len(users)} польз., {len(users) * options['orders_per_user']} заказов, "
+                          f"роль {role.name}")
+        # Email зарегистрированных во время прогона (op_register) — для cleanup
+        registered_emails = []
+        try:
+            samples, elapsed = self.run_load(mix, users, registered_emails, options)
+        finally:
+            if not options['keep']:
+                self.cleanup(role, users, registered_emails, resource_obj)
+
+        report = self.build_report(samples, elapsed, options)
+        self.print_report(report)
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as fh:
+                json.dump(report, fh, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Результаты сохранены в {options['output']}"))
+
+    def run_load(self, mix, users, registered_emails, options):
+        names, weights = list(mix), list(mix.values())
+        samples = {name: [] for name in names}
+        lock = threading.Lock()
+        failures = []
+        # Отсчёт начинается, когда все потоки залогинились (bcrypt на старте не в счёт)
+        window = {}
+        barrier = threading.Barrier(
+            options['concurrency'],
+            action=lambda: window.update(start=time.perf_counter(), stop=time.perf_counter() + options['duration']),
+            timeout=BARRIER_TIMEOUT,
+        )
+
+        def worker(seed):
+            rnd = random.Random(seed)
+            state = WorkerState(Client(HTTP_HOST='localhost'), rnd.choice(users).email, registered_emails)
+            local = {name: [] for name in names}
+            counter = QueryCounter()
+            try:
+                with connection.execute_wrapper(counter):
+                    state.login()
+                    barrier.wait()
+                    while time.perf_counter() < window['stop']:
+                        name = rnd.choices(names, weights)[0]
+                        counter.count = 0
+                        started = time.perf_counter()
+                        try:
+                            ok = OPERATIONS[name](state, rnd)
+                        except Exception:
+                            ok = False
+                        local[name].append((time.perf_counter() - started, counter.count, ok))
+            except threading.BrokenBarrierError:
+                return
+            except Exception as exc:
+                # Остальные потоки не должны ждать упавший у барьера
+                failures.append(exc)
+                barrier.abort()
+                return
+            finally:
+                close_old_connections()
+            with lock:
+                for name, items in local.items():
+                    samples[name].extend(items)
+
+        with override_settings(ALLOWED_HOSTS=['localhost']):
+            threads = [threading.Thread(target=worker, args=(i,)) for i in range(options['concurrency'])]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        if failures:
+            raise CommandError(f'Поток нагрузки упал: {failures[0]!r}') from failures[0]
+        if barrier.broken:
+            raise CommandError(f'Потоки не залогинились за {BARRIER_TIMEOUT} с')
+        return samples, time.perf_counter() - window['start']
+
+    def build_report(self, samples, elapsed, options):
+        operations = {}
+        total = 0
+        for name, items in samples.items():
+            latencies = [item[0] * 1000 for item in items]
+            queries = [item[1] for item in items]
+            total += len(items)
+            operations[name] = {
+                'requests': len(items),
+                'errors': sum(1 for item in items if not item[2]),
+                'rps': len(items) / elapsed,
+                'p50_ms': percentile(latencies, 0.50),
+                'p95_ms': percentile(latencies, 0.95),
+                'p99_ms': percentile(latencies, 0.99),
+                'queries_per_request': statistics.mean(queries) if queries else 0,
+            }
+        return {
+            'config': {key: options[key] for key in
+                       ('concurrency', 'duration', 'users', 'orders_per_user', 'role', 'mix')},
+            'elapsed_s': elapsed,
+            'total_requests': total,
+            'rps': total / elapsed,
+            # ru_maxrss на Linux — в КиБ
+            'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            'operations': operations,
+        }
+
+    def print_report(self, report):
+        self.stdout.write(f"{'операция':<10} {'запросов':>9} {'ошибок':>7} {'rps':>8} "
+                          f"{'p50':>8} {'p95':>8} {'p99':>8} {'SQL/запр':>9}")
+        for name, stats in report['operations'].items():
+            self.stdout.write(
+                f"{name:<10} {stats['requests']:>9} {stats['errors']:>7} {stats['rps']:>8.1f} "
+                f"{stats['p50_ms']:>7.1f}м {stats['p95_ms']:>7.1f}м {stats['p99_ms']:>7.1f}м "
+                f"{stats['queries_per_request']:>9.2f}"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"Итого: {report['total_requests']} запросов, {report['rps']:.1f} rps, "
+            f"пик RSS {report['peak_rss_mb']:.1f} МБ"
+        ))
+
+
+class WorkerState:
+    """
+    Клиент одного виртуального пользователя: токен и id созданных им заказов.
+    registered_emails — общий для потоков список email, с которыми регистрировались.
+    """
+
+    def __init__(self, client, email, registered_emails):
+        self.client = client
+        self.email = email
+        self.order_ids = []
+        self.registered_emails = registered_emails
+
+    def login(self):
+        response = self.client.post('/api/login/', {'email': self.email, 'password': BENCH_PASSWORD})
+        if response.status_code != 200:
+            return False
+        self.client.defaults['HTTP_AUTHORIZATION'] = f"Bearer {response.json()['token']}"
+        return True
+
+
+def op_login(state, rnd):
+    return state.login()
+
+
+def op_register(state, rnd):
+    email = f'bench-{uuid.uuid4().hex}@{BENCH_DOMAIN}'
+    # Запоминаем до запроса: пользователь может сохраниться, даже если запрос потом упал
+    state.registered_emails.append(email)
+    response = state.client.post('/api/register/', {
+        'first_name': 'Bench',
+        'email': email,
+        'password': BENCH_PASSWORD,
+        'password_repeat': BENCH_PASSWORD,
+    })
+    return response.status_code == 201
+
+
+def op_list(state, rnd):
+    response = state.client.get('/api/orders/')
+    if response.status_code != 200:
+        return False
+    if not state.order_ids:
+        state.order_ids = [item['id'] for item in response.json()['results']]
+    return True
+
+
+def op_retrieve(state, rnd):
+    if not state.order_ids:
+        return op_list(state, rnd)
+    return state.client.get(f'/api/orders/{rnd.choice(state.order_ids)}/').status_code == 200
+
+
+def op_create(state, rnd):
+    response = state.client.post('/api/orders/', {'description': 'Bench order'})
+    if response.status_code != 201:
+        return False
+    state.order_ids.append(response.json()['id'])
+    return True
+
+
+def op_update(state, rnd):
+    if not state.order_ids:
+        return op_create(state, rnd)
+    response = state.client.patch(f'/api/orders/{rnd.choice(state.order_ids)}/',
+                                  {'description': 'Bench update'}, content_type='application/json')
+    return response.status_code == 200
+
+
+def op_delete(state, rnd):
+    if not state.order_ids:
+        return op_create(state, rnd)
+    order_id = state.order_ids.pop(rnd.randrange(len(state.order_ids)))
+    return state.client.delete(f'/api/orders/{order_id}/').status_code in (204, 404)
+
+
+OPERATIONS = {
+    'login': op_login,
+    'register': op_register,
+    'list': op_list,
+    'retrieve': op_retrieve,
+    'create': op_create,
+    'update': op_update,
+    'delete': op_delete,
+}
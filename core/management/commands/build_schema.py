@@ -0,0 +1,39 @@
+import hashlib
+import os
+from pathlib import Path
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from core.schema import SCHEMA_FORMATS
+
+
+class Command(BaseCommand):
+    help = 'Собирает OpenAPI-схему в файлы (JSON/YAML + sha256) для /api/schema/ — на этапе сборки, а не на запросе'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output-dir', default=None, help='Каталог для файлов (по умолчанию SCHEMA_DIR)')
+        parser.add_argument('--format', choices=['json', 'yaml', 'all'], default='all')
+
+    def handle(self, *args, **options):
+        from drf_spectacular.renderers import OpenApiJsonRenderer, OpenApiYamlRenderer
+        from drf_spectacular.settings import spectacular_settings
+
+        output_dir = Path(options['output_dir'] or settings.SCHEMA_DIR)
+        output_dir.mkdir(parents=True, exist_ok=True)
+
+        generator = spectacular_settings.DEFAULT_GENERATOR_CLASS()
+        schema = generator.get_schema(request=None, public=True)
+
+        renderers = {'json': OpenApiJsonRenderer, 'yaml': OpenApiYamlRenderer}
+        formats = renderers if options['format'] == 'all' else [options['format']]
+        for schema_format in formats:
+            content = renderers[schema_format]().render(schema, renderer_context={})
+            digest = hashlib.sha256(content).hexdigest()
+
+            path = output_dir / SCHEMA_FORMATS[schema_format][0]
+            # Через временный файл: воркеры не должны прочитать наполовину записанную схему
+            tmp_path = path.with_suffix(path.suffix + '.tmp')
+            tmp_path.write_bytes(content)
+            os.replace(tmp_path, path)
+            path.with_name(path.name + '.sha256').write_text(f'{digest}  {path.name}\n')
+
+            self.stdout.write(self.style.SUCCESS(f'{path}: {len(content)} байт, sha256 {digest}'))
@@ -0,0 +1,64 @@
+import re
+import statistics
+import time
+from pathlib import Path
+import bcrypt
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Подбирает стоимость bcrypt (BCRYPT_ROUNDS) под целевое время хеширования на этом железе'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target-ms', type=float, default=250, help='Бюджет на одно хеширование, мс')
+        parser.add_argument('--min-rounds', type=int, default=10)
+        parser.add_argument('--max-rounds', type=int, default=16)
+        parser.add_argument('--samples', type=int, default=3, help='Замеров на каждую стоимость')
+        parser.add_argument('--env-file', default=None,
+                            help='Записать BCRYPT_ROUNDS=<cost> в env-файл (например, .env), заменив старое значение')
+
+    def measure(self, rounds, samples):
+        timings = []
+        for _ in range(samples):
+            salt = bcrypt.gensalt(rounds=rounds)
+            started = time.perf_counter()
+            bcrypt.hashpw(b'calibration-password', salt)
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
+
+    def handle(self, *args, **options):
+        target = options['target_ms']
+        chosen = None
+
+        self.stdout.write(f"Целевое время: {target:.0f} мс, текущая стоимость: {settings.BCRYPT_ROUNDS}")
+        for rounds in range(options['min_rounds'], options['max_rounds'] + 1):
+            elapsed = self.measure(rounds, options['samples'])
+            self.stdout.write(f"  cost={rounds}: {elapsed:.1f} мс")
+            if elapsed > target:
+                break
+            chosen = rounds
+
+        if chosen is None:
+            self.stdout.write(self.style.WARNING(
+                f"Даже cost={options['min_rounds']} не укладывается в бюджет, используем минимальную"
+            ))
+            chosen = options['min_rounds']
+
+        self.stdout.write(self.style.SUCCESS(f"Рекомендуемая стоимость: {chosen}"))
+        # config/settings.py читает стоимость из переменной окружения
+        self.stdout.write(f"Применить: export BCRYPT_ROUNDS={chosen}")
+        if options['env_file']:
+            self.write_env(Path(options['env_file']), chosen)
+        if chosen != settings.BCRYPT_ROUNDS:
+            self.stdout.write("Старые хеши будут перехешированы при следующем успешном логине пользователей.")
+
+    def write_env(self, path, rounds):
+        line = f'BCRYPT_ROUNDS={rounds}'
+        content = path.read_text() if path.exists() else ''
+        if re.search(r'^BCRYPT_ROUNDS=.*$', content, flags=re.M):
+            content = re.sub(r'^BCRYPT_ROUNDS=.*$', line, content, flags=re.M)
+        else:
+            content += ('' if not content or content.endswith('\n') else '\n') + line + '\n'
+        path.write_text(content)
+        self.stdout.write(self.style.SUCCESS(f"{line} записано в {path}"))
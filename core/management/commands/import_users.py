@@ -0,0 +1,69 @@
+import itertools
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from django.core.management.base import BaseCommand, CommandError
+from core.user_import import IMPORT_FORMATS, UserImporter, read_records
+
+
+class Command(BaseCommand):
+    help = (
+        'Массовый импорт пользователей из CSV/NDJSON (first_name, last_name, email, password, role). '
+        'Пароли хешируются в пуле процессов, вставка пачками; после каждой пачки пишется checkpoint, '
+        'повторный запуск продолжает с него.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Входной файл ('-' — stdin)")
+        parser.add_argument('--format', choices=IMPORT_FORMATS, default=None,
+                            help='Формат входа (по умолчанию по расширению файла)')
+        parser.add_argument('--batch-size', type=int, default=None, help='Записей на пачку (USERS_IMPORT_BATCH_SIZE)')
+        parser.add_argument('--role', default=None, help='Роль для записей без колонки role')
+        parser.add_argument('--checkpoint', default=None, help='Файл контрольной точки (по умолчанию <path>.checkpoint)')
+        parser.add_argument('--errors', default=None, help='Файл для ошибок по записям, NDJSON (по умолчанию <path>.errors)')
+        parser.add_argument('--restart', action='store_true', help='Игнорировать сохранённую контрольную точку')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        import_format = options['format'] or ('csv' if path.endswith('.csv') else 'ndjson')
+        if path == '-' and not (options['checkpoint'] and options['errors']):
+            raise CommandError('Для stdin укажите --checkpoint и --errors')
+        checkpoint_path = Path(options['checkpoint'] or f'{path}.checkpoint')
+        errors_path = Path(options['errors'] or f'{path}.errors')
+
+        start = 0
+        if checkpoint_path.exists() and not options['restart']:
+            start = json.loads(checkpoint_path.read_text())['row']
+            self.stdout.write(f'Продолжаем с записи {start + 1} ({checkpoint_path})')
+
+        try:
+            importer = UserImporter(batch_size=options['batch_size'], default_role=options['role'])
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        created = failed = 0
+        started = time.perf_counter()
+        stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        with stream, open(errors_path, 'a' if start else 'w', encoding='utf-8') as errors_file:
+            records = itertools.islice(read_records(stream, import_format), start, None)
+            for batch in importer.run(records):
+                created += batch['created']
+                failed += len(batch['errors'])
+                for error in batch['errors']:
+                    errors_file.write(json.dumps(error, ensure_ascii=False) + '\n')
+                errors_file.flush()
+                # Пачка уже закоммичена — фиксируем, откуда продолжать
+                tmp_path = checkpoint_path.with_name(checkpoint_path.name + '.tmp')
+                tmp_path.write_text(json.dumps({'row': batch['checkpoint']}))
+                os.replace(tmp_path, checkpoint_path)
+
+                rate = (batch['checkpoint'] - start) / max(time.perf_counter() - started, 1e-9)
+                self.stdout.write(f"  записей: {batch['checkpoint']}, создано: {created}, ошибок: {failed} "
+                                  f"({rate:,.0f}/с)")
+
+        checkpoint_path.unlink(missing_ok=True)
+        self.stdout.write(self.style.SUCCESS(f'Импорт завершён: создано {created}, ошибок {failed}'))
+        if failed:
+            self.stdout.write(self.style.WARNING(f'Ошибки по записям: {errors_path}'))
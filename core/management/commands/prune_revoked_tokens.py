@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from core.revocation import prune_revoked_tokens
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет все записи об отозванных токенах, срок которых уже истёк. Обычно они удаляются '
+        'пачками при отзыве; команда нужна для разовой чистки большого хвоста'
+    )
+
+    def handle(self, *args, **options):
+        deleted = total = prune_revoked_tokens(force=True)
+        while deleted:
+            deleted = prune_revoked_tokens(force=True)
+            total += deleted
+        self.stdout.write(self.style.SUCCESS(f'Удалено записей: {total}'))
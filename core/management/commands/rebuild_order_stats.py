@@ -0,0 +1,14 @@
+import time
+from django.core.management.base import BaseCommand
+from core.stats import rebuild_order_stats
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает сводные счётчики заказов (по владельцам и дням) из core_order'
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        total = rebuild_order_stats()
+        self.stdout.write(self.style.SUCCESS(
+            f'Счётчики пересобраны: {total} заказов за {time.perf_counter() - started:.2f} с'
+        ))
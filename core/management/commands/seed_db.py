@@ -1,11 +1,159 @@
+import datetime
+import itertools
+import random
+import time
 from django.core.management.base import BaseCommand
-from core.models import Role, Resource, Permission, User
+from django.db import connection, transaction
+from django.utils import timezone
+from core.models import (
+    Role, Resource, Permission, User, Order, hash_password,
+    CREATE, READ_OWN, READ_ALL, UPDATE_OWN, UPDATE_ALL, DELETE_ALL,
+)
+from core.rbac import bump_rbac_version
+from core.stats import rebuild_order_stats
+from core.versions import bump_orders_version
+
+SEED_DOMAIN = 'seed.local'
+
+# Типовые наборы прав для синтетических ролей
+SYNTHETIC_MASKS = (
+    0,
+    READ_OWN,
+    CREATE | READ_OWN,
+    CREATE | READ_OWN | UPDATE_OWN,
+    CREATE | READ_ALL | UPDATE_ALL | DELETE_ALL,
+)
 
 
 class Command(BaseCommand):
-    help = 'Наполняет БД начальными данными (Роли, Ресурсы, Тестовый админ)'
+    help = (
+        'Наполняет БД начальными данными (Роли, Ресурсы, Тестовый админ). '
+        'С флагами --roles/--resources/--users/--orders генерирует синтетический объём данных.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--roles', type=int, default=0, help='Синтетических ролей')
+        parser.add_argument('--resources', type=int, default=0, help='Синтетических ресурсов (с матрицей прав)')
+        parser.add_argument('--users', type=int, default=0, help='Синтетических пользователей')
+        parser.add_argument('--orders', type=int, default=0, help='Синтетических заказов')
+        parser.add_argument('--skew', type=float, default=1.1,
+                            help='Показатель Zipf для распределения заказов по владельцам (0 — равномерно)')
+        parser.add_argument('--days', type=int, default=365, help='Разброс дат заказов, дней назад')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--password', default='password123', help='Общий пароль синтетических пользователей')
+        parser.add_argument('--seed', type=int, default=None, help='Seed генератора случайных чисел')
+
+    def handle(self, *args, **options):
+        self.seed_base()
+
+        if any(options[key] for key in ('roles', 'resources', 'users', 'orders')):
+            self.generate(options)
+
+    def progress(self, label, done, total, started):
+        rate = done / max(time.perf_counter() - started, 1e-9)
+        self.stdout.write(f"  {label}: {done}/{total} ({rate:,.0f}/с)")
+
+    def generate(self, options):
+        rnd = random.Random(options['seed'])
+        batch_size = options['batch_size']
+        self.stdout.write("Генерируем синтетические данные...")
+
+        roles = list(Role.objects.filter(name__startswith='synthetic-role-'))
+        if options['roles']:
+            Role.objects.bulk_create(
+                [Role(name=f'synthetic-role-{i}') for i in range(options['roles'])],
+                ignore_conflicts=True,
+            )
+            roles = list(Role.objects.filter(name__startswith='synthetic-role-'))
+            self.stdout.write(self.style.SUCCESS(f'Ролей: {len(roles)}'))
+
+        if options['resources']:
+            Resource.objects.bulk_create(
+                [Resource(code=f'resource-{i}') for i in range(options['resources'])],
+                ignore_conflicts=True,
+            )
+            resources = list(Resource.objects.filter(code__startswith='resource-')) + \
+                list(Resource.objects.filter(code='orders'))
+            Permission.objects.bulk_create(
+                [Permission(role=role, resource=res, access_mask=rnd.choice(SYNTHETIC_MASKS))
+                 for role in roles for res in resources],
+                batch_size=batch_size,
+                ignore_conflicts=True,
+            )
+            self.stdout.write(self.style.SUCCESS(f'Ресурсов: {len(resources)}, матрица прав {len(roles)}x{len(resources)}'))
+
+        if options['roles'] or options['resources']:
+            # bulk_create не шлёт post_save — матрицу прав в воркерах делаем устаревшей сами
+            bump_rbac_version()
+
+        if options['users']:
+            self.generate_users(options, roles or list(Role.objects.all()), rnd)
 
-    def handle(self, *args, **kwargs):
+        if options['orders']:
+            self.generate_orders(options, rnd)
+
+    def generate_users(self, options, roles, rnd):
+        # Один bcrypt на всех: хешировать миллионы паролей по отдельности незачем
+        password_hash = hash_password(options['password'])
+        total, batch_size = options['users'], options['batch_size']
+        start = User.objects.filter(email__endswith=f'@{SEED_DOMAIN}').count()
+        started = time.perf_counter()
+
+        for offset in range(0, total, batch_size):
+            size = min(batch_size, total - offset)
+            User.objects.bulk_create(
+                [User(first_name='Seed', last_name=str(start + offset + i),
+                      email=f'user{start + offset + i}@{SEED_DOMAIN}',
+                      password_hash=password_hash, role=rnd.choice(roles) if roles else None)
+                 for i in range(size)],
+                ignore_conflicts=True,
+            )
+            self.progress('пользователи', offset + size, total, started)
+
+        self.stdout.write(self.style.SUCCESS(f'Пользователей: {total} (пароль: {options["password"]})'))
+
+    def generate_orders(self, options, rnd):
+        owner_ids = list(User.objects.values_list('id', flat=True))
+        if not owner_ids:
+            self.stdout.write(self.style.WARNING('Нет пользователей — заказы не созданы'))
+            return
+
+        # Zipf: у немногих владельцев много заказов, у большинства — мало.
+        # Порядок перемешан, чтобы "тяжёлые" владельцы не совпадали с первыми id.
+        rnd.shuffle(owner_ids)
+        weights = [1 / (rank ** options['skew']) for rank in range(1, len(owner_ids) + 1)]
+        cum_weights = list(itertools.accumulate(weights))
+
+        # auto_now_add перезаписал бы created_at, а нужен реалистичный разброс дат —
+        # поэтому вставляем напрямую через executemany
+        table = Order._meta.db_table
+        columns = ', '.join(Order._meta.get_field(name).column for name in ('description', 'owner', 'created_at'))
+        sql = f'INSERT INTO {table} ({columns}) VALUES (%s, %s, %s)'
+        now = timezone.now()
+        span = options['days'] * 86400
+
+        total, batch_size = options['orders'], options['batch_size']
+        started = time.perf_counter()
+        touched = set()
+        for offset in range(0, total, batch_size):
+            size = min(batch_size, total - offset)
+            owners = rnd.choices(owner_ids, cum_weights=cum_weights, k=size)
+            touched.update(owners)
+            rows = [
+                (f'Order {offset + i}', owner,
+                 connection.ops.adapt_datetimefield_value(now - datetime.timedelta(seconds=rnd.uniform(0, span))))
+                for i, owner in enumerate(owners)
+            ]
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.executemany(sql, rows)
+            self.progress('заказы', offset + size, total, started)
+
+        # Вставка мимо ORM не шлёт сигналы — версии и счётчики обновляем сами
+        rebuild_order_stats()
+        bump_orders_version(touched)
+        self.stdout.write(self.style.SUCCESS(f'Заказов: {total}'))
+
+    def seed_base(self):
         self.stdout.write("Начинаем посев данных...")
 
         # 1. Создаем Роли
@@ -27,27 +175,24 @@ class Command(BaseCommand):
         Permission.objects.get_or_create(
             role=admin_role,
             resource=orders_resource,
-            defaults={
-                'can_create': True,
-                'can_read_all': True,  # Видит всё
-                'can_update_all': True,  # Правит всё
-                'can_delete_all': True  # Удаляет всё
-            }
+            # Видит, правит и удаляет всё
+            defaults={'access_mask': CREATE | READ_ALL | UPDATE_ALL | DELETE_ALL}
         )
 
         # Обычный юзер: может создавать и видеть/править ТОЛЬКО СВОИ
         Permission.objects.get_or_create(
             role=user_role,
             resource=orders_resource,
-            defaults={
-                'can_create': True,
-                'can_read_own': True,  # <-- Только свои
-                'can_read_all': False,
-                'can_update_own': True,  # <-- Только свои
-                'can_update_all': False,
-                'can_delete_own': False,
-                'can_delete_all': False
-            }
+            # Читает и правит только свои, удалять не может
+            defaults={'access_mask': CREATE | READ_OWN | UPDATE_OWN}
+        )
+        # Массовый импорт пользователей (/api/users/import/) — только админ
+        users_resource, _ = Resource.objects.get_or_create(code='users',
+                                                           defaults={'description': 'Пользователи'})
+        Permission.objects.get_or_create(
+            role=admin_role,
+            resource=users_resource,
+            defaults={'access_mask': CREATE | READ_ALL | UPDATE_ALL | DELETE_ALL}
         )
         self.stdout.write(self.style.SUCCESS('Права доступа настроены'))
 
@@ -66,4 +211,4 @@ class Command(BaseCommand):
         else:
             self.stdout.write(self.style.WARNING(f'Пользователь {admin_email} уже существует'))
 
-        self.stdout.write(self.style.SUCCESS('Готово! База данных наполнена.'))
+        self.stdout.write(self.style.SUCCESS('Базовые данные готовы.'))
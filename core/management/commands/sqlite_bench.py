@@ -0,0 +1,126 @@
+import copy
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connections
+from django.test import override_settings
+from core.models import Order, User
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочное сравнение SQLite: обычный режим (rollback journal, соединение на запрос) '
+        'против production-профиля (SQLITE_PRODUCTION_DATABASE + PRAGMA из core.sqlite) на смеси чтений '
+        'и записей заказов. Каждый профиль — отдельная временная БД, подключённая через Django и '
+        'собранная миграциями.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--duration', type=float, default=5, help='Секунд на каждый профиль')
+        parser.add_argument('--write-ratio', type=float, default=0.2, help='Доля записей в смеси')
+        parser.add_argument('--rows', type=int, default=20000, help='Заказов в таблице перед замером')
+        parser.add_argument('--owners', type=int, default=100)
+
+    def add_database(self, alias, path, extra):
+        connections.settings[alias] = connections.configure_settings({
+            'default': connections.settings['default'],
+            alias: {'ENGINE': 'django.db.backends.sqlite3', 'NAME': path, **copy.deepcopy(extra)},
+        })[alias]
+
+    def remove_database(self, alias):
+        connections[alias].close()
+        del connections[alias]
+        del connections.settings[alias]
+
+    def prepare(self, alias, rows, owners):
+        call_command('migrate', database=alias, interactive=False, verbosity=0)
+        users = User.objects.using(alias).bulk_create([
+            User(first_name='Bench', email=f'owner-{i}@bench.local', password_hash='!') for i in range(owners)
+        ])
+        Order.objects.using(alias).bulk_create(
+            [Order(description=f'Order {i}', owner=users[i % owners]) for i in range(rows)],
+            batch_size=1000,
+        )
+        return [user.pk for user in users]
+
+    def run_profile(self, alias, owner_ids, options, persistent):
+        stop_at = time.perf_counter() + options['duration']
+        latencies, errors = [], [0]
+        lock = threading.Lock()
+        orders = Order.objects.using(alias)
+
+        def worker(seed):
+            rnd = random.Random(seed)
+            local = []
+            failed = 0
+            try:
+                while time.perf_counter() < stop_at:
+                    started = time.perf_counter()
+                    try:
+                        if rnd.random() < options['write_ratio']:
+                            # bulk_create — та же транзакция (transaction_mode профиля), но без сигналов
+                            # и сброса кэшей: меряем только БД
+                            orders.bulk_create([Order(description='bench', owner_id=rnd.choice(owner_ids))])
+                        else:
+                            list(orders.filter(owner_id=rnd.choice(owner_ids)).order_by('-created_at', '-id')[:50])
+                        local.append(time.perf_counter() - started)
+                    except OperationalError:
+                        failed += 1
+                    finally:
+                        if not persistent:
+                            connections[alias].close()
+            finally:
+                # Соединения Django — на поток: закрывает тот, кто открыл
+                connections[alias].close()
+            with lock:
+                latencies.extend(local)
+                errors[0] += failed
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(options['threads'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        ops = len(latencies)
+        return {
+            'ops_per_sec': ops / options['duration'],
+            'p50_ms': statistics.median(latencies) * 1000 if latencies else 0,
+            'p95_ms': statistics.quantiles(latencies, n=20)[-1] * 1000 if len(latencies) > 1 else 0,
+            'errors': errors[0],
+        }
+
+    def handle(self, *args, **options):
+        # production-профиль — те же настройки соединения, что при SQLITE_PRODUCTION=1,
+        # а PRAGMA ставит обработчик connection_created
+        profiles = (
+            ('default', {}, False),
+            ('production', settings.SQLITE_PRODUCTION_DATABASE, True),
+        )
+        results = {}
+        with tempfile.TemporaryDirectory() as tmp:
+            for name, extra, production in profiles:
+                alias = f'sqlite_bench_{name}'
+                self.add_database(alias, os.path.join(tmp, f'{name}.sqlite3'), extra)
+                try:
+                    with override_settings(SQLITE_PRODUCTION=production):
+                        owner_ids = self.prepare(alias, options['rows'], options['owners'])
+                        connections[alias].close()
+                        results[name] = stats = self.run_profile(alias, owner_ids, options, production)
+                finally:
+                    self.remove_database(alias)
+                self.stdout.write(
+                    f"{name:>10}: {stats['ops_per_sec']:8.0f} ops/s  p50 {stats['p50_ms']:6.2f} мс  "
+                    f"p95 {stats['p95_ms']:6.2f} мс  ошибок блокировки: {stats['errors']}"
+                )
+
+        baseline = results['default']['ops_per_sec'] or 1
+        gain = results['production']['ops_per_sec'] / baseline
+        self.stdout.write(self.style.SUCCESS(f"Прирост пропускной способности: x{gain:.2f}"))
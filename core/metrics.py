@@ -0,0 +1,263 @@
+import bisect
+import contextvars
+import hmac
+import random
+import threading
+import time
+from contextlib import contextmanager
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+# Границы корзин гистограмм (секунды и штуки)
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500, 1000, 5000)
+
+# Замеры текущего запроса (None — запрос не инструментируется)
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """
+    Агрегаты по (route, method) в памяти процесса.
+    Каждый воркер отдаёт свои значения, суммирует их уже Prometheus.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.requests = {}    # (route, method, status) -> count
+        self.histograms = {}  # (name, labels) -> Histogram
+
+    def _observe(self, name, labels, value, buckets):
+        key = (name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram(buckets)
+        histogram.observe(value)
+
+    def record(self, route, method, status, recorder):
+        labels = (('route', route), ('method', method))
+        with self._lock:
+            key = (route, method, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self._observe('http_request_duration_seconds', labels, recorder.total, DURATION_BUCKETS)
+            self._observe('http_request_db_queries', labels, recorder.queries, COUNT_BUCKETS)
+            self._observe('http_request_db_rows', labels, recorder.rows, COUNT_BUCKETS)
+            self._observe('http_request_db_seconds', labels, recorder.db_time, DURATION_BUCKETS)
+            for phase_name, seconds in recorder.phases.items():
+                self._observe('http_request_phase_seconds', labels + (('phase', phase_name),), seconds, DURATION_BUCKETS)
+
+    def render(self):
+        """
+        Текстовый формат экспозиции Prometheus.
+        """
+        with self._lock:
+            requests = sorted(self.requests.items())
+            histograms = sorted(
+                (name, labels, list(h.counts), h.sum, h.count, h.buckets)
+                for (name, labels), h in self.histograms.items()
+            )
+
+        lines = ['# TYPE http_requests_total counter']
+        for (route, method, status), count in requests:
+            lines.append(f'http_requests_total{{route="{route}",method="{method}",status="{status}"}} {count}')
+
+        current = None
+        for name, labels, counts, total, count, buckets in histograms:
+            if name != current:
+                lines.append(f'# TYPE {name} histogram')
+                current = name
+            label_str = ','.join(f'{key}="{value}"' for key, value in labels)
+            cumulative = 0
+            for bound, bucket_count in zip(buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{{{label_str},le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_sum{{{label_str}}} {total}')
+            lines.append(f'{name}_count{{{label_str}}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+class RequestRecorder:
+    """
+    Замеры одного запроса. Счётчики запросов к БД ведутся всегда,
+    разбивка по фазам — только для запросов, попавших в выборку (sampled).
+    """
+
+    def __init__(self, sampled):
+        self.sampled = sampled
+        self.started = time.perf_counter()
+        self.total = 0.0
+        self.queries = 0
+        self.rows = 0
+        self.db_time = 0.0
+        self.phases = {}
+        # Время вложенных фаз вычитается из внешней, фазы не пересекаются
+        self._stack = []
+
+    def __call__(self, execute, sql, params, many, context):
+        # execute_wrapper: время и число запросов, затронутые строки для записей
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+            rowcount = getattr(context['cursor'], 'rowcount', -1)
+            if rowcount and rowcount > 0:
+                self.rows += rowcount
+
+    def finish(self):
+        self.total = time.perf_counter() - self.started
+
+    def server_timing(self):
+        parts = [f'total;dur={self.total * 1000:.1f}', f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries"']
+        parts.extend(f'{name};dur={seconds * 1000:.1f}' for name, seconds in self.phases.items())
+        return ', '.join(parts)
+
+
+@contextmanager
+def phase(name):
+    """
+    Замер фазы запроса (jwt, user, rbac, serialize).
+    Вне выборки — только чтение contextvar, без вызовов часов.
+    """
+    recorder = _current.get()
+    if recorder is None or not recorder.sampled:
+        yield
+        return
+    recorder._stack.append(0.0)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        nested = recorder._stack.pop()
+        if recorder._stack:
+            recorder._stack[-1] += elapsed
+        recorder.phases[name] = recorder.phases.get(name, 0.0) + elapsed - nested
+
+
+def count_query(execute, sql, params, many, context):
+    """
+    Постоянный execute_wrapper соединения: передаёт запрос замерам текущего запроса.
+    Замеры ищутся через contextvar, поэтому считаются и запросы из sync-потоков под ASGI.
+    """
+    recorder = _current.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+def install_query_counter(sender, connection, **kwargs):
+    """
+    Обработчик connection_created: счётчик ставится на каждое соединение один раз.
+    """
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_query)
+
+
+def record_rows(count):
+    """
+    Строки, прочитанные view (для SELECT драйвер rowcount не сообщает).
+    """
+    recorder = _current.get()
+    if recorder is not None:
+        recorder.rows += count
+
+
+def route_of(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.view_name or match.route
+
+
+class MetricsMiddleware:
+    """
+    Инструментирует каждый запрос: общее время, число запросов к БД и строк,
+    для доли METRICS_SAMPLE_RATE запросов — время по фазам.
+    Отдаёт заголовок Server-Timing и копит гистограммы для /api/metrics/.
+    Должна стоять первой, чтобы в замер попали остальные middleware.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not getattr(settings, 'METRICS_ENABLED', True):
+            return self.get_response(request)
+
+        recorder = self.start()
+        token = _current.set(recorder)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, recorder)
+
+    async def __acall__(self, request):
+        if not getattr(settings, 'METRICS_ENABLED', True):
+            return await self.get_response(request)
+
+        # Запросы к БД идут в sync-потоках со своими соединениями, но contextvar
+        # с замерами переходит туда через sync_to_async — count_query их видит
+        recorder = self.start()
+        token = _current.set(recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, recorder)
+
+    def start(self):
+        rate = getattr(settings, 'METRICS_SAMPLE_RATE', 0.1)
+        return RequestRecorder(sampled=rate >= 1 or random.random() < rate)
+
+    def finish(self, request, response, recorder):
+        recorder.finish()
+        if getattr(settings, 'METRICS_SERVER_TIMING', True):
+            response['Server-Timing'] = recorder.server_timing()
+        registry.record(route_of(request), request.method, response.status_code, recorder)
+        return response
+
+
+def metrics_allowed(request):
+    """
+    Доступ к /api/metrics/: при заданном METRICS_TOKEN — по заголовку Authorization: Bearer <token>,
+    иначе только с адресов METRICS_ALLOWED_IPS (по умолчанию пуст — доступ закрыт).
+    """
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token:
+        return hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')
+    return request.META.get('REMOTE_ADDR') in getattr(settings, 'METRICS_ALLOWED_IPS', ())
+
+
+def metrics_view(request):
+    if not metrics_allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
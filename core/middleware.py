@@ -1,14 +1,100 @@
+import time
 import jwt
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
 from django.conf import settings
-from django.http import JsonResponse
-from .models import User
+from django.db import router
+from django.utils.functional import SimpleLazyObject
+from .auth_cache import principal_cache, token_digest
+from .metrics import phase
+from .models import User, Role
+from .rbac import RBAC_VERSION_KEY
+from .revocation import revocation_list
+from .versions import get_version, get_versions, user_version_key
+
+
+def load_snapshot(user_id):
+    """
+    Лёгкий снимок пользователя: только то, что нужно для аутентификации и RBAC.
+    Версия пользователя читается до строки: изменение между ними просто даст лишнюю перезагрузку.
+    """
+    version = get_version(user_version_key(user_id))
+    # Снимок читаем с основной БД: реплика может ещё не знать о деактивации
+    row = (
+        User.objects
+        .using(router.db_for_write(User))
+        .filter(id=user_id)
+        .values('id', 'email', 'is_active', 'role_id', 'role__name')
+        .first()
+    )
+    if row is None:
+        return None
+    return {
+        'id': row['id'],
+        'email': row['email'],
+        'is_active': row['is_active'],
+        'role_id': row['role_id'],
+        'role_name': row['role__name'],
+        'version': version,
+    }
+
+
+def user_from_snapshot(snapshot):
+    """
+    Собирает User из снимка без запроса в БД.
+    Остальные поля отложены (deferred) и догрузятся, только если view к ним обратится.
+    """
+    db = router.db_for_read(User)
+    # from_db раскладывает значения по порядку полей модели — порядок здесь должен совпадать с ним
+    user = User.from_db(
+        db,
+        ['id', 'email', 'role_id', 'is_active'],
+        [snapshot['id'], snapshot['email'], snapshot['role_id'], snapshot['is_active']],
+    )
+    if snapshot['role_id'] is not None:
+        role = Role.from_db(db, ['id', 'name'], [snapshot['role_id'], snapshot['role_name']])
+        User.role.field.set_cached_value(user, role)
+    user.is_authenticated = True
+    return user
+
+
+def user_from_claims(payload):
+    """
+    Пользователь из stateless-токена: снимок и маски прав берутся прямо из claims.
+    Активность не хранится: токен с актуальной версией пользователя ('uv') выдан активному
+    и с тех пор пользователь не менялся.
+    """
+    user = user_from_snapshot({
+        'id': payload['user_id'],
+        'email': payload['email'],
+        'is_active': True,
+        'role_id': payload['role_id'],
+        'role_name': payload['role'],
+    })
+    user.token_permissions = payload['perms']
+    return user
 
 
 class JWTAuthenticationMiddleware:
+    # Сама middleware в БД не ходит, поэтому под ASGI работает без перехода в sync-поток
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
 
     def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        self.process_request(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        self.process_request(request)
+        return await self.get_response(request)
+
+    def process_request(self, request):
         auth_header = request.headers.get('Authorization')
 
         # Сброс пользователя (на всякий случай)
@@ -17,20 +103,57 @@ class JWTAuthenticationMiddleware:
 
         if auth_header and auth_header.startswith('Bearer '):
             token = auth_header.split(' ')[1]
-            try:
-                payload = jwt.decode(token, settings.SECRET_KEY, algorithms=['HS256'])
-                user = User.objects.get(id=payload['user_id'])
+            # Аутентификация ленивая: пользователь (и БД) понадобятся только если view к нему обратится
+            request.user = SimpleLazyObject(lambda: self.authenticate(token))
+            request.is_authenticated = SimpleLazyObject(lambda: bool(request.user))
 
-                if user.is_active:
-                    request.user = user
-                    request.is_authenticated = True
-                    # Фикс для совместимости с некоторыми частями Django/DRF
-                    request.user.is_authenticated = True
+    def authenticate(self, token):
+        digest = token_digest(token)
+        entry = principal_cache.get(digest)
 
-            except (jwt.ExpiredSignatureError, jwt.DecodeError, User.DoesNotExist):
+        if entry is None:
+            try:
+                with phase('jwt'):
+                    payload = jwt.decode(token, settings.SECRET_KEY, algorithms=['HS256'])
+            except (jwt.ExpiredSignatureError, jwt.DecodeError):
                 # Если токен невалиден, мы можем либо вернуть 401 сразу,
                 # либо позволить запросу пройти как "Аноним" (зависит от логики).
                 # Здесь оставим проход дальше, права проверит Permission класс.
-                pass
+                return None
+            # Снимок пользователя догрузим ниже, только если он понадобится
+            entry = (payload, None)
+            # Запись не должна пережить сам токен
+            principal_cache.set(digest, entry, ttl=payload['exp'] - time.time())
+
+        payload, snapshot = entry
+        if payload['exp'] <= time.time() or payload.get('type') == 'refresh':
+            return None
+        # Отзыв (logout): в обычном случае решается Bloom-фильтром в памяти, без БД
+        with phase('revocation'):
+            if revocation_list.is_token_revoked(payload):
+                return None
+
+        # Stateless-токен с актуальными версиями прав и пользователя — БД не нужна вовсе
+        # (без общего кэша версии перечитываются из БД раз в VERSIONS_LOCAL_TTL, одним запросом).
+        # Если права, роль или активность успели поменяться, идём обычным путём через снимок и матрицу.
+        # Без JWT_STATELESS_AUTH claims с правами не принимаются.
+        if settings.JWT_STATELESS_AUTH and 'perms' in payload:
+            user_key = user_version_key(payload['user_id'])
+            versions = get_versions([RBAC_VERSION_KEY, user_key])
+            if payload.get('pv') == versions[RBAC_VERSION_KEY] and payload.get('uv') == versions[user_key]:
+                return user_from_claims(payload)
+
+        if snapshot is not None and snapshot['version'] != get_version(user_version_key(snapshot['id'])):
+            # Пользователя изменили (возможно, в другом воркере) — снимок устарел
+            snapshot = None
+
+        if snapshot is None:
+            with phase('user'):
+                snapshot = load_snapshot(payload['user_id'])
+            if snapshot is None:
+                return None
+            principal_cache.set(digest, (payload, snapshot), ttl=payload['exp'] - time.time())
 
-        return self.get_response(request)
\ No newline at end of file
+        if not snapshot['is_active']:
+            return None
+        return user_from_snapshot(snapshot)
@@ -0,0 +1,45 @@
+from django.db import migrations, models
+
+# Порядок бит совпадает с константами в core/models.py
+FLAGS = (
+    ('can_create', 1),
+    ('can_read_own', 2),
+    ('can_read_all', 4),
+    ('can_update_own', 8),
+    ('can_update_all', 16),
+    ('can_delete_own', 32),
+    ('can_delete_all', 64),
+)
+
+
+def booleans_to_mask(apps, schema_editor):
+    Permission = apps.get_model('core', 'Permission')
+    for perm in Permission.objects.using(schema_editor.connection.alias):
+        perm.access_mask = sum(bit for field, bit in FLAGS if getattr(perm, field))
+        perm.save(update_fields=['access_mask'])
+
+
+def mask_to_booleans(apps, schema_editor):
+    Permission = apps.get_model('core', 'Permission')
+    for perm in Permission.objects.using(schema_editor.connection.alias):
+        for field, bit in FLAGS:
+            setattr(perm, field, bool(perm.access_mask & bit))
+        perm.save(update_fields=[field for field, _ in FLAGS])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_order'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='permission',
+            name='access_mask',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.RunPython(booleans_to_mask, mask_to_booleans),
+    ] + [
+        migrations.RemoveField(model_name='permission', name=field) for field, _ in FLAGS
+    ]
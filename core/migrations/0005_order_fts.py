@@ -0,0 +1,58 @@
+from django.db import migrations
+
+# Внешний content: FTS-таблица хранит только индекс, текст читается из core_order.
+# unicode61 приводит кириллицу к нижнему регистру и убирает диакритику.
+FORWARD_SQL = (
+    """
+    CREATE VIRTUAL TABLE core_order_fts USING fts5(
+        description, content='core_order', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER core_order_fts_ai AFTER INSERT ON core_order BEGIN
+        INSERT INTO core_order_fts(rowid, description) VALUES (new.id, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER core_order_fts_ad AFTER DELETE ON core_order BEGIN
+        INSERT INTO core_order_fts(core_order_fts, rowid, description) VALUES ('delete', old.id, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER core_order_fts_au AFTER UPDATE OF description ON core_order BEGIN
+        INSERT INTO core_order_fts(core_order_fts, rowid, description) VALUES ('delete', old.id, old.description);
+        INSERT INTO core_order_fts(rowid, description) VALUES (new.id, new.description);
+    END
+    """,
+    # Индекс для уже существующих заказов
+    "INSERT INTO core_order_fts(core_order_fts) VALUES ('rebuild')",
+)
+
+REVERSE_SQL = (
+    'DROP TRIGGER IF EXISTS core_order_fts_au',
+    'DROP TRIGGER IF EXISTS core_order_fts_ad',
+    'DROP TRIGGER IF EXISTS core_order_fts_ai',
+    'DROP TABLE IF EXISTS core_order_fts',
+)
+
+
+def run_on_sqlite(statements):
+    # На других СУБД поиск работает без FTS5 (см. core/search.py)
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for sql in statements:
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_order_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_on_sqlite(FORWARD_SQL), run_on_sqlite(REVERSE_SQL)),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.2.9 on 2026-10-18 15:42
+
+from collections import Counter
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+
+
+def build_stats(apps, schema_editor):
+    # Счётчики для уже существующих заказов (то же, что rebuild_order_stats)
+    Order = apps.get_model('core', 'Order')
+    OrderOwnerStat = apps.get_model('core', 'OrderOwnerStat')
+    OrderDailyStat = apps.get_model('core', 'OrderDailyStat')
+    db_alias = schema_editor.connection.alias
+
+    owner_rows = Order.objects.using(db_alias).values('owner_id').annotate(total=Count('id')).order_by()
+    owner_stats = [OrderOwnerStat(owner_id=row['owner_id'], total=row['total']) for row in owner_rows]
+    OrderOwnerStat.objects.using(db_alias).bulk_create(
+        owner_stats + [OrderOwnerStat(owner_id=0, total=sum(stat.total for stat in owner_stats))],
+        batch_size=1000,
+    )
+
+    all_by_day = Counter()
+    daily_stats = []
+    day_rows = (
+        Order.objects.using(db_alias).annotate(day=TruncDate('created_at'))
+        .values('owner_id', 'day').annotate(total=Count('id')).order_by()
+    )
+    for row in day_rows:
+        all_by_day[row['day']] += row['total']
+        daily_stats.append(OrderDailyStat(owner_id=row['owner_id'], day=row['day'], total=row['total']))
+    daily_stats.extend(OrderDailyStat(owner_id=0, day=day, total=count) for day, count in all_by_day.items())
+    OrderDailyStat.objects.using(db_alias).bulk_create(daily_stats, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_order_fts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderDailyStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('owner_id', models.PositiveIntegerField()),
+                ('day', models.DateField()),
+                ('total', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('owner_id', 'day'), name='order_daily_stat_owner_day_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='OrderOwnerStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('owner_id', models.PositiveIntegerField(unique=True)),
+                ('total', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-total', 'owner_id'], name='order_owner_stat_total_idx')],
+            },
+        ),
+        migrations.RunPython(build_stats, migrations.RunPython.noop),
+    ]
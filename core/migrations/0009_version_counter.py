@@ -0,0 +1,21 @@
+# Generated by Django 5.2.9 on 2026-10-18 16:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VersionCounter',
+            fields=[
+                ('key', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('value', models.BigIntegerField(default=0)),
+                ('modified_at', models.DateTimeField(null=True)),
+            ],
+        ),
+    ]
@@ -1,4 +1,6 @@
-from django.db import models
+from django.conf import settings
+from django.db import models, router, transaction
+from django.db.models import F
 import bcrypt
 
 
@@ -20,6 +22,33 @@ class Resource(models.Model):
         return self.code
 
 
+def hash_password(raw_password):
+    """
+    bcrypt-хеш пароля. Отдельной функцией, чтобы его можно было считать в пуле потоков.
+    Стоимость задаётся BCRYPT_ROUNDS (подбирается командой calibrate_bcrypt).
+    """
+    salt = bcrypt.gensalt(rounds=settings.BCRYPT_ROUNDS)
+    return bcrypt.hashpw(raw_password.encode('utf-8'), salt).decode('utf-8')
+
+
+def password_cost(password_hash):
+    # Формат bcrypt: $2b$<cost>$<salt+hash>
+    return int(password_hash.split('$')[2])
+
+
+def verify_password(raw_password, password_hash):
+    """
+    Проверяет пароль. Возвращает (совпал ли, новый хеш или None).
+    Новый хеш считается, только если пароль верный, а стоимость старого
+    отличается от текущей BCRYPT_ROUNDS.
+    """
+    if not bcrypt.checkpw(raw_password.encode('utf-8'), password_hash.encode('utf-8')):
+        return False, None
+    if password_cost(password_hash) != settings.BCRYPT_ROUNDS:
+        return True, hash_password(raw_password)
+    return True, None
+
+
 # 3. Наш кастомный Пользователь
 class User(models.Model):
     first_name = models.CharField(max_length=100)
@@ -33,45 +62,194 @@ class User(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
 
     def set_password(self, raw_password):
-        salt = bcrypt.gensalt()
-        hashed = bcrypt.hashpw(raw_password.encode('utf-8'), salt)
-        self.password_hash = hashed.decode('utf-8')
+        self.password_hash = hash_password(raw_password)
 
     def check_password(self, raw_password):
-        return bcrypt.checkpw(
-            raw_password.encode('utf-8'),
-            self.password_hash.encode('utf-8')
-        )
+        is_valid, new_hash = verify_password(raw_password, self.password_hash)
+        if new_hash and self.pk:
+            # Прозрачно переводим хеш на текущую стоимость bcrypt
+            self.password_hash = new_hash
+            self.save(update_fields=['password_hash'])
+        return is_valid
 
     def __str__(self):
         return self.email
 
 
 # 4. Таблица прав доступа
+# Права хранятся одной битовой маской: сотни ресурсов и десятки ролей
+# проверяются побитовыми операциями без разбора семи колонок.
+CREATE = 1
+READ_OWN = 2
+READ_ALL = 4
+UPDATE_OWN = 8
+UPDATE_ALL = 16
+DELETE_OWN = 32
+DELETE_ALL = 64
+
+
+def _mask_flag(bit):
+    """
+    Булево свойство поверх бита маски — совместимость со старым API (can_create и т.д.).
+    """
+
+    def getter(self):
+        return bool(self.access_mask & bit)
+
+    def setter(self, value):
+        if value:
+            self.access_mask |= bit
+        else:
+            self.access_mask &= ~bit
+
+    return property(getter, setter)
+
+
+# Булевы флаги старого API -> бит маски
+FLAG_BITS = {
+    'can_create': CREATE,
+    'can_read_own': READ_OWN,
+    'can_read_all': READ_ALL,
+    'can_update_own': UPDATE_OWN,
+    'can_update_all': UPDATE_ALL,
+    'can_delete_own': DELETE_OWN,
+    'can_delete_all': DELETE_ALL,
+}
+
+
+class PermissionQuerySet(models.QuerySet):
+    def masks_for_role(self, role):
+        """
+        Вся карта прав роли {resource_code: маска} одним запросом.
+        """
+        return dict(self.filter(role=role).values_list('resource__code', 'access_mask'))
+
+    def with_flags(self, **flags):
+        """
+        Отбор по булевым флагам старого API: with_flags(can_read_all=True, can_delete_own=False)
+        проверяет соответствующие биты access_mask.
+        """
+        checked = sum(FLAG_BITS[name] for name in flags)
+        required = sum(FLAG_BITS[name] for name, value in flags.items() if value)
+        return self.alias(flag_bits=F('access_mask').bitand(checked)).filter(flag_bits=required)
+
+
 class Permission(models.Model):
     role = models.ForeignKey(Role, on_delete=models.CASCADE, related_name='permissions')
     resource = models.ForeignKey(Resource, on_delete=models.CASCADE, related_name='permissions')
 
-    can_create = models.BooleanField(default=False)
+    access_mask = models.PositiveSmallIntegerField(default=0)
+
+    objects = PermissionQuerySet.as_manager()
 
-    can_read_own = models.BooleanField(default=False)
-    can_read_all = models.BooleanField(default=False)
+    # Совместимость со старым булевым API — только на уровне экземпляра: чтение и присваивание
+    # can_*, а также kwargs конструктора и objects.create(). В запросах флагов нет:
+    # filter()/exclude() — через objects.with_flags(), update()/values()/order_by() — через access_mask.
+    can_create = _mask_flag(CREATE)
 
-    can_update_own = models.BooleanField(default=False)
-    can_update_all = models.BooleanField(default=False)
+    can_read_own = _mask_flag(READ_OWN)
+    can_read_all = _mask_flag(READ_ALL)
 
-    can_delete_own = models.BooleanField(default=False)
-    can_delete_all = models.BooleanField(default=False)
+    can_update_own = _mask_flag(UPDATE_OWN)
+    can_update_all = _mask_flag(UPDATE_ALL)
+
+    can_delete_own = _mask_flag(DELETE_OWN)
+    can_delete_all = _mask_flag(DELETE_ALL)
 
     class Meta:
         unique_together = ('role', 'resource')
 
 
+# 4.1 Отозванные токены (logout). Проверка идёт через Bloom-фильтр в памяти (core/revocation.py),
+# в таблицу ходим только за подтверждением возможного совпадения.
+# user_id не внешний ключ: отзыв должен действовать до истечения токена, даже если пользователя удалили.
+class RevokedToken(models.Model):
+    jti = models.CharField(max_length=64, unique=True)
+    user_id = models.PositiveIntegerField()
+    expires_at = models.DateTimeField(db_index=True)
+    revoked_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"Revoked {self.jti} (user {self.user_id})"
+
+
 # 5. Тестовая сущность "Заказ" (ВОТ ЕЁ НЕ ХВАТАЛО)
 class Order(models.Model):
     description = models.CharField(max_length=255)
     owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='orders')
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        # Под keyset-пагинацию по (created_at, id): для scope OWN и ALL
+        indexes = [
+            models.Index(fields=['owner', 'created_at', 'id'], name='order_owner_created_idx'),
+            models.Index(fields=['created_at', 'id'], name='order_created_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        # Счётчики статистики обновляются сигналом post_save — в той же транзакции, что и заказ.
+        # Удаление (Collector) и так атомарно.
+        with transaction.atomic(using=kwargs.get('using') or router.db_for_write(Order, instance=self)):
+            super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"Order {self.id} by {self.owner.email}"
+
+
+# 6. Сводные счётчики заказов (core/stats.py). owner_id = 0 — строка по всем владельцам.
+# owner_id не внешний ключ: строки переживают удаление пользователя до пересборки,
+# а уменьшение счётчика по отсутствующей строке просто ничего не делает.
+ALL_OWNERS = 0
+
+
+class OrderOwnerStat(models.Model):
+    owner_id = models.PositiveIntegerField(unique=True)
+    total = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # Топ владельцев по числу заказов без сортировки всей таблицы
+            models.Index(fields=['-total', 'owner_id'], name='order_owner_stat_total_idx'),
+        ]
+
+
+class OrderDailyStat(models.Model):
+    owner_id = models.PositiveIntegerField()
+    day = models.DateField()
+    total = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['owner_id', 'day'], name='order_daily_stat_owner_day_uniq'),
+        ]
+
+
+# 7. Ключи идемпотентности POST /api/orders/ (core/idempotency.py).
+# status_code = NULL — первый запрос ещё выполняется, повторы ждут его ответ.
+class IdempotencyKey(models.Model):
+    user_id = models.PositiveIntegerField()
+    key = models.CharField(max_length=255)
+    request_hash = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True)
+    response = models.JSONField(null=True)
+    created_at = models.DateTimeField()
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user_id', 'key'], name='idempotency_key_user_key_uniq'),
+        ]
+
+    def __str__(self):
+        return f"Idempotency key {self.key} (user {self.user_id})"
+
+
+# 8. Счётчики версий (core/versions.py) без общего кэша: значение переживает истечение ключа
+# в LocMemCache, поэтому версия (и ETag) меняется только при изменении данных.
+class VersionCounter(models.Model):
+    key = models.CharField(max_length=255, primary_key=True)
+    value = models.BigIntegerField(default=0)
+    modified_at = models.DateTimeField(null=True)
+
     def __str__(self):
-        return f"Order {self.id} by {self.owner.email}"
\ No newline at end of file
+        return f"{self.key} = {self.value}"
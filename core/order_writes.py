@@ -0,0 +1,149 @@
+import datetime
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .models import Order, User
+
+# Условные UPDATE/DELETE одной командой: проверка scope (owner_id) стоит в WHERE,
+# а нужные для ответа поля возвращает RETURNING — без предварительного SELECT заказа и владельца.
+# Строка из RETURNING — это весь заказ, поэтому post_save/post_delete отправляются как у Order.save/delete:
+# версии и счётчики обновляют те же обработчики в core/signals.py. pre_save/pre_delete не отправляются —
+# до команды заказ не читается.
+# Одна команда — это запись самого заказа. Обработчики добавляют свои: подъём версий заказов
+# (без общего кэша — UPDATE и SELECT в VersionCounter, и ещё раз после коммита), а удаление —
+# два UPDATE счётчиков статистики.
+# UPDATE/DELETE ... RETURNING есть в PostgreSQL и SQLite 3.35+. На остальных backend'ах
+# (MySQL, MariaDB, старый SQLite) заказ читается и пишется через ORM — на одну команду больше.
+
+
+def _supports_returning(connection):
+    if connection.vendor == 'postgresql':
+        return True
+    # В SQLite RETURNING появился для INSERT, UPDATE и DELETE одновременно (3.35)
+    return connection.vendor == 'sqlite' and connection.features.can_return_columns_from_insert
+
+
+def _returning_columns(table):
+    owner_column = Order._meta.get_field('owner').column
+    return (
+        f'{table}.id, {table}.description, {table}.created_at, {table}.{owner_column}, '
+        f'(SELECT email FROM {User._meta.db_table} WHERE id = {table}.{owner_column})'
+    )
+
+
+def _as_datetime(value):
+    # SQLite отдаёт дату строкой; драйверы других СУБД — уже datetime
+    if isinstance(value, str):
+        value = parse_datetime(value)
+    if settings.USE_TZ and timezone.is_naive(value):
+        value = timezone.make_aware(value, datetime.timezone.utc)
+    return value
+
+
+def _row_to_dict(row):
+    pk, description, created_at, owner_id, owner_email = row
+    return {
+        'id': pk,
+        'description': description,
+        'created_at': _as_datetime(created_at),
+        'owner_id': owner_id,
+        'owner_email': owner_email,
+    }
+
+
+def _as_instance(row, using):
+    names = ['id', 'description', 'owner_id', 'created_at']
+    return Order.from_db(using, names, [row[name] for name in names])
+
+
+def _scoped(using, pk, owner_id):
+    orders = Order.objects.using(using).filter(pk=pk).select_related('owner')
+    if owner_id is not None:
+        orders = orders.filter(owner_id=owner_id)
+    return orders
+
+
+def _instance_to_dict(order):
+    return {
+        'id': order.id,
+        'description': order.description,
+        'created_at': order.created_at,
+        'owner_id': order.owner_id,
+        'owner_email': order.owner.email,
+    }
+
+
+def _where(pk, owner_id):
+    owner_column = Order._meta.get_field('owner').column
+    sql, params = 'id = %s', [pk]
+    if owner_id is not None:
+        sql += f' AND {owner_column} = %s'
+        params.append(owner_id)
+    return sql, params
+
+
+def update_order(pk, values, owner_id=None):
+    """
+    UPDATE ... WHERE id = ? [AND owner_id = ?] RETURNING ... — одна команда, затем post_save.
+    Возвращает строку заказа (как из .values() со owner_email) или None, если заказа нет в scope.
+    """
+    using = router.db_for_write(Order)
+    connection = connections[using]
+    table = Order._meta.db_table
+    if not _supports_returning(connection):
+        with transaction.atomic(using=using):
+            order = _scoped(using, pk, owner_id).select_for_update().first()
+            if order is None:
+                return None
+            for name, value in values.items():
+                setattr(order, name, value)
+            order.save(using=using, update_fields=list(values))
+        return _instance_to_dict(order)
+
+    assignments, params = [], []
+    for name, value in values.items():
+        field = Order._meta.get_field(name)
+        assignments.append(f'{field.column} = %s')
+        params.append(field.get_db_prep_save(value, connection))
+    where, where_params = _where(pk, owner_id)
+
+    sql = f'UPDATE {table} SET {", ".join(assignments)} WHERE {where} RETURNING {_returning_columns(table)}'
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        cursor.execute(sql, params + where_params)
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        row = _row_to_dict(row)
+        post_save.send(sender=Order, instance=_as_instance(row, using), created=False,
+                       update_fields=frozenset(values), raw=False, using=using)
+    return row
+
+
+def delete_order(pk, owner_id=None):
+    """
+    DELETE ... WHERE id = ? [AND owner_id = ?] RETURNING ... — одна команда, затем post_delete.
+    Возвращает удалённую строку или None, если заказа нет в scope.
+    """
+    using = router.db_for_write(Order)
+    table = Order._meta.db_table
+    if not _supports_returning(connections[using]):
+        with transaction.atomic(using=using):
+            order = _scoped(using, pk, owner_id).select_for_update().first()
+            if order is None:
+                return None
+            row = _instance_to_dict(order)
+            order.delete(using=using)
+        return row
+    where, params = _where(pk, owner_id)
+
+    with transaction.atomic(using=using), connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {table} WHERE {where} RETURNING {_returning_columns(table)}', params)
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        row = _row_to_dict(row)
+        instance = _as_instance(row, using)
+        post_delete.send(sender=Order, instance=instance, using=using, origin=instance)
+    return row
@@ -0,0 +1,132 @@
+import base64
+import datetime
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Курсорная (keyset) пагинация по (created_at, id), от новых к старым.
+    Следующая страница ищется по индексу от последней позиции — без OFFSET,
+    поэтому стоимость страницы не зависит от её номера.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self):
+        self.default_page_size = getattr(settings, 'ORDERS_PAGE_SIZE', 50)
+        self.max_page_size = getattr(settings, 'ORDERS_MAX_PAGE_SIZE', 1000)
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.default_page_size
+        if size <= 0:
+            return self.default_page_size
+        return min(size, self.max_page_size)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            raw = base64.urlsafe_b64decode(encoded.encode('ascii')).decode('ascii')
+            created_at, pk = raw.split('|')
+            return datetime.datetime.fromisoformat(created_at), int(pk)
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, position):
+        created_at, pk = position
+        raw = f'{created_at.isoformat()}|{pk}'
+        return base64.urlsafe_b64encode(raw.encode('ascii')).decode('ascii')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+
+        position = self.decode_cursor(request)
+        if position is not None:
+            created_at, pk = position
+            # created_at <= X задаёт диапазон по индексу, остальное — уточнение внутри него
+            queryset = queryset.filter(
+                Q(created_at__lte=created_at),
+                Q(created_at__lt=created_at) | Q(id__lt=pk),
+            )
+
+        rows = list(queryset.order_by('-created_at', '-id')[:self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        self.next_position = self.get_position(rows[-1]) if self.has_next else None
+        return rows
+
+    def get_position(self, row):
+        # Строки бывают и моделями, и словарями из .values()
+        if isinstance(row, dict):
+            return row['created_at'], row['id']
+        return row.created_at, row.id
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class SearchPagination(KeysetPagination):
+    """
+    Keyset-пагинация выдачи поиска по (rank, id): порядок задаёт релевантность, а не дата.
+    Вместо queryset принимает объект с методом fetch(after, limit) (см. core/search.py).
+    """
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            raw = base64.urlsafe_b64decode(encoded.encode('ascii')).decode('ascii')
+            rank, pk = raw.split('|')
+            return float(rank), int(pk)
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, position):
+        rank, pk = position
+        # repr сохраняет float без потери точности — курсор совпадёт с rank в БД
+        raw = f'{rank!r}|{pk}'
+        return base64.urlsafe_b64encode(raw.encode('ascii')).decode('ascii')
+
+    def paginate_queryset(self, search, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+
+        rows = search.fetch(after=self.decode_cursor(request), limit=self.page_size + 1)
+        self.has_next = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        self.next_position = self.get_position(rows[-1]) if self.has_next else None
+        return rows
+
+    def get_position(self, row):
+        return row['rank'], row['id']
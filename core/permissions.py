@@ -1,5 +1,24 @@
 from rest_framework import permissions
-from .models import Permission
+from .metrics import phase
+from .rbac import permission_matrix, scope_from_mask, has_access, METHOD_ACTIONS, ACTION_BITS
+
+
+def resolve_mask(user, resource_code):
+    """
+    Маска прав пользователя на ресурс. Stateless-токен уже несёт маски,
+    иначе берём её из скомпилированной матрицы (обычно без запросов в БД).
+    """
+    token_permissions = getattr(user, 'token_permissions', None)
+    if token_permissions is not None:
+        return token_permissions.get(resource_code, 0)
+    return permission_matrix.get_mask(user.role_id, resource_code)
+
+
+def resolve_scope(user, resource_code, action):
+    """
+    Возвращает 'ALL', 'OWN' или None для пользователя, ресурса и действия.
+    """
+    return scope_from_mask(resolve_mask(user, resource_code), action)
 
 
 class RBCPermission(permissions.BasePermission):
@@ -8,8 +27,12 @@ class RBCPermission(permissions.BasePermission):
     """
 
     def has_permission(self, request, view):
+        with phase('rbac'):
+            return self._has_permission(request, view)
+
+    def _has_permission(self, request, view):
         # 1. Базовая проверка аутентификации
-        if not request.user or not request.is_authenticated or not hasattr(request.user, 'role'):
+        if not request.user or not request.is_authenticated or not getattr(request.user, 'role_id', None):
             return False
 
         # 2. Определяем ресурс
@@ -17,46 +40,25 @@ class RBCPermission(permissions.BasePermission):
         if not resource_code:
             return False
 
-            # 3. Ищем права в БД
-        try:
-            perm = Permission.objects.get(role=request.user.role, resource__code=resource_code)
-        except Permission.DoesNotExist:
-            return False
-
-            # 4. Проверяем метод
-        method = request.method
-
-        if method == 'POST':
-            return perm.can_create
-
-        if method in permissions.SAFE_METHODS:  # GET, HEAD, OPTIONS
-            if perm.can_read_all:
-                request.access_scope = 'ALL'
-                return True
-            if perm.can_read_own:
-                request.access_scope = 'OWN'
-                return True
-            return False
+        mask = resolve_mask(request.user, resource_code)
 
-        if method in ['PUT', 'PATCH']:
-            if perm.can_update_all:
-                request.access_scope = 'ALL'
-                return True
-            if perm.can_update_own:
-                request.access_scope = 'OWN'
-                return True
-            return False
+        # Пакетные действия проверяют права на каждый элемент сами,
+        # здесь достаточно хоть какого-то доступа к ресурсу
+        if getattr(view, 'action', None) in getattr(view, 'item_level_actions', ()):
+            return any(scope_from_mask(mask, action) for action in ACTION_BITS)
 
-        if method == 'DELETE':
-            if perm.can_delete_all:
-                request.access_scope = 'ALL'
-                return True
-            if perm.can_delete_own:
-                request.access_scope = 'OWN'
-                return True
+        # 3. Проверяем права метода: сначала на все объекты, потом на свои
+        if has_access(mask, request.method, 'ALL'):
+            scope = 'ALL'
+        elif has_access(mask, request.method, 'OWN'):
+            scope = 'OWN'
+        else:
             return False
 
-        return False
+        # Создание не ограничивается владельцем — scope не выставляем
+        if METHOD_ACTIONS[request.method] != 'create':
+            request.access_scope = scope
+        return True
 
     def has_object_permission(self, request, view, obj):
         scope = getattr(request, 'access_scope', None)
@@ -64,6 +66,7 @@ class RBCPermission(permissions.BasePermission):
         if scope == 'ALL':
             return True
         if scope == 'OWN':
-            return getattr(obj, 'owner', None) == request.user
+            # Сравниваем id: obj.owner потребовал бы отдельного запроса за владельцем
+            return getattr(obj, 'owner_id', None) == request.user.id
 
-        return False
\ No newline at end of file
+        return False
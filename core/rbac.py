@@ -0,0 +1,126 @@
+import threading
+from django.db import router, transaction
+from .models import (
+    Permission, CREATE, READ_OWN, READ_ALL, UPDATE_OWN, UPDATE_ALL, DELETE_OWN, DELETE_ALL,
+)
+from .versions import bump_version, get_version
+
+# Ключ счётчика версии прав (поднимается сигналами Permission/Role/Resource)
+RBAC_VERSION_KEY = 'rbac:version'
+
+
+def bump_rbac_version():
+    """
+    Отмечает изменение прав, ролей или ресурсов. Как и у заказов — сразу и ещё раз после коммита:
+    воркер, перестроивший матрицу по старым строкам под промежуточной версией, перестроит её снова.
+    """
+    bump_version(RBAC_VERSION_KEY)
+    transaction.on_commit(lambda: bump_version(RBAC_VERSION_KEY), robust=True)
+
+
+# Действие -> (бит "все", бит "свои"). Создание не ограничивается владельцем.
+ACTION_BITS = {
+    'create': (CREATE, CREATE),
+    'read': (READ_ALL, READ_OWN),
+    'update': (UPDATE_ALL, UPDATE_OWN),
+    'delete': (DELETE_ALL, DELETE_OWN),
+}
+
+# HTTP-метод -> действие над ресурсом
+METHOD_ACTIONS = {
+    'POST': 'create',
+    'GET': 'read',
+    'HEAD': 'read',
+    'OPTIONS': 'read',
+    'PUT': 'update',
+    'PATCH': 'update',
+    'DELETE': 'delete',
+}
+
+
+def scope_from_mask(mask, action):
+    """
+    Возвращает 'ALL', 'OWN' или None для маски и действия.
+    """
+    all_bit, own_bit = ACTION_BITS[action]
+    if mask & all_bit:
+        return 'ALL'
+    if mask & own_bit:
+        return 'OWN'
+    return None
+
+
+def has_access(mask, method, scope):
+    """
+    Быстрая проверка: разрешает ли маска HTTP-метод в данном scope ('ALL' или 'OWN').
+    Право на все объекты включает и право на свои.
+    """
+    action = METHOD_ACTIONS.get(method)
+    if action is None:
+        return False
+    all_bit, own_bit = ACTION_BITS[action]
+    if scope == 'ALL':
+        return bool(mask & all_bit)
+    return bool(mask & (all_bit | own_bit))
+
+
+class PermissionMatrix:
+    """
+    Скомпилированная матрица прав (role_id, resource_code) -> маска.
+    Живёт в памяти воркера и перестраивается целиком одним запросом,
+    когда меняется версия прав. Без общего кэша воркер перечитывает её из БД раз в
+    VERSIONS_LOCAL_TTL (см. core/versions.py) — права, изменённые в другом процессе,
+    применяются с этой задержкой.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._table = {}
+        self._by_role = {}
+
+    def _build(self):
+        table = {}
+        by_role = {}
+        # Матрицу строим по основной БД: реплика может отставать от только что поднятой версии
+        rows = Permission.objects.using(router.db_for_write(Permission))
+        for role_id, code, mask in rows.values_list('role_id', 'resource__code', 'access_mask'):
+            table[(role_id, code)] = mask
+            by_role.setdefault(role_id, {})[code] = mask
+        return table, by_role
+
+    def _refresh(self):
+        version = get_version(RBAC_VERSION_KEY)
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    self._table, self._by_role = self._build()
+                    self._version = version
+        return self._version
+
+    def table(self):
+        self._refresh()
+        return self._table
+
+    def get_mask(self, role_id, resource_code):
+        return self.table().get((role_id, resource_code), 0)
+
+    def get_scope(self, role_id, resource_code, action):
+        """
+        Возвращает 'ALL', 'OWN' или None для роли, ресурса и действия.
+        """
+        return scope_from_mask(self.get_mask(role_id, resource_code), action)
+
+    def role_masks(self, role_id):
+        """
+        Возвращает (версия прав, {resource_code: маска}) для роли — для выпуска stateless-токенов.
+        """
+        version = self._refresh()
+        return version, dict(self._by_role.get(role_id, {}))
+
+    def invalidate(self):
+        with self._lock:
+            self._version = None
+
+
+permission_matrix = PermissionMatrix()
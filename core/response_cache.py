@@ -0,0 +1,39 @@
+from django.conf import settings
+from django.core.cache import caches
+
+
+class ResponseCache:
+    """
+    Кэш готовых данных ответа (после сериализации) в любом backend'е кэша Django.
+    Ключ включает версию заказов, поэтому после записи старые записи
+    просто перестают находиться и доживают до TIMEOUT, никем не читаясь.
+    """
+
+    def __init__(self, alias, timeout, enabled=True):
+        self.alias = alias
+        self.timeout = timeout
+        self.enabled = enabled
+
+    @property
+    def backend(self):
+        return caches[self.alias]
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        return self.backend.get(key)
+
+    def set(self, key, data):
+        if self.enabled:
+            self.backend.set(key, data, timeout=self.timeout)
+
+
+def get_response_cache():
+    config = getattr(settings, 'ORDERS_RESPONSE_CACHE', {})
+    return ResponseCache(
+        alias=config.get('ALIAS', 'default'),
+        timeout=config.get('TIMEOUT', 300),
+        # Ключ строится из версий заказов. Без общего кэша (VERSIONS_SHARED_CACHE) версии берутся из БД
+        # и перечитываются раз в VERSIONS_LOCAL_TTL: запись в другом процессе доходит с той же задержкой, что и до ETag
+        enabled=config.get('ENABLED', False),
+    )
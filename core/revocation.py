@@ -0,0 +1,171 @@
+import datetime
+import hashlib
+import math
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import router
+from django.db.models import Subquery
+from django.utils import timezone
+from .models import RevokedToken
+from .versions import bump_user_version, bump_version, get_version, user_version_key
+
+REVOCATION_VERSION_KEY = 'auth:revocation:version'
+PRUNE_LOCK_KEY = 'auth:revocation:prune'
+SYNC_OVERLAP = datetime.timedelta(seconds=60)
+
+
+class BloomFilter:
+    """
+    Bloom-фильтр: "нет" — точно нет, "да" — возможно (с долей ложных срабатываний error_rate).
+    """
+
+    def __init__(self, capacity, error_rate=0.01):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, value):
+        # Двойное хеширование: k позиций из двух 64-битных половин одного blake2b
+        digest = hashlib.blake2b(value.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, value):
+        for pos in self._positions(value):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, value):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(value))
+
+
+class RevocationList:
+    """
+    Список отозванных jti для воркера.
+    Обычный (не отозванный) токен проверяется только по Bloom-фильтру в памяти;
+    в БД идём лишь при возможном совпадении. С общим кэшем (REVOCATION_SHARED_CACHE) фильтр
+    догружается новыми записями, когда другой воркер поднял версию в кэше, и для страховки
+    не реже REVOCATION_SYNC_INTERVAL; с кэшем в памяти процесса версию чужого отзыва не увидеть,
+    и фильтр догружается из БД не реже REVOCATION_LOCAL_SYNC_INTERVAL. Целиком пересобирается
+    раз в REVOCATION_REBUILD_INTERVAL — чтобы забыть истёкшие.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._bloom = None
+        self._loaded_at = None
+        self._version = None
+        self._synced_at = 0.0
+        self._built_at = 0.0
+
+    def _db(self):
+        # Подтверждение и синхронизация — с основной БД: реплика может не знать о свежем отзыве
+        return router.db_for_write(RevokedToken)
+
+    def _load(self, bloom, since=None):
+        now = timezone.now()
+        rows = RevokedToken.objects.using(self._db()).filter(expires_at__gt=now)
+        if since is not None:
+            # С запасом: транзакции коммитятся не в порядке revoked_at, повторное добавление безвредно
+            rows = rows.filter(revoked_at__gte=since - SYNC_OVERLAP)
+        for jti in rows.values_list('jti', flat=True).iterator():
+            bloom.add(jti)
+        return now
+
+    def _sync(self):
+        now = time.monotonic()
+        if settings.REVOCATION_SHARED_CACHE:
+            # Версии нет в кэше — с момента его очистки никто ничего не отзывал
+            version = cache.get(REVOCATION_VERSION_KEY)
+            interval = settings.REVOCATION_SYNC_INTERVAL
+        else:
+            version, interval = None, settings.REVOCATION_LOCAL_SYNC_INTERVAL
+        if (
+            self._bloom is not None
+            and version in (None, self._version)
+            and now - self._synced_at < interval
+        ):
+            return
+        with self._lock:
+            if self._bloom is None or now - self._built_at >= settings.REVOCATION_REBUILD_INTERVAL:
+                bloom = BloomFilter(settings.REVOCATION_BLOOM_CAPACITY, settings.REVOCATION_BLOOM_ERROR_RATE)
+                self._loaded_at = self._load(bloom)
+                self._bloom = bloom
+                self._built_at = now
+            else:
+                self._loaded_at = self._load(self._bloom, since=self._loaded_at)
+            if version is not None:
+                self._version = version
+            self._synced_at = now
+
+    def is_token_revoked(self, payload):
+        """
+        Отозван ли токен. logout поднимает версию пользователя, поэтому токен с актуальной 'uv'
+        выпущен после последнего logout и не отозван — при общем кэше это решается без фильтра и БД.
+        """
+        if (
+            settings.REVOCATION_SHARED_CACHE
+            and 'uv' in payload
+            and payload['uv'] == get_version(user_version_key(payload['user_id']))
+        ):
+            return False
+        return self.is_revoked(payload.get('jti'))
+
+    def is_revoked(self, jti):
+        if not jti:
+            # Токены, выпущенные до появления jti, отозвать нельзя
+            return False
+        self._sync()
+        if jti not in self._bloom:
+            return False
+        return RevokedToken.objects.using(self._db()).filter(jti=jti).exists()
+
+    def revoke(self, payload):
+        """
+        Отзывает токен по его payload. Возвращает False, если jti нет или токен уже был отозван
+        (из двух одновременных отзывов True получит один).
+        """
+        jti = payload.get('jti')
+        if not jti:
+            return False
+        expires_at = datetime.datetime.fromtimestamp(payload['exp'], tz=datetime.timezone.utc)
+        _, created = RevokedToken.objects.get_or_create(
+            jti=jti, defaults={'user_id': payload['user_id'], 'expires_at': expires_at},
+        )
+        prune_revoked_tokens()
+        with self._lock:
+            if self._bloom is not None:
+                self._bloom.add(jti)
+        # Остальные воркеры догрузят запись на следующем запросе;
+        # токены пользователя с прежней 'uv' больше не проходят без проверки
+        bump_version(REVOCATION_VERSION_KEY)
+        bump_user_version(payload['user_id'])
+        return created
+
+    def reset(self):
+        with self._lock:
+            self._bloom = None
+            self._loaded_at = None
+            self._version = None
+
+
+def prune_revoked_tokens(force=False):
+    """
+    Удаляет записи об уже истёкших токенах — они и так не пройдут проверку exp.
+    Не больше REVOCATION_PRUNE_BATCH за раз (по индексу expires_at) и не чаще раза
+    в REVOCATION_PRUNE_INTERVAL (замок в кэше): вызывается при каждом отзыве.
+    """
+    if not force and not cache.add(PRUNE_LOCK_KEY, 1, timeout=settings.REVOCATION_PRUNE_INTERVAL):
+        return 0
+    tokens = RevokedToken.objects.using(router.db_for_write(RevokedToken))
+    expired = (
+        tokens.filter(expires_at__lte=timezone.now())
+        .order_by('expires_at').values('pk')[:settings.REVOCATION_PRUNE_BATCH]
+    )
+    deleted, _ = tokens.filter(pk__in=Subquery(expired)).delete()
+    return deleted
+
+
+revocation_list = RevocationList()
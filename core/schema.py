@@ -0,0 +1,135 @@
+import hashlib
+import os
+import threading
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.module_loading import import_string
+from django.views.decorators.http import require_GET
+from rest_framework.schemas.inspectors import ViewInspector
+
+# drf_spectacular (генератор, интроспекция сериализаторов) тянет за собой заметную часть
+# холодного старта, поэтому воркер его не импортирует вовсе. View аннотируются лёгкими
+# extend_schema/OpenApiParameter отсюда, а настоящие объекты drf_spectacular из них собирает
+# только генератор (см. core/schema_generator.py).
+
+EXTEND_SCHEMA_ATTR = '_extend_schema'
+
+
+class AutoSchema(ViewInspector):
+    """
+    Лёгкий инспектор по умолчанию (REST_FRAMEWORK['DEFAULT_SCHEMA_CLASS']).
+    На время генерации LazySchemaGenerator переключает настройку на AutoSchema drf_spectacular.
+    """
+
+
+class OpenApiParameter:
+    """
+    Отложенный drf_spectacular.utils.OpenApiParameter: запоминает аргументы,
+    сам параметр создаётся генератором.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+
+
+def extend_schema(**kwargs):
+    """
+    Отложенный drf_spectacular.utils.extend_schema для методов view: сохраняет аргументы в атрибуте
+    метода, генератор применяет настоящий extend_schema при описании view.
+    """
+    def decorator(method):
+        setattr(method, EXTEND_SCHEMA_ATTR, kwargs)
+        return method
+    return decorator
+
+
+# --- Предсобранная схема ---
+
+SCHEMA_FORMATS = {
+    'json': ('openapi.json', 'application/vnd.oai.openapi+json'),
+    'yaml': ('openapi.yaml', 'application/vnd.oai.openapi'),
+}
+
+_files = {}
+_files_lock = threading.Lock()
+
+
+def schema_dir():
+    return settings.SCHEMA_DIR
+
+
+def load_schema_file(schema_format):
+    """
+    Содержимое и sha256 предсобранного файла схемы или None.
+    Кэшируется в памяти воркера по mtime: новый build_schema подхватывается без перезапуска.
+    """
+    path = schema_dir() / SCHEMA_FORMATS[schema_format][0]
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    key = (str(path), mtime)
+    with _files_lock:
+        cached = _files.get(schema_format)
+        if cached is None or cached[0] != key:
+            try:
+                content = path.read_bytes()
+            except FileNotFoundError:
+                return None
+            _files[schema_format] = cached = (key, content, hashlib.sha256(content).hexdigest())
+        return cached[1:]
+
+
+def reset_schema_files():
+    with _files_lock:
+        _files.clear()
+
+
+def _lazy_view(import_path, **initkwargs):
+    """
+    View, которая импортируется и собирается при первом запросе.
+    """
+    holder = {}
+
+    def view(request, *args, **kwargs):
+        if 'view' not in holder:
+            holder['view'] = import_string(import_path).as_view(**initkwargs)
+        return holder['view'](request, *args, **kwargs)
+    return view
+
+
+_dynamic_schema_view = _lazy_view('drf_spectacular.views.SpectacularAPIView')
+swagger_view = _lazy_view('drf_spectacular.views.SpectacularSwaggerView', url_name='schema')
+
+
+@require_GET
+def schema_view(request, digest=None):
+    """
+    Отдаёт схему, собранную командой build_schema, без интроспекции view.
+    /api/schema/ — с ETag и обычным кэшированием, /api/schema/<sha256>/ — навсегда (immutable).
+    Если файла нет (локальная разработка), генерирует схему на лету.
+    """
+    # Как и у SpectacularAPIView: YAML по умолчанию, ?format=json — JSON
+    schema_format = 'json' if request.GET.get('format') == 'json' else 'yaml'
+    loaded = load_schema_file(schema_format)
+    if loaded is None:
+        if digest is not None:
+            raise Http404
+        return _dynamic_schema_view(request)
+
+    content, sha256 = loaded
+    if digest is not None and digest != sha256:
+        raise Http404
+
+    etag = f'"{sha256}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(content, content_type=SCHEMA_FORMATS[schema_format][1])
+    response['ETag'] = etag
+    if digest is None:
+        patch_cache_control(response, public=True, max_age=settings.SCHEMA_MAX_AGE)
+    else:
+        patch_cache_control(response, public=True, max_age=365 * 24 * 3600, immutable=True)
+    return response
@@ -0,0 +1,45 @@
+from django.conf import settings
+from django.test.utils import override_settings
+from drf_spectacular.generators import SchemaGenerator
+from drf_spectacular.utils import OpenApiParameter, extend_schema
+from rest_framework import viewsets
+from . import schema
+
+SPECTACULAR_SCHEMA_CLASS = 'drf_spectacular.openapi.AutoSchema'
+
+
+def _resolve(value):
+    # Отложенные параметры core.schema -> настоящие OpenApiParameter
+    if isinstance(value, schema.OpenApiParameter):
+        return OpenApiParameter(*value.args, **value.kwargs)
+    if isinstance(value, (list, tuple)):
+        return [_resolve(item) for item in value]
+    return value
+
+
+class LazySchemaGenerator(SchemaGenerator):
+    """
+    Генератор схемы (SPECTACULAR_SETTINGS['DEFAULT_GENERATOR_CLASS']).
+    На время генерации DEFAULT_SCHEMA_CLASS указывает на AutoSchema drf_spectacular,
+    а аннотации core.schema.extend_schema превращаются в настоящие extend_schema.
+    Модуль импортирует сам drf_spectacular — только во время генерации.
+    """
+
+    def get_schema(self, request=None, public=False):
+        # Переопределение глобальное: генерация на лету идёт только без предсобранного файла (разработка)
+        rest_framework = {**settings.REST_FRAMEWORK, 'DEFAULT_SCHEMA_CLASS': SPECTACULAR_SCHEMA_CLASS}
+        with override_settings(REST_FRAMEWORK=rest_framework):
+            return super().get_schema(request=request, public=public)
+
+    def create_view(self, callback, method, request=None):
+        view = super().create_view(callback, method, request)
+        if isinstance(view, viewsets.ViewSetMixin):
+            handler = getattr(view, view.action, None)
+        else:
+            handler = getattr(view, method.lower(), None)
+        annotation = getattr(handler, schema.EXTEND_SCHEMA_ATTR, None)
+        if annotation is not None:
+            # Настоящий extend_schema кладёт класс схемы в kwargs метода, как для @action
+            extended = extend_schema(**{key: _resolve(value) for key, value in annotation.items()})(lambda: None)
+            self._set_schema_to_view(view, extended.kwargs['schema']())
+        return view
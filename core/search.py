@@ -0,0 +1,92 @@
+import re
+from django.db import connections, router
+from django.db.models import F
+from .models import Order
+
+FTS_TABLE = 'core_order_fts'
+
+_token_re = re.compile(r'\w+', re.UNICODE)
+
+
+def build_match_query(text):
+    """
+    Превращает пользовательский ввод в безопасный запрос FTS5:
+    каждое слово в кавычках (операторы FTS5 не интерпретируются), все слова обязательны,
+    последнее — по префиксу, чтобы искать по мере набора.
+    """
+    tokens = _token_re.findall(text or '')
+    if not tokens:
+        return None
+    quoted = [f'"{token}"' for token in tokens]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+class OrderSearch:
+    """
+    Поиск заказов по описанию с ранжированием bm25.
+    Ограничение OWN применяется в том же SQL-запросе, что и MATCH.
+    Страница строк — (rank, id, ...поля списка); чем меньше rank, тем релевантнее.
+    """
+
+    def __init__(self, text, owner_id=None):
+        self.text = text
+        self.match = build_match_query(text)
+        self.owner_id = owner_id
+
+    def fetch(self, after=None, limit=50):
+        if self.match is None:
+            return []
+        using = router.db_for_read(Order)
+        if connections[using].vendor == 'sqlite':
+            hits = self._fetch_fts(using, after, limit)
+        else:
+            hits = self._fetch_fallback(using, after, limit)
+        if not hits:
+            return []
+
+        # Поля списка — одним запросом по найденным id, в порядке релевантности
+        rows = {
+            row['id']: row
+            for row in Order.objects.using(using)
+            .filter(id__in=[pk for _, pk in hits])
+            .annotate(owner_email=F('owner__email'))
+            .values('id', 'description', 'created_at', 'owner_email')
+        }
+        return [dict(rows[pk], rank=rank) for rank, pk in hits if pk in rows]
+
+    def _fetch_fts(self, using, after, limit):
+        table = Order._meta.db_table
+        owner_column = Order._meta.get_field('owner').column
+        conditions = [f'{FTS_TABLE} MATCH %s']
+        params = [self.match]
+        if self.owner_id is not None:
+            conditions.append(f'o.{owner_column} = %s')
+            params.append(self.owner_id)
+
+        sql = (
+            f'SELECT bm25({FTS_TABLE}) AS rank, o.id FROM {FTS_TABLE} '
+            f'JOIN {table} o ON o.id = {FTS_TABLE}.rowid '
+            f'WHERE {" AND ".join(conditions)}'
+        )
+        # Keyset по (rank, id): следующая страница продолжает с последней позиции
+        if after is not None:
+            sql = f'SELECT rank, id FROM ({sql}) WHERE rank > %s OR (rank = %s AND id > %s)'
+            params.extend([after[0], after[0], after[1]])
+        sql += ' ORDER BY rank, id LIMIT %s'
+        params.append(limit)
+
+        with connections[using].cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    def _fetch_fallback(self, using, after, limit):
+        # Без FTS5 — все слова через icontains, без ранжирования (rank = 0)
+        queryset = Order.objects.using(using)
+        for token in _token_re.findall(self.text):
+            queryset = queryset.filter(description__icontains=token)
+        if self.owner_id is not None:
+            queryset = queryset.filter(owner_id=self.owner_id)
+        if after is not None:
+            queryset = queryset.filter(id__gt=after[1])
+        return [(0.0, pk) for pk in queryset.order_by('id').values_list('id', flat=True)[:limit]]
@@ -0,0 +1,92 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from .auth_cache import principal_cache, evict_user
+from .metrics import install_query_counter
+from .models import Permission, Role, Resource, User, Order
+from .rbac import bump_rbac_version
+from .sqlite import configure_sqlite_connection
+from .stats import apply_order_changes
+from .versions import bump_orders_version, bump_user_version
+
+
+@receiver([post_save, post_delete], sender=Permission)
+@receiver([post_save, post_delete], sender=Role)
+@receiver([post_save, post_delete], sender=Resource)
+def invalidate_permission_matrix(sender, **kwargs):
+    # Любая правка прав/ролей/ресурсов делает матрицу во всех воркерах устаревшей
+    bump_rbac_version()
+
+
+@receiver(pre_save, sender=User)
+def remember_user_email(sender, instance, update_fields=None, **kwargs):
+    # Email владельца есть в ответах о заказах — запоминаем прежний, чтобы заметить смену
+    instance._previous_email = None
+    if instance.pk is not None and (update_fields is None or 'email' in update_fields):
+        instance._previous_email = User.objects.filter(pk=instance.pk).values_list('email', flat=True).first()
+
+
+@receiver(post_save, sender=User)
+def invalidate_owner_orders(sender, instance, created, **kwargs):
+    # Закэшированные ответы и ETag заказов содержат старый email владельца
+    previous = getattr(instance, '_previous_email', None)
+    if not created and previous is not None and previous != instance.email:
+        bump_orders_version([instance.id])
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_user_principal(sender, instance, **kwargs):
+    # Смена роли, деактивация или удаление — снимок пользователя больше не верен.
+    # Локальный кэш чистим сразу, остальные воркеры увидят новую версию в общем кэше
+    evict_user(instance.id)
+    bump_user_version(instance.id)
+
+
+@receiver([post_save, post_delete], sender=Role)
+def invalidate_role_principals(sender, **kwargs):
+    # Снимки хранят имя роли — проще сбросить всё, роли меняются редко
+    principal_cache.clear()
+
+
+@receiver([post_save, post_delete], sender=Order)
+def invalidate_order_versions(sender, instance, **kwargs):
+    # ETag списков и карточек заказов строятся из этих версий
+    bump_orders_version([instance.owner_id])
+
+
+@receiver(post_save, sender=Order)
+def count_created_order(sender, instance, created, **kwargs):
+    # Order.save атомарен — счётчики коммитятся вместе с заказом
+    if created:
+        apply_order_changes([instance], 1)
+
+
+@receiver(post_delete, sender=Order)
+def count_deleted_order(sender, instance, **kwargs):
+    apply_order_changes([instance], -1)
+
+
+# bulk_create/bulk_update не шлют post_save, пакетный DELETE — post_delete — пакетные пути вызывают эти функции сами,
+# в той же транзакции, что и запись
+
+
+def orders_bulk_created(orders):
+    apply_order_changes(orders, 1)
+    bump_orders_version({order.owner_id for order in orders})
+
+
+def orders_bulk_updated(orders):
+    bump_orders_version({order.owner_id for order in orders})
+
+
+def orders_bulk_deleted(orders):
+    # Пакетное удаление идёт мимо Collector, поэтому post_delete не отправляется
+    apply_order_changes(orders, -1)
+    bump_orders_version({order.owner_id for order in orders})
+
+
+# PRAGMA для production-профиля SQLite (SQLITE_PRODUCTION)
+connection_created.connect(configure_sqlite_connection, dispatch_uid='core.sqlite_pragmas')
+
+# Счётчик запросов к БД для core/metrics.py — на каждом соединении, в том числе под ASGI
+connection_created.connect(install_query_counter, dispatch_uid='core.metrics_query_counter')
@@ -0,0 +1,35 @@
+from django.conf import settings
+
+# Профиль SQLite для высокой конкуренции: WAL — читатели не ждут писателя,
+# synchronous=NORMAL — fsync только на чекпоинтах (в WAL это безопасно для целостности),
+# busy_timeout — ждать блокировку вместо мгновенного "database is locked".
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,  # мс
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64000,  # отрицательное значение — в КиБ, т.е. ~64 МБ
+    'temp_store': 'MEMORY',
+}
+
+
+def get_pragmas():
+    return {**DEFAULT_PRAGMAS, **getattr(settings, 'SQLITE_PRAGMAS', {})}
+
+
+def apply_pragmas(cursor, pragmas=None):
+    """
+    Применяет PRAGMA к открытому соединению (DB-API курсор Django или sqlite3).
+    """
+    for name, value in (pragmas or get_pragmas()).items():
+        cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def configure_sqlite_connection(sender, connection, **kwargs):
+    """
+    Обработчик connection_created: каждое новое SQLite-соединение получает профиль.
+    """
+    if connection.vendor != 'sqlite' or not getattr(settings, 'SQLITE_PRODUCTION', False):
+        return
+    with connection.cursor() as cursor:
+        apply_pragmas(cursor)
@@ -0,0 +1,124 @@
+import datetime
+import operator
+from collections import Counter
+from functools import reduce
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, F, Q, Value, When
+from django.db.models.functions import Greatest, TruncDate
+from django.utils import timezone
+from .models import User, Order, OrderOwnerStat, OrderDailyStat, ALL_OWNERS
+
+
+def _order_day(order):
+    return timezone.localdate(order.created_at) if timezone.is_aware(order.created_at) else order.created_at.date()
+
+
+def _increment(model, fields, deltas):
+    """
+    Атомарно прибавляет к счётчикам {ключ: delta} одним UPDATE ... CASE на таблицу.
+    Строки создаются только для положительных delta: уменьшение по несуществующей
+    строке (например, после удаления владельца) ничего не делает.
+    """
+    keys = sorted(key for key, delta in deltas.items() if delta)
+    if not keys:
+        return
+    lookups = [Q(**dict(zip(fields, key))) for key in keys]
+    delta = Case(*[When(lookup, then=Value(deltas[key])) for lookup, key in zip(lookups, keys)], default=0)
+    # Не ниже нуля: разошедшийся счётчик не должен ронять удаление заказа (чинится пересборкой)
+    updated = model.objects.filter(reduce(operator.or_, lookups)).update(total=Greatest(F('total') + delta, 0))
+    if updated == len(keys):
+        return
+
+    existing = set(model.objects.filter(reduce(operator.or_, lookups)).values_list(*fields))
+    for key in keys:
+        if key in existing or deltas[key] < 0:
+            continue
+        lookup = dict(zip(fields, key))
+        try:
+            # Savepoint: при гонке двух первых вставок вторая откатится и сделает UPDATE
+            with transaction.atomic():
+                model.objects.create(total=deltas[key], **lookup)
+        except IntegrityError:
+            model.objects.filter(**lookup).update(total=F('total') + deltas[key])
+
+
+def apply_order_changes(orders, sign):
+    """
+    Пересчитывает счётчики для созданных (sign=1) или удалённых (sign=-1) заказов.
+    Вызывается внутри транзакции записи — счётчики коммитятся вместе с заказами.
+    """
+    by_owner = Counter()
+    by_day = Counter()
+    for order in orders:
+        day = _order_day(order)
+        by_owner[(order.owner_id,)] += sign
+        by_owner[(ALL_OWNERS,)] += sign
+        by_day[(order.owner_id, day)] += sign
+        by_day[(ALL_OWNERS, day)] += sign
+
+    _increment(OrderOwnerStat, ('owner_id',), by_owner)
+    _increment(OrderDailyStat, ('owner_id', 'day'), by_day)
+
+
+def rebuild_order_stats():
+    """
+    Пересобирает счётчики с нуля по core_order (GROUP BY). Возвращает число заказов.
+    """
+    with transaction.atomic():
+        OrderOwnerStat.objects.all().delete()
+        OrderDailyStat.objects.all().delete()
+
+        owner_rows = list(Order.objects.values('owner_id').annotate(total=Count('id')).order_by())
+        day_rows = list(
+            Order.objects.annotate(day=TruncDate('created_at'))
+            .values('owner_id', 'day').annotate(total=Count('id')).order_by()
+        )
+
+        total = sum(row['total'] for row in owner_rows)
+        owner_stats = [OrderOwnerStat(owner_id=row['owner_id'], total=row['total']) for row in owner_rows]
+        owner_stats.append(OrderOwnerStat(owner_id=ALL_OWNERS, total=total))
+
+        all_by_day = Counter()
+        daily_stats = []
+        for row in day_rows:
+            all_by_day[row['day']] += row['total']
+            daily_stats.append(OrderDailyStat(owner_id=row['owner_id'], day=row['day'], total=row['total']))
+        daily_stats.extend(OrderDailyStat(owner_id=ALL_OWNERS, day=day, total=count) for day, count in all_by_day.items())
+
+        OrderOwnerStat.objects.bulk_create(owner_stats, batch_size=1000)
+        OrderDailyStat.objects.bulk_create(daily_stats, batch_size=1000)
+    return total
+
+
+def order_stats(owner=None, days=30, top=20):
+    """
+    Статистика из сводных таблиц: общее число, по дням за последние days дней
+    и топ владельцев (для owner=None — scope ALL; иначе только сам владелец).
+    Каждая часть — чтение по индексу, объём работы пропорционален размеру ответа.
+    """
+    key = ALL_OWNERS if owner is None else owner.id
+    total = OrderOwnerStat.objects.filter(owner_id=key).values_list('total', flat=True).first() or 0
+
+    since = timezone.localdate() - datetime.timedelta(days=days - 1)
+    by_day = [
+        {'day': day.isoformat(), 'total': count}
+        for day, count in OrderDailyStat.objects
+        .filter(owner_id=key, day__gte=since, total__gt=0)
+        .order_by('day')
+        .values_list('day', 'total')
+    ]
+
+    if owner is not None:
+        by_owner = [{'owner_id': owner.id, 'owner': owner.email, 'total': total}]
+    else:
+        by_owner = list(
+            OrderOwnerStat.objects
+            .exclude(owner_id=ALL_OWNERS)
+            .filter(total__gt=0)
+            .order_by('-total', 'owner_id')
+            .values('owner_id', 'total')[:top]
+        )
+        emails = dict(User.objects.filter(id__in=[row['owner_id'] for row in by_owner]).values_list('id', 'email'))
+        for row in by_owner:
+            row['owner'] = emails.get(row['owner_id'])
+    return {'total': total, 'by_day': by_day, 'by_owner': by_owner}
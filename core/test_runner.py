@@ -0,0 +1,42 @@
+from django.core.cache import caches
+from django.test.runner import DiscoverRunner
+from django.test.utils import iter_test_cases, override_settings
+from .auth_cache import principal_cache
+from .revocation import revocation_list
+
+
+def clear_caches():
+    # Кэши (версии, ответы, снимки пользователей, фильтр отзыва) живут дольше тестовой транзакции,
+    # а id после отката переиспользуются — сбрасываем их после каждого теста. Фильтр отзыва
+    # без общего кэша догружается раз в секунду: после сброса это происходит на первом запросе теста,
+    # а не посреди assertNumQueries
+    for backend in caches.all():
+        backend.clear()
+    principal_cache.clear()
+    revocation_list.reset()
+
+
+class TestRunner(DiscoverRunner):
+    """
+    Тестовый прогон (TEST_RUNNER):
+    - bcrypt с минимальной стоимостью — стойкость хешей тестам не нужна, а cost=12 на каждом
+      логине делает прогон в разы дольше; тесты, которым важна стоимость, задают её через override_settings;
+    - кэши очищаются после каждого теста.
+    Настройки кэша версий и отзыва — те же, что в settings.py; поведение с общим кэшем
+    тесты включают сами (VERSIONS_SHARED_CACHE, REVOCATION_SHARED_CACHE).
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._test_settings = override_settings(BCRYPT_ROUNDS=4)
+        self._test_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._test_settings.disable()
+        super().teardown_test_environment(**kwargs)
+
+    def build_suite(self, *args, **kwargs):
+        suite = super().build_suite(*args, **kwargs)
+        for test in iter_test_cases(suite):
+            test.addCleanup(clear_caches)
+        return suite
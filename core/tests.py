@@ -1,7 +1,91 @@
+import asyncio
+import csv
+import datetime
+import json
+import os
+import re
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager, redirect_stderr
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+from django.core.management import CommandError, call_command
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import DatabaseError, connection, connections, transaction
+from django.db.models.signals import post_delete, post_save
+from django.http import HttpResponse
+from django.test import (
+    AsyncRequestFactory, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import http_date
 from django.urls import reverse
-from rest_framework.test import APITestCase
+from rest_framework.test import APIClient, APITestCase
 from rest_framework import status
-from .models import User, Role, Resource, Permission, Order
+from rest_framework.settings import api_settings
+from .models import (
+    User, Role, Resource, Permission, Order, OrderOwnerStat, OrderDailyStat, RevokedToken, IdempotencyKey,
+    VersionCounter, password_cost, CREATE, READ_ALL, READ_OWN,
+)
+from .async_views import AsyncRegisterView, AsyncLoginView
+from .hashing import HashingPool, HashingPoolFull
+from .auth_cache import principal_cache, token_digest
+from .middleware import load_snapshot, user_from_snapshot
+from .db_router import PrimaryReplicaRouter, ReadReplicaMiddleware
+from .group_commit import GroupCommitCancelled, GroupCommitOutcomeUnknown, GroupCommitWriter, flush_orders
+from .metrics import registry
+from .schema import AutoSchema, reset_schema_files
+from .revocation import BloomFilter, RevocationList, prune_revoked_tokens
+from .idempotency import store_idempotent_response, sweep_expired_keys
+from .rbac import RBAC_VERSION_KEY, permission_matrix
+from .utils import generate_jwt_token
+from . import versions
+from .versions import get_orders_version, get_version, user_version_key
+from .stats import apply_order_changes, order_stats, rebuild_order_stats
+
+
+@contextmanager
+def another_process():
+    """
+    Записи "из другого процесса": у него свой LocMemCache, с этим воркером общая только БД.
+    """
+    other_cache = LocMemCache('another-process', {})
+    with mock.patch('core.versions.cache', other_cache):
+        yield
+    other_cache.clear()
+
+
+class OrdersUserMixin:
+    """
+    Общая подготовка: роль с правами на ресурс orders (self.role, self.resource, self.perm),
+    пользователь с паролем PASSWORD (self.user) и логин с токеном в клиенте.
+    """
+    PASSWORD = 'password123'
+
+    def create_orders_user(self, email, role_name='user', **flags):
+        self.role = Role.objects.create(name=role_name)
+        self.resource = Resource.objects.create(code='orders')
+        self.perm = Permission.objects.create(role=self.role, resource=self.resource, **flags)
+        self.user = User(email=email, role=self.role)
+        self.user.set_password(self.PASSWORD)
+        self.user.save()
+        return self.user
+
+    def login(self, email=None):
+        """
+        Логинится (по умолчанию как self.user), выставляет токен клиенту и возвращает ответ логина.
+        """
+        data = self.client.post(reverse('login'), {'email': email or self.user.email, 'password': self.PASSWORD}).data
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + data['token'])
+        return data
 
 
 class OrderFlowTests(APITestCase):
@@ -67,4 +151,1616 @@ class OrderFlowTests(APITestCase):
         """
         response = self.client.post(self.orders_list_url, {'description': 'Hacker Order'})
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
-        print("\n✅ Тест защиты прошел успешно!")
\ No newline at end of file
+        print("\n✅ Тест защиты прошел успешно!")
+
+
+class PermissionMatrixTests(OrdersUserMixin, APITestCase):
+    def setUp(self):
+        self.create_orders_user('matrix@example.com', can_create=True, can_read_own=True)
+        self.login()
+        self.orders_list_url = reverse('orders-list')
+
+    def test_matrix_compiles_scopes(self):
+        from .rbac import permission_matrix
+
+        self.assertEqual(permission_matrix.get_scope(self.role.id, 'orders', 'read'), 'OWN')
+        self.assertEqual(permission_matrix.get_scope(self.role.id, 'orders', 'create'), 'ALL')
+        self.assertIsNone(permission_matrix.get_scope(self.role.id, 'orders', 'delete'))
+        self.assertIsNone(permission_matrix.get_scope(self.role.id, 'products', 'read'))
+
+    def test_boolean_api_maps_to_mask(self):
+        from .models import CREATE, READ_OWN
+
+        self.assertEqual(self.perm.access_mask, CREATE | READ_OWN)
+        self.assertEqual(list(Permission.objects.with_flags(can_read_own=True, can_create=True)), [self.perm])
+        self.assertFalse(Permission.objects.with_flags(can_read_all=True).exists())
+        self.assertEqual(list(Permission.objects.with_flags(can_read_all=False, can_delete_own=False)), [self.perm])
+
+    def test_role_masks_and_has_access(self):
+        from .models import CREATE, READ_OWN
+        from .rbac import has_access
+
+        with self.assertNumQueries(1):
+            self.assertEqual(Permission.objects.masks_for_role(self.role), {'orders': CREATE | READ_OWN})
+        self.assertTrue(has_access(self.perm.access_mask, 'GET', 'OWN'))
+        self.assertFalse(has_access(self.perm.access_mask, 'GET', 'ALL'))
+        self.assertTrue(has_access(self.perm.access_mask, 'POST', 'ALL'))
+        self.assertFalse(has_access(self.perm.access_mask, 'DELETE', 'OWN'))
+        self.assertFalse(has_access(self.perm.access_mask, 'TRACE', 'OWN'))
+
+    def test_admin_edit_is_picked_up_on_next_request(self):
+        self.assertEqual(self.client.get(self.orders_list_url).status_code, status.HTTP_200_OK)
+
+        self.perm.can_read_own = False
+        self.perm.save()
+        self.assertEqual(self.client.get(self.orders_list_url).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_edit_inside_transaction_is_not_pinned_under_new_version(self):
+        committed = permission_matrix._build()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                self.perm.access_mask = 0
+                self.perm.save()
+                # Другой воркер до коммита видит новую версию, но читает ещё старые строки
+                with mock.patch.object(permission_matrix, '_build', return_value=committed):
+                    self.assertNotEqual(permission_matrix.get_mask(self.role.id, 'orders'), 0)
+
+        self.assertEqual(permission_matrix.get_mask(self.role.id, 'orders'), 0)
+
+    @override_settings(VERSIONS_SHARED_CACHE=False, VERSIONS_LOCAL_TTL=0.2)
+    def test_edit_from_another_process_is_picked_up_after_local_ttl(self):
+        # Версии заводятся заново — уже с локальным сроком жизни
+        caches['default'].clear()
+        self.assertEqual(self.client.get(self.orders_list_url).status_code, status.HTTP_200_OK)
+
+        # Права меняет другой процесс: его bump_version до LocMemCache этого воркера не доходит
+        with another_process():
+            self.perm.access_mask = CREATE
+            self.perm.save()
+        self.assertEqual(self.client.get(self.orders_list_url).status_code, status.HTTP_200_OK)
+
+        time.sleep(0.3)
+        self.assertEqual(self.client.get(self.orders_list_url).status_code, status.HTTP_403_FORBIDDEN)
+
+        self.perm.delete()
+        self.assertEqual(self.client.post(self.orders_list_url, {'description': 'x'}).status_code,
+                         status.HTTP_403_FORBIDDEN)
+
+
+class PrincipalCacheTests(OrdersUserMixin, APITestCase):
+    def setUp(self):
+        self.create_orders_user('cache@example.com', can_create=True, can_read_own=True)
+        self.login()
+        self.orders_list_url = reverse('orders-list')
+
+    @override_settings(ORDERS_RESPONSE_CACHE={'ENABLED': False})
+    def test_cached_principal_skips_user_lookup(self):
+        self.client.get(self.orders_list_url)
+
+        # Пользователь и права уже в памяти: остаётся только запрос списка заказов
+        with self.assertNumQueries(1):
+            response = self.client.get(self.orders_list_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_deactivation_evicts_cached_principal(self):
+        self.assertEqual(self.client.get(self.orders_list_url).status_code, status.HTTP_200_OK)
+
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get(self.orders_list_url).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_deactivation_reaches_other_workers(self):
+        self.assertEqual(self.client.get(self.orders_list_url).status_code, status.HTTP_200_OK)
+        digest = token_digest(self.client._credentials['HTTP_AUTHORIZATION'].split(' ')[1])
+        entry = principal_cache.get(digest)
+
+        self.user.is_active = False
+        self.user.save()
+        # Локальный кэш другого воркера никто не чистил — его остановит версия пользователя
+        principal_cache.set(digest, entry)
+        self.assertEqual(self.client.get(self.orders_list_url).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_snapshot_user_keeps_role(self):
+        # Роль с id != 1: иначе перепутанные role_id и is_active (True == 1) не заметить
+        Role.objects.create(name='placeholder')
+        role = Role.objects.create(name='second')
+        snapshot = load_snapshot(User.objects.create(email='second@example.com', password_hash='x', role=role).id)
+
+        user = user_from_snapshot(snapshot)
+
+        self.assertEqual(user.role_id, role.id)
+        self.assertIs(user.is_active, True)
+        self.assertEqual(user.role.name, 'second')
+
+
+@override_settings(JWT_STATELESS_AUTH=True)
+class StatelessTokenTests(OrdersUserMixin, APITestCase):
+    def setUp(self):
+        self.create_orders_user('stateless@example.com', can_create=True, can_read_own=True)
+        self.tokens = self.login()
+        self.orders_list_url = reverse('orders-list')
+
+    def test_request_is_authorized_from_token(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.tokens['token'])
+        # Версия заказов для ETag без общего кэша читается из БД раз в VERSIONS_LOCAL_TTL
+        self.client.get(self.orders_list_url)
+
+        # Ни пользователя, ни прав из БД, а сам список — из кэша ответов
+        with self.assertNumQueries(0):
+            response = self.client.get(self.orders_list_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    @override_settings(VERSIONS_LOCAL_TTL=0.2)
+    def test_token_stays_valid_after_local_version_ttl(self):
+        caches['default'].clear()
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.tokens['token'])
+        self.client.get(self.orders_list_url)
+
+        # Версии истекли в кэше воркера, но в БД те же — токен по-прежнему актуален
+        time.sleep(0.3)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.orders_list_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # Перечитываются только счётчики версий (и, по своему интервалу, отзывы) — ни пользователя, ни прав
+        tables = {re.search(r'FROM "(\w+)"', query['sql']).group(1) for query in ctx.captured_queries}
+        self.assertIn(VersionCounter._meta.db_table, tables)
+        self.assertFalse(tables & {User._meta.db_table, Role._meta.db_table, Permission._meta.db_table})
+
+        with self.assertNumQueries(0):
+            self.client.get(self.orders_list_url)
+
+    def test_refresh_token_is_not_an_access_token(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.tokens['refresh'])
+        self.assertEqual(self.client.get(self.orders_list_url).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_stale_token_falls_back_and_refresh_reissues(self):
+        self.perm.can_read_own = False
+        self.perm.save()
+
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.tokens['token'])
+        self.assertEqual(self.client.get(self.orders_list_url).status_code, status.HTTP_403_FORBIDDEN)
+
+        response = self.client.post(reverse('token-refresh'), {'refresh': self.tokens['refresh']})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response.data['token'], self.tokens['token'])
+
+    def test_deactivation_and_role_change_invalidate_token(self):
+        user = User.objects.get(email='stateless@example.com')
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.tokens['token'])
+        self.assertEqual(self.client.get(self.orders_list_url).status_code, status.HTTP_200_OK)
+
+        user.role = Role.objects.create(name='no-orders')
+        user.save()
+        self.assertEqual(self.client.get(self.orders_list_url).status_code, status.HTTP_403_FORBIDDEN)
+
+        user.role = self.perm.role
+        user.is_active = False
+        user.save()
+        self.assertEqual(self.client.get(self.orders_list_url).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_permission_claims_require_stateless_mode(self):
+        user = User.objects.create(email='forged@example.com', password_hash='x', role=Role.objects.create(name='none'))
+        token = generate_jwt_token(
+            user.id, 'none', email=user.email, role_id=user.role_id,
+            perms={'orders': READ_ALL}, pv=get_version(RBAC_VERSION_KEY), uv=get_version(user_version_key(user.id)),
+        )
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + token)
+        self.assertEqual(self.client.get(self.orders_list_url).status_code, status.HTTP_200_OK)
+
+        with override_settings(JWT_STATELESS_AUTH=False):
+            self.assertEqual(self.client.get(self.orders_list_url).status_code, status.HTTP_403_FORBIDDEN)
+
+
+class OrderPaginationTests(OrdersUserMixin, APITestCase):
+    def setUp(self):
+        self.create_orders_user('pages@example.com', role_name='admin', can_read_all=True)
+        self.login()
+        self.orders_list_url = reverse('orders-list')
+
+    def test_cursor_walks_all_orders_once(self):
+        orders = Order.objects.bulk_create(
+            Order(description=f'Order {i}', owner=self.user) for i in range(5)
+        )
+        # Одинаковый created_at — порядок должен держаться на id
+        Order.objects.filter(id__in=[o.id for o in orders[:3]]).update(created_at=orders[0].created_at)
+
+        seen = []
+        url = self.orders_list_url + '?page_size=2'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen += [item['id'] for item in response.data['results']]
+            url = response.data['next']
+
+        self.assertEqual(sorted(seen), sorted(o.id for o in orders))
+        self.assertEqual(len(seen), len(set(seen)))
+
+    def test_list_query_count_is_constant(self):
+        Order.objects.bulk_create(Order(description=f'Order {i}', owner=self.user) for i in range(1000))
+        self.client.get(self.orders_list_url)
+
+        # Пользователь и права закэшированы: один запрос на страницу, без запросов за владельцами
+        with self.assertNumQueries(1):
+            response = self.client.get(self.orders_list_url + '?page_size=1000')
+        self.assertEqual(len(response.data['results']), 1000)
+
+    def test_list_format_matches_serializer(self):
+        from .views import OrderSerializer
+
+        order = Order.objects.create(description='Same format', owner=self.user)
+        response = self.client.get(self.orders_list_url)
+        self.assertEqual(response.data['results'], [OrderSerializer(order).data])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.orders_list_url + '?cursor=garbage')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class OrderExportTests(OrdersUserMixin, APITestCase):
+    def setUp(self):
+        self.create_orders_user('export@example.com', can_read_own=True)
+        other = User.objects.create(email='other@example.com', role=self.role)
+
+        Order.objects.create(description='Mine, "quoted"', owner=self.user)
+        Order.objects.create(description='Not mine', owner=other)
+
+        self.login()
+        self.export_url = reverse('orders-export')
+
+    def test_ndjson_export_respects_scope(self):
+        response = self.client.get(self.export_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)['description'] for line in lines], ['Mine, "quoted"'])
+
+    def test_csv_export(self):
+        response = self.client.get(self.export_url + '?export_format=csv')
+        rows = list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(rows[0], ['id', 'owner', 'description', 'created_at'])
+        self.assertEqual(rows[1][1:3], ['export@example.com', 'Mine, "quoted"'])
+
+    def test_unknown_format(self):
+        response = self.client.get(self.export_url + '?export_format=xml')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(ORDERS_EXPORT_CHUNK_SIZE=1)
+    async def test_asgi_export_streams_batches(self):
+        await Order.objects.acreate(description='Second', owner=self.user)
+        token = self.client._credentials['HTTP_AUTHORIZATION']
+
+        with mock.patch('django.http.response.sync_to_async') as buffered:
+            response = await self.async_client.get(self.export_url, headers={'Authorization': token})
+            self.assertTrue(response.is_async)
+            chunks = [chunk async for chunk in response.streaming_content]
+
+        # Пачки приходят по одной, без чтения всей выгрузки в список
+        buffered.assert_not_called()
+        self.assertEqual(len(chunks), 2)
+        self.assertEqual([json.loads(chunk)['description'] for chunk in chunks], ['Mine, "quoted"', 'Second'])
+
+
+class OrderBulkTests(OrdersUserMixin, APITestCase):
+    def setUp(self):
+        self.create_orders_user('bulk@example.com', can_create=True, can_read_own=True, can_update_own=True)
+        other = User.objects.create(email='stranger@example.com', role=self.role)
+
+        self.mine = Order.objects.create(description='Mine', owner=self.user)
+        self.foreign = Order.objects.create(description='Foreign', owner=other)
+
+        self.login()
+        self.bulk_url = reverse('orders-bulk')
+
+    def test_per_item_results(self):
+        response = self.client.post(self.bulk_url, {'operations': [
+            {'op': 'create', 'description': 'New 1'},
+            {'op': 'create', 'description': 'New 2'},
+            {'op': 'update', 'id': self.mine.id, 'description': 'Updated'},
+            {'op': 'update', 'id': self.foreign.id, 'description': 'Hijacked'},
+            {'op': 'delete', 'id': self.mine.id},
+            {'op': 'create'},
+        ]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        codes = [item['status'] for item in response.data['results']]
+        self.assertEqual(codes, [201, 201, 200, 404, 403, 400])
+
+        self.mine.refresh_from_db()
+        self.foreign.refresh_from_db()
+        self.assertEqual(self.mine.description, 'Updated')
+        self.assertEqual(self.foreign.description, 'Foreign')
+        self.assertEqual(Order.objects.filter(owner=self.user).count(), 3)
+
+    def test_batch_is_applied_in_constant_queries(self):
+        operations = [{'op': 'create', 'description': f'Order {i}'} for i in range(1000)]
+        self.client.post(self.bulk_url, {'operations': operations[:1]}, format='json')
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.bulk_url, {'operations': operations}, format='json')
+        self.assertEqual(len(response.data['results']), 1000)
+        # Пачки INSERT, точки сохранения и счётчики версий, а не запрос на каждый заказ
+        self.assertLess(len(queries), 12)
+
+    def test_mixed_update_delete_batch_is_applied_in_constant_queries(self):
+        self.perm.can_delete_own = True
+        self.perm.save()
+        self.client.post(self.bulk_url, {'operations': [
+            {'op': 'create', 'description': f'Order {i}'} for i in range(400)
+        ]}, format='json')
+        ids = list(Order.objects.filter(owner=self.user).order_by('id').values_list('id', flat=True))
+        operations = [{'op': 'update', 'id': pk, 'description': 'Updated'} for pk in ids[:200]] + \
+            [{'op': 'delete', 'id': pk} for pk in ids[200:]]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.bulk_url, {'operations': operations}, format='json')
+
+        self.assertEqual([item['status'] for item in response.data['results']], [200] * 200 + [204] * 201)
+        # Выборка, пачки UPDATE, один DELETE, счётчики статистики и версий — не запросы на каждый заказ
+        self.assertLess(len(queries), 20)
+        self.assertEqual(Order.objects.filter(owner=self.user, description='Updated').count(), 200)
+        self.assertEqual(order_stats(owner=self.user)['total'], 200)
+
+
+@override_settings(BCRYPT_ROUNDS=4, USERS_IMPORT_BATCH_SIZE=2, USERS_IMPORT_WORKERS=2)
+class UserImportTests(APITestCase):
+    def setUp(self):
+        self.admin_role = Role.objects.create(name='admin')
+        self.user_role = Role.objects.create(name='user')
+        resource = Resource.objects.create(code='users')
+        Permission.objects.create(role=self.admin_role, resource=resource, can_create=True)
+
+        for email, role in (('import-admin@example.com', self.admin_role), ('plain@example.com', self.user_role)):
+            user = User(email=email, role=role)
+            user.set_password('password123')
+            user.save()
+        self.import_url = reverse('users-import')
+
+    def login(self, email, password='password123'):
+        response = self.client.post(reverse('login'), {'email': email, 'password': password})
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + response.data.get('token', ''))
+        return response
+
+    def post_ndjson(self, records, query=''):
+        body = '\n'.join(r if isinstance(r, str) else json.dumps(r) for r in records)
+        return self.client.generic('POST', self.import_url + query, body, content_type='application/x-ndjson')
+
+    def test_import_reports_errors_per_row(self):
+        self.login('import-admin@example.com')
+        response = self.post_ndjson([
+            {'first_name': 'A', 'email': 'a@example.com', 'password': 'secret-a', 'role': 'user'},
+            {'first_name': 'Dup', 'email': 'plain@example.com', 'password': 'x'},
+            '{not json',
+            {'first_name': 'A2', 'email': 'a@example.com', 'password': 'x'},
+            {'first_name': 'Bad', 'email': 'not-an-email', 'password': 'x'},
+            {'first_name': 'R', 'email': 'r@example.com', 'password': 'x', 'role': 'nope'},
+            {'first_name': 'B', 'last_name': 'B', 'email': 'b@example.com', 'password': 'secret-b'},
+        ], query='?role=user')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual([error['row'] for error in response.data['errors']], [2, 3, 4, 5, 6])
+        self.assertEqual(response.data['checkpoint'], 7)
+        self.assertTrue(response.data['complete'])
+
+        self.assertEqual(User.objects.get(email='b@example.com').role, self.user_role)
+        self.assertEqual(self.login('a@example.com', 'secret-a').status_code, status.HTTP_200_OK)
+
+    def test_overlong_password_is_a_row_error(self):
+        self.login('import-admin@example.com')
+        response = self.post_ndjson([
+            {'first_name': 'Long', 'email': 'long@example.com', 'password': 'ж' * 40},
+            {'first_name': 'Ok', 'email': 'ok@example.com', 'password': 'x' * 72},
+        ])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual([(error['row'], list(error['errors'])) for error in response.data['errors']],
+                         [(1, ['password'])])
+        self.assertFalse(User.objects.filter(email='long@example.com').exists())
+
+    def test_limit_returns_checkpoint_to_resume_from(self):
+        self.login('import-admin@example.com')
+        records = [{'first_name': str(i), 'email': f'u{i}@example.com', 'password': 'x'} for i in range(3)]
+
+        with override_settings(USERS_IMPORT_MAX_ROWS=2):
+            first = self.post_ndjson(records)
+            second = self.post_ndjson(records, query=f"?start={first.data['checkpoint']}")
+        self.assertEqual((first.data['created'], first.data['checkpoint'], first.data['complete']), (2, 2, False))
+        self.assertEqual((second.data['created'], second.data['checkpoint'], second.data['complete']), (1, 3, True))
+
+    @override_settings(USERS_IMPORT_BATCH_SIZE=2)
+    def test_malformed_stream_returns_last_checkpoint(self):
+        self.login('import-admin@example.com')
+        body = (
+            'first_name,email,password\n'
+            'A,a@example.com,x\nB,b@example.com,x\n'
+            f"{'C' * 80},c@example.com,x\n"
+        ).encode('utf-8') + b'D,\xff@example.com,x\n'
+        response = self.client.generic('POST', self.import_url, body, content_type='text/csv')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual((response.data['created'], response.data['checkpoint'], response.data['complete']),
+                         (2, 2, False))
+        self.assertEqual(set(User.objects.filter(email__in=['a@example.com', 'b@example.com', 'c@example.com'])
+                             .values_list('email', flat=True)), {'a@example.com', 'b@example.com'})
+
+    def test_requires_users_create_permission(self):
+        self.login('plain@example.com')
+        response = self.post_ndjson([{'first_name': 'X', 'email': 'x@example.com', 'password': 'x'}])
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertFalse(User.objects.filter(email='x@example.com').exists())
+
+    def test_command_resumes_from_checkpoint(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'users.csv'
+            path.write_text(
+                'first_name,last_name,email,password\n'
+                'Skip,,skip@example.com,x\n'
+                'One,,one@example.com,x\n'
+                'Two,,plain@example.com,x\n'
+                'Three,,three@example.com,x\n'
+            )
+            Path(f'{path}.checkpoint').write_text(json.dumps({'row': 1}))
+
+            call_command('import_users', str(path), '--role', 'user', stdout=StringIO())
+
+            self.assertFalse(Path(f'{path}.checkpoint').exists())
+            errors = [json.loads(line) for line in Path(f'{path}.errors').read_text().splitlines()]
+        self.assertEqual([(error['row'], error['email']) for error in errors], [(3, 'plain@example.com')])
+        self.assertEqual(
+            sorted(User.objects.filter(role=self.user_role).values_list('email', flat=True)),
+            ['one@example.com', 'plain@example.com', 'three@example.com'],
+        )
+
+
+class IdempotencyKeyTests(OrdersUserMixin, APITestCase):
+    def setUp(self):
+        self.create_orders_user('retry@example.com', can_create=True, can_read_own=True)
+        self.login()
+        self.orders_list_url = reverse('orders-list')
+
+    def post(self, data, key):
+        return self.client.post(self.orders_list_url, data, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_stored_response(self):
+        first = self.post({'description': 'Once'}, 'key-1')
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+
+        with CaptureQueriesContext(connection) as ctx:
+            retry = self.post({'description': 'Once'}, 'key-1')
+        self.assertEqual((retry.status_code, retry.data), (first.status_code, first.data))
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertFalse([q for q in ctx.captured_queries if 'core_order' in q['sql'].replace('core_order_', '')])
+        self.assertEqual(Order.objects.count(), 1)
+
+        self.assertEqual(self.post({'description': 'Other'}, 'key-1').status_code,
+                         status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(self.post({'description': 'Once'}, 'key-2').status_code, status.HTTP_201_CREATED)
+
+    def test_failed_request_releases_key(self):
+        self.assertEqual(self.post({}, 'key-1').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.post({'description': 'Fixed'}, 'key-1').status_code, status.HTTP_201_CREATED)
+
+    def test_order_and_response_commit_together(self):
+        with mock.patch('core.views.store_idempotent_response', side_effect=DatabaseError('disk I/O error')):
+            with self.assertRaises(DatabaseError):
+                self.post({'description': 'Lost'}, 'key-1')
+        # Откатились вместе: ни заказа, ни занятого ключа
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+        @contextmanager
+        def failing_commit(*args, **kwargs):
+            yield
+            raise DatabaseError('commit failed')
+
+        with mock.patch('core.views.transaction', atomic=failing_commit):
+            with self.assertRaises(DatabaseError):
+                self.post({'description': 'Unknown'}, 'key-2')
+        # Исход коммита неизвестен — ключ не освобождается
+        self.assertTrue(IdempotencyKey.objects.filter(key='key-2').exists())
+
+    @override_settings(ORDERS_GROUP_COMMIT=True)
+    def test_keyed_create_bypasses_group_commit(self):
+        with mock.patch('core.views.get_group_writer') as writer:
+            response = self.post({'description': 'Direct'}, 'key-1')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        writer.assert_not_called()
+        self.assertTrue(Order.objects.filter(id=response.data['id']).exists())
+
+    def test_duplicate_waits_for_in_flight_request(self):
+        self.post({'description': 'Slow'}, 'key-1')
+        # Как будто первый запрос ещё выполняется
+        IdempotencyKey.objects.filter(key='key-1').update(status_code=None, response=None)
+        payload = {'id': 42, 'description': 'Slow'}
+
+        def finish(delay):
+            store_idempotent_response(self.user.id, 'key-1', status.HTTP_201_CREATED, payload)
+
+        with mock.patch('core.idempotency.time.sleep', side_effect=finish) as sleep:
+            response = self.post({'description': 'Slow'}, 'key-1')
+        self.assertTrue(sleep.called)
+        self.assertEqual((response.status_code, response.data), (status.HTTP_201_CREATED, payload))
+        self.assertEqual(Order.objects.count(), 1)
+
+        IdempotencyKey.objects.filter(key='key-1').update(status_code=None, response=None)
+        with override_settings(IDEMPOTENCY_WAIT_TIMEOUT=0):
+            response = self.post({'description': 'Slow'}, 'key-1')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+    def test_expired_keys_are_swept_and_reusable(self):
+        self.post({'description': 'Old'}, 'old')
+        self.post({'description': 'Fresh'}, 'fresh')
+        IdempotencyKey.objects.filter(key='old').update(expires_at=timezone.now())
+
+        self.assertEqual(sweep_expired_keys(force=True), 1)
+        self.assertEqual(list(IdempotencyKey.objects.values_list('key', flat=True)), ['fresh'])
+        self.assertEqual(self.post({'description': 'Old'}, 'old').status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Order.objects.count(), 3)
+
+
+class AsyncAuthViewsTests(TestCase):
+    def setUp(self):
+        self.factory = AsyncRequestFactory()
+        self.role = Role.objects.create(name='user')
+
+    async def test_register_and_login(self):
+        request = self.factory.post('/api/register/', {
+            'first_name': 'Async', 'email': 'async@example.com',
+            'password': 'password123', 'password_repeat': 'password123',
+        }, content_type='application/json')
+        response = await AsyncRegisterView.as_view()(request)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        request = self.factory.post('/api/login/', {'email': 'async@example.com', 'password': 'wrong'},
+                                    content_type='application/json')
+        response = await AsyncLoginView.as_view()(request)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        request = self.factory.post('/api/login/', {'email': 'async@example.com', 'password': 'password123'},
+                                    content_type='application/json')
+        response = await AsyncLoginView.as_view()(request)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('token', json.loads(response.content))
+
+    async def test_full_pool_rejects_immediately(self):
+        pool = HashingPool(workers=1, queue_size=0)
+        release = threading.Event()
+        busy = asyncio.ensure_future(pool.run(release.wait))
+        await asyncio.sleep(0)
+
+        with self.assertRaises(HashingPoolFull):
+            await pool.run(lambda: None)
+
+        release.set()
+        await busy
+
+    async def test_cancelled_request_keeps_slot_until_hash_finishes(self):
+        pool = HashingPool(workers=1, queue_size=0)
+        release = threading.Event()
+        self.addCleanup(release.set)
+        started = threading.Event()
+
+        def slow_hash():
+            started.set()
+            release.wait()
+
+        busy = asyncio.ensure_future(pool.run(slow_hash))
+        await asyncio.to_thread(started.wait)
+        busy.cancel()
+        await asyncio.sleep(0)
+
+        # Запрос отменён, но bcrypt ещё считает — поток занят, новый запрос не принимается
+        with self.assertRaises(HashingPoolFull):
+            await asyncio.wait_for(pool.run(lambda: None), timeout=1)
+
+        # Следующая задача единственного потока начнётся после завершения bcrypt и освобождения слота
+        release.set()
+        await asyncio.wrap_future(pool._executor.submit(lambda: None))
+        self.assertEqual(await pool.run(lambda: 'hashed'), 'hashed')
+
+
+class PasswordRehashTests(APITestCase):
+    @override_settings(BCRYPT_ROUNDS=4)
+    def setUp(self):
+        self.user = User(email='rehash@example.com')
+        self.user.set_password('password123')
+        self.user.save()
+
+    @override_settings(BCRYPT_ROUNDS=5)
+    def test_login_rehashes_with_configured_cost(self):
+        response = self.client.post(reverse('login'), {'email': 'rehash@example.com', 'password': 'password123'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.user.refresh_from_db()
+        self.assertEqual(password_cost(self.user.password_hash), 5)
+        self.assertTrue(self.user.check_password('password123'))
+
+    @override_settings(BCRYPT_ROUNDS=5)
+    def test_wrong_password_does_not_rehash(self):
+        self.assertFalse(self.user.check_password('wrong'))
+        self.user.refresh_from_db()
+        self.assertEqual(password_cost(self.user.password_hash), 4)
+
+
+class CalibrateBcryptTests(SimpleTestCase):
+    def test_prints_and_persists_setting(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            env_file = Path(tmp) / '.env'
+            env_file.write_text('DEBUG=True\nBCRYPT_ROUNDS=12\n')
+            out = StringIO()
+
+            call_command('calibrate_bcrypt', '--min-rounds', '4', '--max-rounds', '4', '--samples', '1',
+                         '--env-file', str(env_file), stdout=out)
+
+            self.assertIn('export BCRYPT_ROUNDS=4', out.getvalue())
+            self.assertEqual(env_file.read_text(), 'DEBUG=True\nBCRYPT_ROUNDS=4\n')
+
+
+class OrderConditionalGetTests(OrdersUserMixin, APITestCase):
+    def setUp(self):
+        self.create_orders_user('etag@example.com', can_create=True, can_read_own=True)
+        self.order = Order.objects.create(description='Cached', owner=self.user)
+        self.login()
+        self.orders_list_url = reverse('orders-list')
+
+    def test_list_not_modified_without_queries(self):
+        etag = self.client.get(self.orders_list_url)['ETag']
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.orders_list_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_write_changes_etag(self):
+        etag = self.client.get(self.orders_list_url)['ETag']
+        detail_url = reverse('orders-detail', args=[self.order.id])
+        detail_etag = self.client.get(detail_url)['ETag']
+
+        self.client.post(self.orders_list_url, {'description': 'New'})
+
+        response = self.client.get(self.orders_list_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 2)
+        response = self.client.get(detail_url, HTTP_IF_NONE_MATCH=detail_etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    @override_settings(VERSIONS_SHARED_CACHE=False, VERSIONS_LOCAL_TTL=0.2)
+    def test_etag_is_stable_without_writes(self):
+        caches['default'].clear()
+        etag = self.client.get(self.orders_list_url)['ETag']
+
+        # Ключи версий в LocMemCache истекли — значения перечитываются из БД, а не заводятся заново
+        time.sleep(0.3)
+        response = self.client.get(self.orders_list_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    @override_settings(VERSIONS_SHARED_CACHE=False, VERSIONS_LOCAL_TTL=0.2)
+    def test_write_from_another_process_changes_etag_after_local_ttl(self):
+        caches['default'].clear()
+        etag = self.client.get(self.orders_list_url)['ETag']
+
+        # Запись из другого процесса: версия в LocMemCache этого воркера не поднимается
+        with another_process():
+            self.order.description = 'Changed elsewhere'
+            self.order.save()
+        self.assertEqual(self.client.get(self.orders_list_url, HTTP_IF_NONE_MATCH=etag).status_code,
+                         status.HTTP_304_NOT_MODIFIED)
+
+        time.sleep(0.3)
+        response = self.client.get(self.orders_list_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'][0]['description'], 'Changed elsewhere')
+
+    def test_last_modified_and_etag_precedence(self):
+        with mock.patch('core.views.time') as clock:
+            clock.time.return_value = time.time() + 2
+            response = self.client.get(self.orders_list_url)
+            last_modified = response['Last-Modified']
+
+            response = self.client.get(self.orders_list_url, HTTP_IF_MODIFIED_SINCE=last_modified)
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+            self.assertEqual(response['Last-Modified'], last_modified)
+
+            # Запись в ту же секунду Last-Modified не меняет — решает ETag
+            self.client.post(self.orders_list_url, {'description': 'Same second'})
+            response = self.client.get(self.orders_list_url, HTTP_IF_MODIFIED_SINCE=last_modified,
+                                       HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_no_last_modified_while_its_second_lasts(self):
+        modified_at = get_orders_version(self.user.id)[1]
+        with mock.patch('core.views.time') as clock:
+            clock.time.return_value = int(modified_at) + 0.999
+            response = self.client.get(self.orders_list_url)
+            self.assertFalse(response.has_header('Last-Modified'))
+
+            # Вторая запись в ту же секунду: ответ с одним If-Modified-Since не может быть 304
+            self.client.post(self.orders_list_url, {'description': 'Same second'})
+            response = self.client.get(self.orders_list_url, HTTP_IF_MODIFIED_SINCE=http_date(int(modified_at)))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 2)
+
+    def test_owner_email_change_changes_etag(self):
+        response = self.client.get(self.orders_list_url)
+
+        self.user.email = 'renamed@example.com'
+        self.user.save()
+
+        response = self.client.get(self.orders_list_url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'][0]['owner'], 'renamed@example.com')
+
+
+class OrderResponseCacheTests(OrdersUserMixin, APITestCase):
+    def setUp(self):
+        self.create_orders_user('responses@example.com', role_name='admin',
+                                can_create=True, can_read_all=True, can_delete_all=True)
+        self.order = Order.objects.create(description='First', owner=self.user)
+        self.login()
+        self.orders_list_url = reverse('orders-list')
+
+    def test_repeated_list_is_served_from_cache(self):
+        self.client.get(self.orders_list_url)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.orders_list_url)
+        self.assertEqual(len(response.data['results']), 1)
+
+    def test_writes_invalidate_cached_pages(self):
+        self.client.get(self.orders_list_url)
+
+        self.client.post(self.orders_list_url, {'description': 'Second'})
+        self.assertEqual(len(self.client.get(self.orders_list_url).data['results']), 2)
+
+        self.client.delete(reverse('orders-detail', args=[self.order.id]))
+        self.assertEqual(len(self.client.get(self.orders_list_url).data['results']), 1)
+
+    @override_settings(VERSIONS_SHARED_CACHE=False, VERSIONS_LOCAL_TTL=0.2)
+    def test_write_from_another_process_is_seen_after_local_ttl(self):
+        caches['default'].clear()
+        self.client.get(self.orders_list_url)
+
+        # Запись из другого процесса: версия в LocMemCache этого воркера не поднимается
+        with another_process():
+            self.order.description = 'Changed elsewhere'
+            self.order.save()
+        self.assertEqual(self.client.get(self.orders_list_url).data['results'][0]['description'], 'First')
+
+        time.sleep(0.3)
+        response = self.client.get(self.orders_list_url)
+        self.assertEqual(response.data['results'][0]['description'], 'Changed elsewhere')
+
+    @override_settings(VERSIONS_SHARED_CACHE=True)
+    def test_shared_versions(self):
+        self.client.get(self.orders_list_url)
+        with self.assertNumQueries(0):
+            self.client.get(self.orders_list_url)
+
+        self.client.post(self.orders_list_url, {'description': 'Second'})
+        self.assertEqual(len(self.client.get(self.orders_list_url).data['results']), 2)
+
+
+class OrderDetailAccessTests(OrdersUserMixin, APITestCase):
+    def setUp(self):
+        self.create_orders_user('detail@example.com', can_create=True, can_read_own=True,
+                                can_update_own=True, can_delete_own=True)
+        self.other = User.objects.create(email='detail-other@example.com', password_hash='x', role=self.role)
+        self.order = Order.objects.create(description='Mine', owner=self.user)
+        self.foreign = Order.objects.create(description='Foreign', owner=self.other)
+
+        self.login()
+        # Прогрев: пользователь и права в кэше
+        self.client.get(reverse('orders-stats'))
+
+    def statements(self, queries):
+        # Все команды запроса как (команда, таблица), кроме служебных SAVEPOINT/RELEASE
+        # и счётчиков версий (без общего кэша они хранятся в БД)
+        statements = [
+            (query['sql'].split()[0], re.search(r'\b(?:FROM|UPDATE|INTO)\s+"?(\w+)', query['sql']).group(1))
+            for query in queries
+            if not re.match(r'(SAVEPOINT|RELEASE)\b', query['sql'])
+        ]
+        return [statement for statement in statements if statement[1] != VersionCounter._meta.db_table]
+
+    def test_each_detail_action_is_one_order_statement(self):
+        from .views import OrderSerializer
+
+        url = reverse('orders-detail', args=[self.order.id])
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.data, OrderSerializer(self.order).data)
+        self.assertEqual(self.statements(ctx.captured_queries), [('SELECT', 'core_order')])
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.patch(url, {'description': 'Changed'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.order.refresh_from_db()
+        self.assertEqual(response.data, OrderSerializer(self.order).data)
+        self.assertEqual(self.statements(ctx.captured_queries), [('UPDATE', 'core_order')])
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.delete(url)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        # Кроме самого DELETE — только счётчики статистики из post_delete
+        self.assertEqual(self.statements(ctx.captured_queries), [
+            ('DELETE', 'core_order'), ('UPDATE', 'core_orderownerstat'), ('UPDATE', 'core_orderdailystat'),
+        ])
+        self.assertFalse(Order.objects.filter(id=self.order.id).exists())
+        self.assertEqual(order_stats(owner=self.user)['total'], 0)
+
+    def test_writes_send_model_signals(self):
+        saved, deleted = mock.Mock(), mock.Mock()
+        post_save.connect(saved, sender=Order)
+        post_delete.connect(deleted, sender=Order)
+        self.addCleanup(post_save.disconnect, saved, sender=Order)
+        self.addCleanup(post_delete.disconnect, deleted, sender=Order)
+
+        url = reverse('orders-detail', args=[self.order.id])
+        self.client.patch(url, {'description': 'Changed'})
+        instance = saved.call_args.kwargs['instance']
+        self.assertEqual((instance.pk, instance.description, instance.owner_id),
+                         (self.order.pk, 'Changed', self.user.id))
+        self.assertEqual(saved.call_args.kwargs['update_fields'], {'description'})
+
+        self.client.delete(url)
+        self.assertEqual(deleted.call_args.kwargs['instance'].pk, self.order.pk)
+
+    @mock.patch('core.order_writes._supports_returning', return_value=False)
+    def test_orm_path_without_returning(self, _):
+        from .views import OrderSerializer
+
+        url = reverse('orders-detail', args=[self.order.id])
+        response = self.client.patch(url, {'description': 'Changed'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.order.refresh_from_db()
+        self.assertEqual(response.data, OrderSerializer(self.order).data)
+
+        foreign_url = reverse('orders-detail', args=[self.foreign.id])
+        self.assertEqual(self.client.patch(foreign_url, {'description': 'Hijack'}).status_code,
+                         status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.delete(foreign_url).status_code, status.HTTP_404_NOT_FOUND)
+
+        self.assertEqual(self.client.delete(url).status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(Order.objects.filter(id=self.order.id).exists())
+        self.assertTrue(Order.objects.filter(id=self.foreign.id).exists())
+        self.assertEqual(order_stats(owner=self.user)['total'], 0)
+
+    def test_foreign_order_is_not_found_and_untouched(self):
+        url = reverse('orders-detail', args=[self.foreign.id])
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.put(url, {'description': 'Hijack'}).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.delete(url).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get(reverse('orders-detail', args=['abc'])).status_code,
+                         status.HTTP_404_NOT_FOUND)
+
+        self.foreign.refresh_from_db()
+        self.assertEqual(self.foreign.description, 'Foreign')
+
+    def test_update_invalidates_cached_detail(self):
+        url = reverse('orders-detail', args=[self.order.id])
+        etag = self.client.get(url)['ETag']
+
+        self.client.put(url, {'description': 'Fresh'})
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['description'], 'Fresh')
+
+
+class ReadReplicaRoutingTests(SimpleTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.router = PrimaryReplicaRouter()
+        self.seen = []
+
+        def get_response(request):
+            self.seen.append(self.router.db_for_read(Order) or 'default')
+            return HttpResponse(status=201 if request.method == 'POST' else 200)
+
+        self.middleware = ReadReplicaMiddleware(get_response)
+        self.middleware.replica_alias = 'replica'
+
+    def request(self, method, cookies=None):
+        request = getattr(self.factory, method)('/api/orders/')
+        request.COOKIES.update(cookies or {})
+        return request
+
+    def test_reads_go_to_replica_and_writes_stick_to_primary(self):
+        self.middleware(self.request('get'))
+        response = self.middleware(self.request('post'))
+        # Клиент возвращает cookie — запрос может прийти в любой воркер
+        cookies = {name: morsel.value for name, morsel in response.cookies.items()}
+        self.middleware(self.request('get', cookies))
+        self.middleware(self.request('get'))
+
+        self.assertEqual(self.seen, ['replica', 'default', 'default', 'replica'])
+        self.assertEqual(self.router.db_for_write(Order), 'default')
+        # Вне запроса чтения идут в основную БД
+        self.assertIsNone(self.router.db_for_read(Order))
+
+    def test_sticky_cookie_is_bounded_by_window(self):
+        with mock.patch('core.db_router.time.time', return_value=1000.0):
+            self.middleware(self.request('get', {'db_primary_until': '1004000'}))
+            self.middleware(self.request('get', {'db_primary_until': '999000'}))
+            self.middleware(self.request('get', {'db_primary_until': '99999000'}))
+            self.middleware(self.request('get', {'db_primary_until': 'garbage'}))
+
+        self.assertEqual(self.seen, ['default', 'replica', 'replica', 'replica'])
+
+
+class ReadReplicaDatabaseTests(OrdersUserMixin, TransactionTestCase):
+    """
+    Две настоящие SQLite-БД: основная (тестовая) и файл-реплика, добавляемая на время теста.
+    """
+    client_class = APIClient
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Реплики нет в настройках тестового запуска — алиас добавляется только для этого класса
+        cls.tmp = tempfile.TemporaryDirectory()
+        connections.settings['replica'] = connections.configure_settings({
+            'default': connections.settings['default'],
+            'replica': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': str(Path(cls.tmp.name) / 'replica.sqlite3')},
+        })['replica']
+        cls.databases = {'default', 'replica'}
+
+    @classmethod
+    def tearDownClass(cls):
+        connections['replica'].close()
+        del connections['replica']
+        del connections.settings['replica']
+        cls.databases = {'default'}
+        cls.tmp.cleanup()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.create_orders_user('replica@example.com', can_create=True, can_read_own=True)
+        self.order = Order.objects.create(description='Original', owner=self.user)
+        self.login()
+
+    def replicate(self):
+        # "Репликация": копия основной БД в файл реплики
+        connection.ensure_connection()
+        target = sqlite3.connect(connections.settings['replica']['NAME'])
+        connection.connection.backup(target)
+        target.close()
+
+    def descriptions(self):
+        return sorted(item['description'] for item in self.client.get(reverse('orders-list')).data['results'])
+
+    def test_migrate_skips_replica(self):
+        call_command('migrate', database='replica', verbosity=0)
+        self.assertNotIn(Order._meta.db_table, connections['replica'].introspection.table_names())
+
+    def test_reads_use_replica_until_own_write(self):
+        self.replicate()
+        # Отставание реплики: изменение есть только в основной БД, версии не поднимались,
+        # а последняя запись старше окна DATABASE_REPLICA_STICKY_SECONDS
+        Order.objects.filter(pk=self.order.pk).update(description='Changed on primary')
+        VersionCounter.objects.update(modified_at=timezone.now() - datetime.timedelta(minutes=1))
+        caches['default'].clear()
+        # Окно после логина (тоже POST) истекло
+        self.client.cookies.clear()
+
+        self.assertEqual(self.descriptions(), ['Original'])
+
+        self.client.post(reverse('orders-list'), {'description': 'New'})
+        self.assertEqual(self.descriptions(), ['Changed on primary', 'New'])
+
+
+class SqliteProfileTests(SimpleTestCase):
+    """
+    Профиль SQLITE_PRODUCTION на новых соединениях и sqlite_bench поверх настроенных соединений Django.
+    """
+    aliases = {'profile', 'sqlite_bench_default', 'sqlite_bench_production'}
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Алиасы временных БД появляются только во время теста — разрешаем их после проверки databases
+        cls.databases = cls.aliases
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.databases = set()
+        super().tearDownClass()
+
+    @contextmanager
+    def sqlite_database(self, **extra):
+        with tempfile.TemporaryDirectory() as tmp:
+            connections.settings['profile'] = connections.configure_settings({
+                'default': connections.settings['default'],
+                'profile': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': str(Path(tmp) / 'profile.sqlite3'), **extra},
+            })['profile']
+            try:
+                yield connections['profile']
+            finally:
+                connections['profile'].close()
+                del connections['profile']
+                del connections.settings['profile']
+
+    def pragma(self, conn, name):
+        with conn.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    @override_settings(SQLITE_PRODUCTION=True)
+    def test_pragmas_applied_on_connection_created(self):
+        with self.sqlite_database() as conn:
+            self.assertEqual(self.pragma(conn, 'journal_mode'), 'wal')
+            self.assertEqual(self.pragma(conn, 'busy_timeout'), 5000)
+            self.assertEqual(self.pragma(conn, 'synchronous'), 1)  # NORMAL
+
+    @override_settings(SQLITE_PRODUCTION=False)
+    def test_pragmas_not_applied_without_production_profile(self):
+        with self.sqlite_database() as conn:
+            self.assertEqual(self.pragma(conn, 'journal_mode'), 'delete')
+
+    def test_sqlite_bench_runs_through_django_connections(self):
+        out = StringIO()
+        call_command('sqlite_bench', threads=2, duration=0.2, rows=50, owners=5, stdout=out)
+        output = out.getvalue()
+        self.assertIn('production:', output)
+        self.assertIn('Прирост пропускной способности', output)
+        # Временные алиасы профилей не остаются в настройках
+        self.assertNotIn('sqlite_bench_production', connections.settings)
+
+
+class SeedDbCommandTests(APITestCase):
+    def test_synthetic_data_is_visible_to_caches(self):
+        call_command('seed_db', stdout=StringIO())
+        admin_role = Role.objects.get(name='admin')
+        rbac_version = get_version(RBAC_VERSION_KEY)
+        # Матрица прав воркера загружена до генерации
+        permission_matrix.role_masks(admin_role.id)
+
+        call_command('seed_db', roles=3, resources=2, users=10, orders=50, seed=1, batch_size=7, stdout=StringIO())
+
+        self.assertEqual(Role.objects.filter(name__startswith='synthetic-role-').count(), 3)
+        # Синтетические роли x (resource-0, resource-1, orders)
+        self.assertEqual(Permission.objects.filter(role__name__startswith='synthetic-role-').count(), 9)
+        self.assertEqual(User.objects.filter(email__endswith='@seed.local').count(), 10)
+        self.assertEqual(Order.objects.count(), 50)
+        self.assertEqual(order_stats()['total'], 50)
+
+        self.assertNotEqual(get_version(RBAC_VERSION_KEY), rbac_version)
+        role = Role.objects.get(name='synthetic-role-0')
+        _, masks = permission_matrix.role_masks(role.id)
+        self.assertEqual(masks, dict(Permission.objects.filter(role=role).values_list('resource__code', 'access_mask')))
+
+
+class BenchCommandTests(TransactionTestCase):
+    """
+    Короткий прогон bench: потоки ходят в API со своими соединениями, поэтому данные должны быть закоммичены.
+    """
+
+    def test_smoke_run_reports_and_cleans_up(self):
+        role = Role.objects.create(name='user')
+        resource = Resource.objects.create(code='orders')
+        perm = Permission.objects.create(role=role, resource=resource, can_read_own=True)
+        owner = User.objects.create(email='real@example.com', role=role)
+        for i in range(5):
+            Order.objects.create(description=f'Real {i}', owner=owner)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            output = Path(tmp) / 'bench.json'
+            call_command('bench', concurrency=2, duration=0.2, users=2, orders_per_user=3,
+                         mix='list=1,retrieve=1', output=str(output), stdout=StringIO())
+            report = json.loads(output.read_text())
+
+        self.assertGreater(report['total_requests'], 0)
+        self.assertEqual(set(report['operations']), {'list', 'retrieve'})
+        # Данные прогона удалены, чужие роль, ресурс и права не тронуты
+        self.assertFalse(User.objects.filter(email__endswith='@bench.local').exists())
+        self.assertEqual(list(Role.objects.values_list('name', flat=True)), ['user'])
+        self.assertEqual(list(Resource.objects.values_list('code', flat=True)), ['orders'])
+        perm.refresh_from_db()
+        self.assertEqual(perm.access_mask, READ_OWN)
+        # Заказы прогона учтены в статистике при создании и вычтены при удалении — итог прежний
+        self.assertEqual(order_stats()['total'], 5)
+        self.assertEqual(order_stats(owner=owner)['total'], 5)
+
+    def test_cleanup_removes_only_this_run_users(self):
+        role = Role.objects.create(name='user')
+        # Пользователь параллельного прогона на той же БД
+        other_run = User.objects.create(email='other-run@bench.local', role=role)
+
+        call_command('bench', concurrency=2, duration=0.2, users=2, orders_per_user=1,
+                     mix='register=1', stdout=StringIO())
+
+        self.assertEqual(list(User.objects.filter(email__endswith='@bench.local')), [other_run])
+
+    def test_failed_login_does_not_hang(self):
+        with mock.patch('core.management.commands.bench.WorkerState.login', side_effect=RuntimeError('down')):
+            with self.assertRaises(CommandError):
+                call_command('bench', concurrency=2, duration=0.2, users=1, orders_per_user=1, stdout=StringIO())
+        # Ресурс создал сам прогон — он и удалён
+        self.assertFalse(Resource.objects.exists())
+        self.assertFalse(Role.objects.exists())
+
+
+class GroupCommitWriterTests(SimpleTestCase):
+    def test_concurrent_creates_are_coalesced(self):
+        batches = []
+        next_id = iter(range(1, 1000))
+
+        def flush(orders):
+            batches.append(len(orders))
+            for order in orders:
+                order.pk = next(next_id)
+
+        writer = GroupCommitWriter(max_batch=50, max_delay=0.05, flush=flush)
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(writer.submit(Order(description='x'), timeout=5)))
+            for _ in range(20)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sum(batches), 20)
+        self.assertLess(len(batches), 20)
+        self.assertEqual(len({order.pk for order in results}), 20)
+
+    def test_failed_batch_is_retried_per_order(self):
+        def flush(orders):
+            if any(order.description == 'bad' for order in orders):
+                raise ValueError('bad order')
+            for order in orders:
+                order.pk = 1
+
+        writer = GroupCommitWriter(max_batch=10, max_delay=0.01, flush=flush)
+        self.assertEqual(writer.submit(Order(description='good'), timeout=5).pk, 1)
+        with self.assertRaises(ValueError):
+            writer.submit(Order(description='bad'), timeout=5)
+
+    def test_timeout_dequeues_pending_order(self):
+        flushed = []
+        started, release = threading.Event(), threading.Event()
+
+        def flush(orders):
+            started.set()
+            release.wait(5)
+            flushed.extend(order.description for order in orders)
+
+        writer = GroupCommitWriter(max_batch=10, max_delay=0, flush=flush)
+        first = threading.Thread(target=writer.submit, args=(Order(description='first'), 5))
+        first.start()
+        started.wait(5)
+        # Писатель занят первой пачкой, второй заказ ещё в очереди — его можно снять
+        with self.assertRaises(GroupCommitCancelled):
+            writer.submit(Order(description='queued'), timeout=0.05)
+        release.set()
+        first.join()
+        writer.close()
+        self.assertEqual(flushed, ['first'])
+
+    def test_timeout_during_flush_is_outcome_unknown(self):
+        release = threading.Event()
+        writer = GroupCommitWriter(max_batch=10, max_delay=0, flush=lambda orders: release.wait(5))
+        with self.assertRaises(GroupCommitOutcomeUnknown):
+            writer.submit(Order(description='slow'), timeout=0.05)
+        release.set()
+        writer.close()
+
+    def test_close_drains_queue(self):
+        flushed = []
+        # Без close пачка ждала бы max_delay, а при выходе процесса daemon-поток её бы потерял
+        writer = GroupCommitWriter(max_batch=10, max_delay=60,
+                                   flush=lambda orders: flushed.extend(order.description for order in orders))
+        order, future = Order(description='pending'), Future()
+        writer._ensure_started()
+        writer._queue.put((order, future))
+        writer.close(timeout=5)
+        self.assertIs(future.result(timeout=0), order)
+        self.assertEqual(flushed, ['pending'])
+        with self.assertRaises(GroupCommitCancelled):
+            writer.submit(Order(description='late'))
+
+
+@override_settings(ORDERS_GROUP_COMMIT=True)
+class GroupCommitViewTests(OrdersUserMixin, TransactionTestCase):
+    """
+    POST /api/orders/ через писателя с настоящей flush_orders: поток писателя коммитит в ту же тестовую БД.
+    """
+    client_class = APIClient
+
+    def setUp(self):
+        self.create_orders_user('group@example.com', can_create=True, can_read_own=True)
+        self.login()
+
+        self.release = threading.Event()
+        self.release.set()
+
+        def flush(orders):
+            self.release.wait(5)
+            flush_orders(orders)
+
+        self.writer = GroupCommitWriter(max_batch=10, max_delay=0.01, flush=flush)
+        patcher = mock.patch('core.views.get_group_writer', return_value=self.writer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.writer.close, 5)
+
+    def test_create_commits_through_writer(self):
+        response = self.client.post(reverse('orders-list'), {'description': 'Grouped'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Order.objects.get(id=response.data['id']).owner, self.user)
+        self.assertEqual(order_stats(owner=self.user)['total'], 1)
+
+    def test_failed_post_commit_hook_does_not_duplicate_order(self):
+        bump_orders = versions._bump_orders
+
+        def bump_after_commit_fails(owner_ids):
+            # Повторный подъём версий после коммита упирается в блокировку SQLite
+            if not connection.in_atomic_block:
+                raise DatabaseError('database is locked')
+            bump_orders(owner_ids)
+
+        with mock.patch('core.versions._bump_orders', side_effect=bump_after_commit_fails), \
+                self.assertLogs('django.db.backends.base', 'ERROR'):
+            response = self.client.post(reverse('orders-list'), {'description': 'Once'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Order.objects.filter(description='Once').count(), 1)
+
+    @override_settings(ORDERS_GROUP_COMMIT_TIMEOUT=0.05)
+    def test_commit_timeout_reports_unknown_outcome(self):
+        self.release.clear()
+        response = self.client.post(reverse('orders-list'), {'description': 'Slow'})
+        self.assertEqual(response.status_code, status.HTTP_504_GATEWAY_TIMEOUT)
+
+        # Ответ «исход неизвестен» честный: пачка всё-таки коммитится
+        self.release.set()
+        self.writer.close(5)
+        self.assertTrue(Order.objects.filter(description='Slow', owner=self.user).exists())
+
+    @override_settings(ORDERS_GROUP_COMMIT_TIMEOUT=0.05)
+    def test_dequeued_order_is_not_saved(self):
+        self.writer.close(5)
+        response = self.client.post(reverse('orders-list'), {'description': 'Rejected'})
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertFalse(Order.objects.exists())
+
+
+class OrderSearchTests(OrdersUserMixin, APITestCase):
+    def setUp(self):
+        self.create_orders_user('search@example.com', can_create=True, can_read_own=True)
+        other = User.objects.create(email='other-search@example.com', password_hash='x', role=self.role)
+
+        Order.objects.create(description='Доставка мебели, посуды, холодильника и прочей техники на дачу', owner=self.user)
+        Order.objects.create(description='Холодильник: доставка холодильника', owner=self.user)
+        Order.objects.create(description='Ремонт стиральной машины', owner=self.user)
+        Order.objects.create(description='Холодильник для соседа', owner=other)
+
+        self.login()
+        self.search_url = reverse('orders-search')
+
+    def test_search_ranks_and_respects_own_scope(self):
+        response = self.client.get(self.search_url, {'q': 'холодильник'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        descriptions = [row['description'] for row in response.data['results']]
+        # Чужой заказ не виден, более релевантный — первым
+        self.assertEqual(descriptions, [
+            'Холодильник: доставка холодильника',
+            'Доставка мебели, посуды, холодильника и прочей техники на дачу',
+        ])
+
+    def test_index_follows_updates_and_deletes(self):
+        order = Order.objects.get(description='Ремонт стиральной машины')
+        order.description = 'Ремонт посудомойки'
+        order.save()
+
+        self.assertEqual(self.client.get(self.search_url, {'q': 'стиральной'}).data['results'], [])
+        self.assertEqual(len(self.client.get(self.search_url, {'q': 'посудо'}).data['results']), 1)
+
+        order.delete()
+        self.assertEqual(self.client.get(self.search_url, {'q': 'посудомойки'}).data['results'], [])
+
+    def test_search_paginates_by_cursor(self):
+        first = self.client.get(self.search_url, {'q': 'доставка', 'page_size': 1})
+        second = self.client.get(first.data['next'])
+
+        self.assertEqual(len(first.data['results']), 1)
+        self.assertEqual(len(second.data['results']), 1)
+        self.assertNotEqual(first.data['results'][0]['id'], second.data['results'][0]['id'])
+        self.assertIsNone(second.data['next'])
+
+    def test_operators_in_query_are_literal(self):
+        response = self.client.get(self.search_url, {'q': 'холодильник OR "NEAR(*'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get(self.search_url, {'q': '  '}).status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class OrderStatsTests(OrdersUserMixin, APITestCase):
+    def setUp(self):
+        self.create_orders_user('stats@example.com', can_create=True, can_read_own=True, can_delete_own=True)
+        admin_role = Role.objects.create(name='admin')
+        Permission.objects.create(role=admin_role, resource=self.resource, can_read_all=True)
+
+        self.admin = User(email='stats-admin@example.com', role=admin_role)
+        self.admin.set_password(self.PASSWORD)
+        self.admin.save()
+        self.other = User.objects.create(email='stats-other@example.com', password_hash='x', role=self.role)
+
+        self.tokens = {user.email: self.login(user.email)['token'] for user in (self.user, self.admin)}
+        self.stats_url = reverse('orders-stats')
+
+    def get_stats(self, email):
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.tokens[email])
+        return self.client.get(self.stats_url).data
+
+    def snapshot(self):
+        return (
+            sorted(OrderOwnerStat.objects.filter(total__gt=0).values_list('owner_id', 'total')),
+            sorted(OrderDailyStat.objects.filter(total__gt=0).values_list('owner_id', 'day', 'total')),
+        )
+
+    def test_counters_follow_writes_and_match_rebuild(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.tokens['stats@example.com'])
+        created = [self.client.post(reverse('orders-list'), {'description': f'#{i}'}).data['id'] for i in range(3)]
+        Order.objects.create(description='Other', owner=self.other)
+        self.client.delete(reverse('orders-detail', args=[created[0]]))
+        self.client.post(reverse('orders-bulk'), {'operations': [{'op': 'create', 'description': 'Bulk'}]}, format='json')
+
+        incremental = self.snapshot()
+        rebuild_order_stats()
+        self.assertEqual(self.snapshot(), incremental)
+
+        own = self.get_stats('stats@example.com')
+        self.assertEqual(own['total'], 3)
+        self.assertEqual([row['owner'] for row in own['by_owner']], ['stats@example.com'])
+        self.assertEqual(sum(row['total'] for row in own['by_day']), 3)
+
+        everyone = self.get_stats('stats-admin@example.com')
+        self.assertEqual(everyone['total'], 4)
+        self.assertEqual([(row['owner'], row['total']) for row in everyone['by_owner']],
+                         [('stats@example.com', 3), ('stats-other@example.com', 1)])
+
+    def test_decrement_never_creates_rows(self):
+        order = Order(description='Ghost', owner=self.other)
+        order.created_at = Order.objects.create(description='Tmp', owner=self.other).created_at
+        rebuild_order_stats()
+        OrderOwnerStat.objects.filter(owner_id=self.other.id).delete()
+
+        apply_order_changes([order], -1)
+
+        self.assertFalse(OrderOwnerStat.objects.filter(owner_id=self.other.id).exists())
+        self.assertEqual(order_stats()['total'], 0)
+
+    def test_stats_read_is_constant_in_queries(self):
+        for i in range(20):
+            Order.objects.create(description=f'#{i}', owner=self.other)
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.tokens['stats-admin@example.com'])
+        self.client.get(self.stats_url)
+
+        # Итог, по дням, топ владельцев и их email — без GROUP BY по заказам
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.stats_url)
+        self.assertEqual(len(queries), 4)
+        self.assertFalse(any('core_order"' in query['sql'] for query in queries.captured_queries))
+
+
+@override_settings(METRICS_SAMPLE_RATE=1.0)
+class RequestMetricsTests(OrdersUserMixin, APITestCase):
+    def setUp(self):
+        registry.reset()
+        self.create_orders_user('metrics@example.com', can_create=True, can_read_own=True)
+        Order.objects.create(description='Measured', owner=self.user)
+        self.login()
+
+    def test_server_timing_has_phases(self):
+        response = self.client.get(reverse('orders-list'))
+
+        timing = response['Server-Timing']
+        for name in ('total;', 'db;', 'jwt;', 'user;', 'rbac;', 'serialize;'):
+            self.assertIn(name, timing)
+
+    @override_settings(METRICS_SAMPLE_RATE=0.0)
+    def test_unsampled_request_has_no_phases(self):
+        timing = self.client.get(reverse('orders-list'))['Server-Timing']
+
+        self.assertIn('queries', timing)
+        self.assertNotIn('rbac;', timing)
+
+    @override_settings(METRICS_ALLOWED_IPS=['127.0.0.1'])
+    def test_metrics_endpoint_aggregates_by_route(self):
+        self.client.get(reverse('orders-list'))
+        self.client.get(reverse('orders-list'))
+
+        body = self.client.get(reverse('metrics')).content.decode()
+
+        self.assertIn('http_requests_total{route="orders-list",method="GET",status="200"} 2', body)
+        self.assertIn('http_request_duration_seconds_count{route="orders-list",method="GET"} 2', body)
+        self.assertIn('http_request_db_rows_bucket{route="orders-list",method="GET",le="1"} 2', body)
+        self.assertIn('phase="rbac"', body)
+
+    def test_metrics_endpoint_is_restricted(self):
+        # По умолчанию закрыт даже для loopback: за прокси на той же машине это любой клиент
+        self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='127.0.0.1').status_code,
+                         status.HTTP_403_FORBIDDEN)
+
+        self.client.credentials()
+        with override_settings(METRICS_TOKEN='scrape-secret'):
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, status.HTTP_403_FORBIDDEN)
+            response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scrape-secret')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    async def test_db_queries_are_counted_under_asgi(self):
+        token = self.client._credentials['HTTP_AUTHORIZATION']
+        response = await self.async_client.get(reverse('orders-list'), headers={'Authorization': token})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        queries = int(re.search(r'"(\d+) queries"', response['Server-Timing']).group(1))
+        self.assertGreater(queries, 0)
+
+
+@override_settings(JWT_STATELESS_AUTH=True)
+class TokenRevocationTests(OrdersUserMixin, APITestCase):
+    def setUp(self):
+        self.create_orders_user('logout@example.com', can_create=True, can_read_own=True)
+        self.first = self.login()
+        self.second = self.login()
+        self.orders_list_url = reverse('orders-list')
+
+    def get_orders(self, token):
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + token)
+        return self.client.get(self.orders_list_url)
+
+    def test_logout_revokes_only_own_tokens(self):
+        self.assertEqual(self.get_orders(self.first['token']).status_code, status.HTTP_200_OK)
+
+        response = self.client.post(reverse('logout'), {'refresh': self.first['refresh']})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.assertEqual(self.get_orders(self.first['token']).status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(self.get_orders(self.second['token']).status_code, status.HTTP_200_OK)
+        refresh = self.client.post(reverse('token-refresh'), {'refresh': self.first['refresh']})
+        self.assertEqual(refresh.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(VERSIONS_SHARED_CACHE=True, REVOCATION_SHARED_CACHE=True)
+    def test_other_worker_picks_up_revocation(self):
+        other_worker = RevocationList()
+        # Фильтр второго воркера уже загружен — отзыв он увидит по версии в кэше
+        self.assertFalse(other_worker.is_revoked('not-revoked'))
+
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.first['token'])
+        self.client.post(reverse('logout'))
+
+        revoked = RevokedToken.objects.get()
+        self.assertTrue(other_worker.is_revoked(revoked.jti))
+        self.assertFalse(other_worker.is_revoked('not-revoked'))
+
+    def test_expired_entries_are_pruned(self):
+        RevokedToken.objects.create(jti='old', user_id=1, expires_at='2000-01-01T00:00:00Z')
+        RevokedToken.objects.create(jti='fresh', user_id=1, expires_at='2999-01-01T00:00:00Z')
+
+        call_command('prune_revoked_tokens', stdout=StringIO())
+        self.assertEqual(list(RevokedToken.objects.values_list('jti', flat=True)), ['fresh'])
+
+    def test_revoke_prunes_expired_entries_throttled(self):
+        RevokedToken.objects.create(jti='old', user_id=1, expires_at='2000-01-01T00:00:00Z')
+
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.first['token'])
+        self.client.post(reverse('logout'))
+        self.assertFalse(RevokedToken.objects.filter(jti='old').exists())
+
+        # Следующая чистка — только через REVOCATION_PRUNE_INTERVAL
+        RevokedToken.objects.create(jti='older', user_id=1, expires_at='2000-01-01T00:00:00Z')
+        with self.assertNumQueries(0):
+            self.assertEqual(prune_revoked_tokens(), 0)
+
+    @override_settings(REVOCATION_SHARED_CACHE=False, REVOCATION_LOCAL_SYNC_INTERVAL=1)
+    def test_worker_with_local_cache_rechecks_db(self):
+        other_worker = RevocationList()
+        self.assertFalse(other_worker.is_revoked('not-revoked'))
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.first['token'])
+        self.client.post(reverse('logout'))
+        revoked = RevokedToken.objects.get()
+
+        # Версию в кэше второй воркер не смотрит (у него свой LocMemCache) — через интервал он сверится с БД
+        other_worker._synced_at -= 1
+        self.assertTrue(other_worker.is_revoked(revoked.jti))
+
+        # Без общего кэша актуальная 'uv' не избавляет от проверки по фильтру
+        self.assertEqual(self.get_orders(self.first['token']).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_refresh_token_is_rotated(self):
+        response = self.client.post(reverse('token-refresh'), {'refresh': self.first['refresh']})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.get_orders(response.data['token']).status_code, status.HTTP_200_OK)
+
+        # Старый refresh-токен одноразовый, новый работает
+        reused = self.client.post(reverse('token-refresh'), {'refresh': self.first['refresh']})
+        self.assertEqual(reused.status_code, status.HTTP_401_UNAUTHORIZED)
+        rotated = self.client.post(reverse('token-refresh'), {'refresh': response.data['refresh']})
+        self.assertEqual(rotated.status_code, status.HTTP_200_OK)
+
+
+class BloomFilterTests(SimpleTestCase):
+    def test_no_false_negatives_and_bounded_false_positives(self):
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        for i in range(1000):
+            bloom.add(f'jti-{i}')
+
+        self.assertTrue(all(f'jti-{i}' in bloom for i in range(1000)))
+        false_positives = sum(f'other-{i}' in bloom for i in range(10000))
+        self.assertLess(false_positives, 300)
+
+
+class PrebuiltSchemaTests(SimpleTestCase):
+    def test_serves_built_file_with_cache_headers(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.addCleanup(reset_schema_files)
+        self.schema_dir = Path(tmp.name)
+        with redirect_stderr(StringIO()):
+            call_command('build_schema', output_dir=tmp.name, stdout=StringIO())
+
+        with override_settings(SCHEMA_DIR=self.schema_dir):
+            self.assert_schema_served()
+
+    def assert_schema_served(self):
+        response = self.client.get(reverse('schema'), {'format': 'json'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, (self.schema_dir / 'openapi.json').read_bytes())
+        self.assertIn('/api/orders/search/', json.loads(response.content)['paths'])
+        self.assertIn('max-age=', response['Cache-Control'])
+
+        digest = (self.schema_dir / 'openapi.json.sha256').read_text().split()[0]
+        self.assertEqual(response['ETag'], f'"{digest}"')
+        self.assertEqual(self.client.get(reverse('schema'), {'format': 'json'}, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        immutable = self.client.get(reverse('schema-immutable', args=[digest]), {'format': 'json'})
+        self.assertIn('immutable', immutable['Cache-Control'])
+        self.assertEqual(self.client.get(reverse('schema-immutable', args=['0' * 64])).status_code, 404)
+
+    def test_rebuilt_file_is_reloaded_by_mtime(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.addCleanup(reset_schema_files)
+        path = Path(tmp.name) / 'openapi.json'
+        path.write_bytes(b'{"v": 1}')
+
+        with override_settings(SCHEMA_DIR=Path(tmp.name)):
+            first = self.client.get(reverse('schema'), {'format': 'json'})
+            path.write_bytes(b'{"v": 2}')
+            os.utime(path, ns=(path.stat().st_atime_ns, path.stat().st_mtime_ns + 10 ** 9))
+            second = self.client.get(reverse('schema'), {'format': 'json'})
+
+        self.assertEqual(first.content, b'{"v": 1}')
+        self.assertEqual(second.content, b'{"v": 2}')
+        self.assertNotEqual(first['ETag'], second['ETag'])
+
+    def test_generation_keeps_default_schema_class(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        with redirect_stderr(StringIO()):
+            call_command('build_schema', output_dir=tmp.name, format='json', stdout=StringIO())
+
+        # AutoSchema drf_spectacular включается только на время генерации
+        self.assertIs(api_settings.DEFAULT_SCHEMA_CLASS, AutoSchema)
+        # Отложенные extend_schema/OpenApiParameter попали в схему
+        search = json.loads((Path(tmp.name) / 'openapi.json').read_text())['paths']['/api/orders/search/']['get']
+        self.assertIn('q', [parameter['name'] for parameter in search['parameters']])
+        self.assertEqual(search['description'], 'Полнотекстовый поиск по описанию, по релевантности: ?q=')
+
+    def test_swagger_ui_renders_without_spectacular_app(self):
+        response = self.client.get(reverse('swagger-ui'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'swagger-ui', response.content)
+
+    def test_docs_tooling_is_not_imported_at_startup(self):
+        code = (
+            "import django, sys; django.setup(); import config.urls; "
+            "from django.urls import resolve; resolve('/api/orders/'); "
+            "print(any(m == 'drf_spectacular' or m.startswith('drf_spectacular.') for m in sys.modules))"
+        )
+        result = subprocess.run(
+            [sys.executable, '-c', code], capture_output=True, text=True, check=True,
+            cwd=Path(__file__).resolve().parent.parent, env={'DJANGO_SETTINGS_MODULE': 'config.settings', 'PATH': ''},
+        )
+        self.assertEqual(result.stdout.strip(), 'False')
@@ -1,12 +1,24 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import RegisterView, LoginView, OrderViewSet
+from .views import RegisterView, LoginView, LogoutView, TokenRefreshView, UserImportView, OrderViewSet
+from .async_views import AsyncRegisterView, AsyncLoginView
+from .metrics import metrics_view
 
 router = DefaultRouter()
 router.register(r'orders', OrderViewSet, basename='orders')
 
+if settings.AUTH_ASYNC_VIEWS:
+    register_view, login_view = AsyncRegisterView.as_view(), AsyncLoginView.as_view()
+else:
+    register_view, login_view = RegisterView.as_view(), LoginView.as_view()
+
 urlpatterns = [
-    path('register/', RegisterView.as_view(), name='register'),
-    path('login/', LoginView.as_view(), name='login'),
+    path('register/', register_view, name='register'),
+    path('login/', login_view, name='login'),
+    path('logout/', LogoutView.as_view(), name='logout'),
+    path('token/refresh/', TokenRefreshView.as_view(), name='token-refresh'),
+    path('users/import/', UserImportView.as_view(), name='users-import'),
+    path('metrics/', metrics_view, name='metrics'),
     path('', include(router.urls)),
 ]
\ No newline at end of file
@@ -0,0 +1,177 @@
+import csv
+import itertools
+import json
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import bcrypt
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from rest_framework import serializers
+from .models import Role, User
+
+IMPORT_FORMATS = ('csv', 'ndjson')
+
+# bcrypt учитывает только первые 72 байта пароля, а bcrypt 5 на более длинных бросает ValueError
+BCRYPT_MAX_PASSWORD_BYTES = 72
+
+
+class UserImportRowSerializer(serializers.Serializer):
+    # Те же ограничения, что у модели и регистрации; уникальность email проверяется пачкой
+    first_name = serializers.CharField(max_length=100)
+    last_name = serializers.CharField(max_length=100, required=False, allow_blank=True, default='')
+    email = serializers.EmailField(max_length=254)
+    password = serializers.CharField()
+    role = serializers.CharField(max_length=50, required=False, allow_blank=True)
+
+    def validate_password(self, value):
+        # Иначе hash_passwords упадёт на всю пачку, а не на одну запись
+        if len(value.encode('utf-8')) > BCRYPT_MAX_PASSWORD_BYTES:
+            raise serializers.ValidationError(f'Password is longer than {BCRYPT_MAX_PASSWORD_BYTES} bytes.')
+        return value
+
+
+def read_records(stream, import_format):
+    """
+    Записи входного потока по одной: (номер записи с 1, dict или None, если запись не разобрать).
+    Файл целиком в память не читается.
+    """
+    if import_format == 'csv':
+        yield from enumerate(csv.DictReader(stream), start=1)
+        return
+    number = 0
+    for line in stream:
+        if not line.strip():
+            continue
+        number += 1
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        yield number, record if isinstance(record, dict) else None
+
+
+def hashing_workers():
+    if settings.USERS_IMPORT_WORKERS:
+        return settings.USERS_IMPORT_WORKERS
+    # Ядра, доступные процессу (affinity), а не все ядра машины
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_hashing_executor():
+    """
+    Общий пул процессов для bcrypt при импорте. В процессах считается только bcrypt.hashpw,
+    им не нужны ни Django, ни БД. Процессы стартуют через forkserver (где его нет — spawn):
+    fork многопоточного воркера унаследовал бы его соединения с БД и захваченные блокировки.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+                _executor = ProcessPoolExecutor(max_workers=hashing_workers(),
+                                                mp_context=multiprocessing.get_context(method))
+    return _executor
+
+
+def hash_passwords(passwords, rounds=None):
+    """
+    bcrypt-хеши для списка паролей, параллельно по ядрам. Соль генерируется здесь —
+    это дёшево, а в пул уходит готовая пара (пароль, соль).
+    """
+    if not passwords:
+        return []
+    rounds = rounds or settings.BCRYPT_ROUNDS
+    salts = [bcrypt.gensalt(rounds=rounds) for _ in passwords]
+    chunksize = max(1, len(passwords) // (hashing_workers() * 4))
+    encoded = [password.encode('utf-8') for password in passwords]
+    hashed = get_hashing_executor().map(bcrypt.hashpw, encoded, salts, chunksize=chunksize)
+    return [value.decode('utf-8') for value in hashed]
+
+
+class UserImporter:
+    """
+    Массовое создание пользователей пачками по batch_size записей:
+    валидация, отсев дублей (внутри пачки и по уникальному индексу — одним запросом),
+    хеширование в пуле процессов и bulk_create в отдельной транзакции на пачку.
+    После каждой пачки известна контрольная точка — номер последней обработанной записи:
+    с неё импорт можно продолжить, а повтор уже загруженных записей даст лишь дубли.
+    """
+
+    def __init__(self, batch_size=None, default_role=None):
+        self.batch_size = batch_size or settings.USERS_IMPORT_BATCH_SIZE
+        # Ролей немного — разрешаем имена без запроса на каждую запись
+        self.roles = dict(Role.objects.values_list('name', 'id'))
+        if default_role and default_role not in self.roles:
+            raise ValueError(f'Unknown role: {default_role}')
+        self.default_role_id = self.roles.get(default_role) if default_role else None
+
+    def run(self, records):
+        """
+        Генератор результатов по пачкам: {'checkpoint', 'created', 'errors'}.
+        """
+        records = iter(records)
+        while True:
+            batch = list(itertools.islice(records, self.batch_size))
+            if not batch:
+                return
+            yield self.import_batch(batch)
+
+    def import_batch(self, batch):
+        errors = []
+        valid = {}
+        for number, record in batch:
+            if record is None:
+                errors.append({'row': number, 'email': None, 'errors': {'non_field_errors': ['Malformed record.']}})
+                continue
+            row = UserImportRowSerializer(data=record)
+            if not row.is_valid():
+                errors.append({'row': number, 'email': record.get('email'), 'errors': row.errors})
+                continue
+            data = row.validated_data
+            role_name = data.pop('role', '')
+            if role_name and role_name not in self.roles:
+                errors.append({'row': number, 'email': data['email'], 'errors': {'role': ['Unknown role.']}})
+            elif data['email'] in valid:
+                errors.append({'row': number, 'email': data['email'],
+                               'errors': {'email': ['Duplicate email in input.']}})
+            else:
+                data['role_id'] = self.roles[role_name] if role_name else self.default_role_id
+                valid[data['email']] = (number, data)
+
+        # Дубли с уже существующими пользователями — одним запросом на пачку
+        for email in User.objects.filter(email__in=list(valid)).values_list('email', flat=True):
+            number, _ = valid.pop(email)
+            errors.append({'row': number, 'email': email, 'errors': {'email': ['User already exists.']}})
+
+        hashes = hash_passwords([data['password'] for _, data in valid.values()])
+        users = {
+            email: User(first_name=data['first_name'], last_name=data['last_name'], email=email,
+                        role_id=data['role_id'], password_hash=password_hash)
+            for (email, (_, data)), password_hash in zip(valid.items(), hashes)
+        }
+
+        while users:
+            try:
+                with transaction.atomic():
+                    User.objects.bulk_create(users.values(), batch_size=500)
+                break
+            except IntegrityError:
+                # Кто-то успел зарегистрироваться с тем же email между проверкой и вставкой
+                taken = set(User.objects.filter(email__in=list(users)).values_list('email', flat=True))
+                if not taken:
+                    raise
+                for email in taken:
+                    del users[email]
+                    errors.append({'row': valid[email][0], 'email': email,
+                                   'errors': {'email': ['User already exists.']}})
+
+        errors.sort(key=lambda error: error['row'])
+        return {'checkpoint': batch[-1][0], 'created': len(users), 'errors': errors}
@@ -1,19 +1,69 @@
 import jwt
 import datetime
+import uuid
 from django.conf import settings
+from .rbac import permission_matrix
+from .versions import get_version, user_version_key
 
 
-def generate_jwt_token(user_id, role_name):
+def generate_jwt_token(user_id, role_name, lifetime=None, **claims):
     """
     Генерирует JWT токен вручную, используя библиотеку pyjwt.
     """
+    lifetime = lifetime or datetime.timedelta(hours=24)  # По умолчанию токен живет 24 часа
     payload = {
         'user_id': user_id,
         'role': role_name,
-        'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=24),  # Токен живет 24 часа
-        'iat': datetime.datetime.utcnow()  # Время создания
+        'exp': datetime.datetime.utcnow() + lifetime,
+        'iat': datetime.datetime.utcnow(),  # Время создания
+        'jti': uuid.uuid4().hex,  # Идентификатор токена — по нему работает отзыв (logout)
+        **claims,
     }
 
     # Используем SECRET_KEY из settings.py для подписи
     token = jwt.encode(payload, settings.SECRET_KEY, algorithm='HS256')
-    return token
\ No newline at end of file
+    return token
+
+
+def generate_stateless_token(user):
+    """
+    Короткоживущий access-токен со снимком прав роли.
+    Middleware и RBCPermission авторизуют по нему без запросов в БД,
+    пока версия прав ('pv') и версия самого пользователя ('uv': роль, активность) совпадают с текущими.
+    """
+    version, masks = permission_matrix.role_masks(user.role_id)
+    return generate_jwt_token(
+        user.id,
+        user.role.name if user.role else 'guest',
+        lifetime=datetime.timedelta(seconds=settings.JWT_ACCESS_TOKEN_LIFETIME),
+        email=user.email,
+        role_id=user.role_id,
+        perms=masks,
+        pv=version,
+        uv=get_version(user_version_key(user.id)),
+    )
+
+
+def generate_refresh_token(user):
+    """
+    Долгоживущий refresh-токен. Годится только для /api/token/refresh/, не для доступа к API.
+    """
+    return generate_jwt_token(
+        user.id,
+        user.role.name if user.role else 'guest',
+        lifetime=datetime.timedelta(seconds=settings.JWT_REFRESH_TOKEN_LIFETIME),
+        type='refresh',
+    )
+
+
+def issue_tokens(user):
+    """
+    Набор токенов для ответа Login/Refresh в зависимости от режима авторизации.
+    """
+    role_name = user.role.name if user.role else 'guest'
+    if not settings.JWT_STATELESS_AUTH:
+        return {"token": generate_jwt_token(user.id, role_name)}
+    return {
+        "token": generate_stateless_token(user),
+        "refresh": generate_refresh_token(user),
+    }
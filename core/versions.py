@@ -0,0 +1,169 @@
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import router, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from .models import VersionCounter
+
+# Дешёвые счётчики версий. По ним воркеры понимают, что их in-process данные устарели.
+# С общим backend'ом кэша (Redis/Memcached, VERSIONS_SHARED_CACHE) счётчики живут только в нём.
+# Без него источник — таблица VersionCounter, а кэш воркера держит прочитанное значение
+# не дольше VERSIONS_LOCAL_TTL: изменения из других процессов доходят с этой задержкой,
+# а пока данные не менялись, версия остаётся прежней.
+VERSION_TIMEOUT = None  # С общим кэшем счётчики не протухают
+
+
+def version_timeout():
+    """
+    Срок жизни счётчика в кэше. Без общего кэша (VERSIONS_SHARED_CACHE) изменения из других процессов
+    (воркеры, manage.py shell, seed_db) видны только в БД, поэтому значение перечитывается оттуда
+    раз в VERSIONS_LOCAL_TTL.
+    """
+    if settings.VERSIONS_SHARED_CACHE:
+        return VERSION_TIMEOUT
+    return settings.VERSIONS_LOCAL_TTL
+
+
+ORDERS_VERSION_KEY = 'orders:version'
+
+
+def _initial_version():
+    # Если ключ пропал из общего кэша (вытеснен), начинаем с метки времени — старая версия не повторится
+    return time.time_ns()
+
+
+def _counters():
+    # Счётчики — в основной БД: отставшая реплика вернула бы старую версию для уже изменённых данных
+    return VersionCounter.objects.using(router.db_for_write(VersionCounter))
+
+
+def _load_stored(keys):
+    """
+    Читает счётчики из БД одним запросом и кладёт их в кэш воркера вместе со временем
+    изменения ('<ключ>:ts'). Ключа в БД ещё нет — версия 0.
+    """
+    values = dict.fromkeys(keys, 0)
+    stamps = {f'{key}:ts': None for key in keys}
+    for key, value, modified_at in _counters().filter(key__in=keys).values_list('key', 'value', 'modified_at'):
+        values[key] = value
+        stamps[f'{key}:ts'] = modified_at.timestamp() if modified_at is not None else None
+    cache.set_many({**values, **stamps}, timeout=version_timeout())
+    return values
+
+
+def _bump_stored(keys):
+    """
+    Увеличивает счётчики в БД (в транзакции вызывающего, если она есть) и обновляет кэш воркера.
+    Как и в общем кэше, новое значение не меньше метки времени: после отката транзакции
+    номер, который уже успели увидеть читатели, не достанется другим данным.
+    """
+    now = timezone.now()
+    floor = time.time_ns()
+    counters = _counters()
+    updated = counters.filter(key__in=keys).update(value=Greatest(F('value') + 1, Value(floor)), modified_at=now)
+    if updated < len(keys):
+        # Первое изменение: заводим недостающие строки
+        counters.bulk_create([VersionCounter(key=key, value=floor, modified_at=now) for key in keys],
+                             ignore_conflicts=True)
+    values = dict(counters.filter(key__in=keys).values_list('key', 'value'))
+    cache.set_many({**values, **{f'{key}:ts': now.timestamp() for key in keys}}, timeout=version_timeout())
+    return values
+
+
+def get_version(key):
+    """
+    Возвращает текущую версию по ключу.
+    """
+    version = cache.get(key)
+    if version is None:
+        if not settings.VERSIONS_SHARED_CACHE:
+            return _load_stored([key])[key]
+        cache.add(key, _initial_version(), timeout=VERSION_TIMEOUT)
+        version = cache.get(key)
+    return version
+
+
+def get_versions(keys):
+    """
+    Текущие версии нескольких ключей: {ключ: версия}.
+    Без общего кэша недостающие в кэше воркера читаются из БД одним запросом.
+    """
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        if settings.VERSIONS_SHARED_CACHE:
+            versions.update((key, get_version(key)) for key in missing)
+        else:
+            versions.update(_load_stored(missing))
+    return versions
+
+
+def bump_version(key):
+    """
+    Увеличивает версию. Вызывается из сигналов при изменении данных.
+    """
+    if not settings.VERSIONS_SHARED_CACHE:
+        return _bump_stored([key])[key]
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Ключа ещё нет (или его вытеснили)
+        cache.add(key, _initial_version(), timeout=VERSION_TIMEOUT)
+        return cache.incr(key)
+
+
+def user_version_key(user_id):
+    return f'auth:user:{user_id}:version'
+
+
+def bump_user_version(user_id):
+    """
+    Отмечает изменение пользователя (роль, активность, удаление): снимки в кэшах
+    всех воркеров, загруженные под старой версией, перестают приниматься.
+    Как и у заказов — сразу и ещё раз после коммита.
+    """
+    key = user_version_key(user_id)
+    bump_version(key)
+    transaction.on_commit(lambda: bump_version(key), robust=True)
+
+
+def owner_orders_version_key(owner_id):
+    return f'{ORDERS_VERSION_KEY}:owner:{owner_id}'
+
+
+def get_orders_version(owner_id=None):
+    """
+    Версия заказов: общая (owner_id=None) или одного владельца.
+    Возвращает (версия, время последнего изменения или None).
+    """
+    key = ORDERS_VERSION_KEY if owner_id is None else owner_orders_version_key(owner_id)
+    # Без общего кэша get_version перечитывает из БД и время изменения
+    version = get_version(key)
+    return version, cache.get(f'{key}:ts')
+
+
+def _bump_orders(owner_ids):
+    keys = [ORDERS_VERSION_KEY] + [owner_orders_version_key(owner_id) for owner_id in owner_ids]
+    if not settings.VERSIONS_SHARED_CACHE:
+        _bump_stored(keys)
+        return
+    now = time.time()
+    for key in keys:
+        bump_version(key)
+    cache.set_many({f'{key}:ts': now for key in keys}, timeout=VERSION_TIMEOUT)
+
+
+def bump_orders_version(owner_ids):
+    """
+    Отмечает изменение заказов владельцев owner_ids.
+    Поднимаем версию сразу и ещё раз после коммита: иначе читатель, увидевший новую
+    версию до коммита, мог бы закрепить под ней старые данные.
+    Повторный подъём выполняется уже после записи данных, поэтому его ошибка (например,
+    "database is locked" на VersionCounter) только логируется (robust=True) и не выдаёт
+    сохранённые данные за несохранённые.
+    """
+    owner_ids = set(owner_ids)
+    _bump_orders(owner_ids)
+    transaction.on_commit(lambda: _bump_orders(owner_ids), robust=True)
@@ -1,11 +1,45 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status, viewsets, serializers
-from drf_spectacular.utils import extend_schema
-from .serializers import RegistrationSerializer, LoginSerializer
-from .models import User, Order
-from .utils import generate_jwt_token
-from .permissions import RBCPermission
+from rest_framework.decorators import action
+from rest_framework.exceptions import APIException
+import codecs
+import csv
+import hashlib
+import itertools
+import json
+import jwt
+import time
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import router, transaction
+from django.db.models import F
+from django.http import Http404, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from .serializers import RegistrationSerializer, LoginSerializer, TokenRefreshSerializer, LogoutSerializer
+from .models import User, Order, IdempotencyKey
+from .utils import issue_tokens
+from .permissions import RBCPermission, resolve_scope
+from .pagination import KeysetPagination, SearchPagination
+from .versions import get_orders_version
+from .signals import orders_bulk_created, orders_bulk_deleted, orders_bulk_updated
+from .order_writes import update_order, delete_order
+from .group_commit import GroupCommitCancelled, GroupCommitOutcomeUnknown, get_group_writer
+from .response_cache import get_response_cache
+from .db_router import pin_primary_if_recent
+from .metrics import phase, record_rows
+from .search import OrderSearch
+from .schema import OpenApiParameter, extend_schema
+from .stats import order_stats
+from .user_import import UserImporter, read_records
+from .idempotency import (
+    IdempotencyKeyInProgress, IdempotencyKeyMismatch, claim_idempotency_key, release_idempotency_key,
+    request_fingerprint, store_idempotent_response,
+)
+from .revocation import revocation_list
+from .auth_cache import principal_cache, token_digest
 from .authentication import MiddlewareAuthentication  # <--- 1. ИМПОРТ
 
 
@@ -46,10 +80,9 @@ class LoginView(APIView):
 
             if user.check_password(password):
                 role_name = user.role.name if user.role else 'guest'
-                token = generate_jwt_token(user.id, role_name)
 
                 return Response({
-                    "token": token,
+                    **issue_tokens(user),
                     "user_id": user.id,
                     "role": role_name
                 }, status=status.HTTP_200_OK)
@@ -59,8 +92,151 @@ class LoginView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class TokenRefreshView(APIView):
+
+    @extend_schema(
+        request=TokenRefreshSerializer,
+        responses={200: None},
+        description="Принимает refresh-токен (он отзывается), выдаёт новую пару токенов с актуальными правами"
+    )
+    def post(self, request):
+        serializer = TokenRefreshSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            payload = jwt.decode(serializer.validated_data['refresh'], settings.SECRET_KEY, algorithms=['HS256'])
+        except (jwt.ExpiredSignatureError, jwt.DecodeError):
+            return Response({"error": "Invalid refresh token"}, status=status.HTTP_401_UNAUTHORIZED)
+
+        if payload.get('type') != 'refresh' or revocation_list.is_token_revoked(payload):
+            return Response({"error": "Invalid refresh token"}, status=status.HTTP_401_UNAUTHORIZED)
+
+        try:
+            user = User.objects.select_related('role').get(id=payload['user_id'])
+        except User.DoesNotExist:
+            return Response({"error": "Invalid refresh token"}, status=status.HTTP_401_UNAUTHORIZED)
+
+        if not user.is_active:
+            return Response({"error": "Account is disabled"}, status=status.HTTP_403_FORBIDDEN)
+
+        # Ротация: refresh-токен одноразовый. Из двух одновременных обменов одного токена
+        # пройдёт один, повтор (в том числе украденной копии) получит 401
+        if not revocation_list.revoke(payload):
+            return Response({"error": "Invalid refresh token"}, status=status.HTTP_401_UNAUTHORIZED)
+
+        return Response({
+            **issue_tokens(user),
+            "user_id": user.id,
+            "role": user.role.name if user.role else 'guest'
+        }, status=status.HTTP_200_OK)
+
+
+class LogoutView(APIView):
+    authentication_classes = [MiddlewareAuthentication]
+
+    @extend_schema(
+        request=LogoutSerializer,
+        responses={200: None},
+        description="Отзывает текущий access-токен (и refresh-токен, если передан)"
+    )
+    def post(self, request):
+        if not request.user or not request.user.is_authenticated:
+            return Response({"error": "Invalid token"}, status=status.HTTP_401_UNAUTHORIZED)
+
+        serializer = LogoutSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        # Middleware уже проверила подпись и срок — здесь нужен только payload с jti
+        token = request.headers['Authorization'].split(' ')[1]
+        revocation_list.revoke(jwt.decode(token, settings.SECRET_KEY, algorithms=['HS256']))
+        principal_cache.delete(token_digest(token))
+
+        refresh = serializer.validated_data.get('refresh')
+        if refresh:
+            try:
+                payload = jwt.decode(refresh, settings.SECRET_KEY, algorithms=['HS256'])
+            except (jwt.ExpiredSignatureError, jwt.DecodeError):
+                payload = None
+            # Чужой refresh-токен отозвать нельзя
+            if payload and payload.get('type') == 'refresh' and payload['user_id'] == request.user.id:
+                revocation_list.revoke(payload)
+
+        return Response({"message": "Logged out"}, status=status.HTTP_200_OK)
+
+
+IMPORT_CONTENT_TYPES = {
+    'text/csv': 'csv',
+    'application/x-ndjson': 'ndjson',
+}
+
+
+class UserImportView(APIView):
+    """
+    Массовая регистрация пользователей (право create на ресурс users).
+    Тело — CSV или NDJSON, читается потоком; за запрос обрабатывается не больше
+    USERS_IMPORT_MAX_ROWS записей. Если ответ пришёл с complete=false или оборвался,
+    запрос повторяют с ?start=<checkpoint> — уже созданные записи вернутся как дубли.
+    На испорченном посреди потоке (кодировка, CSV) ответ 400 с последним закоммиченным checkpoint.
+    """
+    authentication_classes = [MiddlewareAuthentication]
+    permission_classes = [RBCPermission]
+    resource_code = 'users'
+
+    @extend_schema(
+        request=None,
+        parameters=[
+            OpenApiParameter('start', int, description='Сколько записей пропустить (checkpoint прошлого ответа)'),
+            OpenApiParameter('role', str, description='Роль для записей без колонки role'),
+        ],
+        responses={200: None},
+        description="Массовый импорт пользователей из text/csv или application/x-ndjson",
+    )
+    def post(self, request):
+        import_format = IMPORT_CONTENT_TYPES.get(request.content_type.split(';')[0].strip())
+        if import_format is None:
+            return Response({"error": "Use text/csv or application/x-ndjson"},
+                            status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+        try:
+            start = max(int(request.query_params.get('start', 0)), 0)
+            importer = UserImporter(default_role=request.query_params.get('role'))
+        except ValueError as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        stream = codecs.getreader('utf-8')(request.stream) if request.stream is not None else []
+        records = itertools.islice(read_records(stream, import_format), start, None)
+        limited = itertools.islice(records, settings.USERS_IMPORT_MAX_ROWS)
+
+        created, errors, checkpoint = 0, [], start
+        try:
+            for batch in importer.run(limited):
+                created += batch['created']
+                errors += batch['errors']
+                checkpoint = batch['checkpoint']
+            # Лимит исчерпан, а записи ещё есть — продолжать с checkpoint
+            complete = next(records, None) is None
+        except (csv.Error, UnicodeDecodeError) as exc:
+            # Поток не разобрать дальше: пачки до checkpoint уже закоммичены, недочитанная — нет
+            return Response({
+                "error": f"Malformed input after record {checkpoint}: {exc}",
+                "created": created,
+                "errors": errors,
+                "checkpoint": checkpoint,
+                "complete": False,
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            "created": created,
+            "errors": errors,
+            "checkpoint": checkpoint,
+            "complete": complete,
+        }, status=status.HTTP_200_OK)
+
+
 # --- RESOURCE VIEWS (ORDER) ---
 
+
 class OrderSerializer(serializers.ModelSerializer):
     owner = serializers.StringRelatedField(read_only=True)
 
@@ -69,6 +245,122 @@ class OrderSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+class OrderBulkItemSerializer(serializers.Serializer):
+    op = serializers.ChoiceField(choices=['create', 'update', 'delete'])
+    id = serializers.IntegerField(required=False)
+    description = serializers.CharField(max_length=255, required=False)
+
+    def validate(self, data):
+        if data['op'] in ('update', 'delete') and 'id' not in data:
+            raise serializers.ValidationError({"id": "This field is required."})
+        if data['op'] in ('create', 'update') and 'description' not in data:
+            raise serializers.ValidationError({"description": "This field is required."})
+        return data
+
+
+class OrderBulkSerializer(serializers.Serializer):
+    operations = serializers.ListField(child=serializers.DictField(), allow_empty=False)
+
+    def validate_operations(self, value):
+        limit = getattr(settings, 'ORDERS_BULK_MAX_OPERATIONS', 5000)
+        if len(value) > limit:
+            raise serializers.ValidationError(f"No more than {limit} operations per request.")
+        return value
+
+
+# Поля для быстрого списка: email владельца берётся JOIN-ом в том же запросе
+ORDER_LIST_FIELDS = ('id', 'description', 'created_at', 'owner_email')
+
+_created_at_field = serializers.DateTimeField()
+
+
+def order_row_to_representation(row):
+    """
+    Быстрая сериализация строки из .values() — тот же формат, что у OrderSerializer,
+    но без ModelSerializer и без запросов за владельцем.
+    """
+    return {
+        'id': row['id'],
+        'owner': row['owner_email'],
+        'description': row['description'],
+        'created_at': _created_at_field.to_representation(row['created_at']),
+    }
+
+
+class _Echo:
+    """
+    Псевдо-файл для csv.writer: отдаёт строку обратно вместо записи.
+    """
+
+    def write(self, value):
+        return value
+
+
+def _ndjson_chunks(rows):
+    for row in rows:
+        yield json.dumps(order_row_to_representation(row), ensure_ascii=False) + '\n'
+
+
+def _csv_chunks(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(['id', 'owner', 'description', 'created_at'])
+    for row in rows:
+        item = order_row_to_representation(row)
+        yield writer.writerow([item['id'], item['owner'], item['description'], item['created_at']])
+
+
+def _batched(chunks, size):
+    """
+    Склеивает мелкие куски в пачки, чтобы не отдавать серверу по строке за раз.
+    """
+    batch = []
+    for chunk in chunks:
+        batch.append(chunk)
+        if len(batch) >= size:
+            yield ''.join(batch)
+            batch = []
+    if batch:
+        yield ''.join(batch)
+
+
+_EXHAUSTED = object()
+
+
+async def _async_batches(batches):
+    """
+    Async-обёртка для ASGI: StreamingHttpResponse читает sync-итератор через sync_to_async(list),
+    то есть собирает всю выгрузку в памяти. Здесь каждая пачка читается отдельным вызовом
+    в том же потоке (thread_sensitive), где открыт курсор.
+    """
+    next_batch = sync_to_async(next, thread_sensitive=True)
+    while True:
+        batch = await next_batch(batches, _EXHAUSTED)
+        if batch is _EXHAUSTED:
+            return
+        yield batch
+
+
+EXPORT_FORMATS = {
+    'ndjson': (_ndjson_chunks, 'application/x-ndjson'),
+    'csv': (_csv_chunks, 'text/csv'),
+}
+
+
+class OrderNotCommitted(APIException):
+    # Заказ снят с очереди писателя до записи — не сохранён, повтор безопасен
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Order was not saved, retry later.'
+    default_code = 'order_not_committed'
+    wait = 1  # DRF выставит Retry-After
+
+
+class OrderCommitUnknown(APIException):
+    # Пачка с заказом уже пишется, но не закоммитилась за ORDERS_GROUP_COMMIT_TIMEOUT
+    status_code = status.HTTP_504_GATEWAY_TIMEOUT
+    default_detail = 'Order commit timed out, the order may have been saved. Check the order list before retrying.'
+    default_code = 'order_commit_unknown'
+
+
 class OrderViewSet(viewsets.ModelViewSet):
     """
     CRUD для заказов.
@@ -78,8 +370,11 @@ class OrderViewSet(viewsets.ModelViewSet):
 
     serializer_class = OrderSerializer
     permission_classes = [RBCPermission]
+    pagination_class = KeysetPagination
 
     resource_code = 'orders'
+    # Действия, где RBAC проверяется поэлементно внутри view
+    item_level_actions = ('bulk',)
 
     def get_queryset(self):
         queryset = Order.objects.all()
@@ -87,9 +382,358 @@ class OrderViewSet(viewsets.ModelViewSet):
         if scope == 'ALL':
             return queryset
         elif scope == 'OWN':
-            return queryset.filter(owner=self.request.user)
+            return queryset.filter(owner_id=self.request.user.id)
         else:
             return queryset.none()
 
+    def get_lookup_pk(self):
+        # Нечисловой id — такого заказа нет (как и у get_object_or_404)
+        try:
+            return int(self.kwargs[self.lookup_url_kwarg or self.lookup_field])
+        except (TypeError, ValueError):
+            raise Http404
+
+    def get_scope_owner_id(self):
+        # Для scope OWN условие по владельцу ставится прямо в WHERE запроса
+        return self.request.user.id if self.request.access_scope == 'OWN' else None
+
+    def get_cache_validators(self, pk=None):
+        """
+        ETag и Last-Modified из счётчиков версий заказов (общего для ALL, владельца для OWN).
+        Ни заказы, ни сериализация для этого не нужны. Версия меняется только при записи;
+        без общего кэша запись из другого процесса видна не позже чем через VERSIONS_LOCAL_TTL.
+        У Last-Modified секундная точность, поэтому точный валидатор — ETag:
+        If-None-Match проверяется раньше If-Modified-Since. Last-Modified отдаётся только
+        для уже закончившейся секунды: иначе следующая запись в ту же секунду его не изменила бы,
+        и клиент с одним If-Modified-Since получил бы 304 на устаревшие данные.
+        """
+        scope = self.request.access_scope
+        owner_id = self.request.user.id if scope == 'OWN' else None
+        version, modified_at = get_orders_version(owner_id)
+        pin_primary_if_recent(modified_at)
+
+        if pk is None:
+            # Разные страницы/параметры — разные представления
+            query = hashlib.md5(self.request.META.get('QUERY_STRING', '').encode('utf-8')).hexdigest()[:12]
+            etag = f'"orders-{scope}-{owner_id or 0}-{version}-{query}"'
+        else:
+            etag = f'"order-{pk}-{scope}-{owner_id or 0}-{version}"'
+        last_modified = None
+        if modified_at is not None and int(modified_at) < int(time.time()):
+            last_modified = int(modified_at)
+        return etag, last_modified
+
+    def conditional_response(self, request, etag, last_modified):
+        response = get_conditional_response(request._request, etag=etag, last_modified=last_modified)
+        if response is not None:
+            self.set_cache_validators(response, etag, last_modified)
+        return response
+
+    def set_cache_validators(self, response, etag, last_modified):
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def response_cache_key(self, etag):
+        # ETag уже включает scope, владельца (для OWN), версию и параметры запроса;
+        # хост добавляем из-за абсолютных ссылок пагинации
+        return f'orders:response:{self.request.get_host()}:{etag}'
+
+    def list(self, request, *args, **kwargs):
+        etag, last_modified = self.get_cache_validators()
+        not_modified = self.conditional_response(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        response_cache = get_response_cache()
+        cache_key = self.response_cache_key(etag)
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            return self.set_cache_validators(Response(cached), etag, last_modified)
+
+        queryset = (
+            self.filter_queryset(self.get_queryset())
+            .annotate(owner_email=F('owner__email'))
+            .values(*ORDER_LIST_FIELDS)
+        )
+
+        page = self.paginate_queryset(queryset)
+        rows = list(queryset if page is None else page)
+        record_rows(len(rows))
+        with phase('serialize'):
+            data = [order_row_to_representation(row) for row in rows]
+
+        if page is None:
+            response = Response(data)
+        else:
+            response = self.get_paginated_response(data)
+        response_cache.set(cache_key, response.data)
+        return self.set_cache_validators(response, etag, last_modified)
+
+    def retrieve(self, request, *args, **kwargs):
+        etag, last_modified = self.get_cache_validators(pk=kwargs[self.lookup_url_kwarg or self.lookup_field])
+        not_modified = self.conditional_response(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        response_cache = get_response_cache()
+        cache_key = self.response_cache_key(etag)
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            return self.set_cache_validators(Response(cached), etag, last_modified)
+
+        row = self.get_detail_row()
+        record_rows(1)
+        with phase('serialize'):
+            response = Response(order_row_to_representation(row))
+        response_cache.set(cache_key, response.data)
+        return self.set_cache_validators(response, etag, last_modified)
+
+    def get_detail_row(self):
+        """
+        Заказ с email владельца одним запросом; scope уже в WHERE, чужой заказ — 404.
+        """
+        row = (
+            self.get_queryset().filter(pk=self.get_lookup_pk())
+            .annotate(owner_email=F('owner__email'))
+            .values(*ORDER_LIST_FIELDS)
+            .first()
+        )
+        if row is None:
+            raise Http404
+        return row
+
+    def update(self, request, *args, **kwargs):
+        """
+        PUT/PATCH одной командой UPDATE ... WHERE id = ? [AND owner_id = ?] RETURNING ...,
+        без предварительного чтения заказа.
+        """
+        partial = kwargs.pop('partial', False)
+        serializer = self.get_serializer(data=request.data, partial=partial)
+        serializer.is_valid(raise_exception=True)
+        pk = self.get_lookup_pk()
+
+        if not serializer.validated_data:
+            # Пустой PATCH ничего не меняет — просто отдаём заказ
+            return Response(order_row_to_representation(self.get_detail_row()))
+
+        row = update_order(pk, serializer.validated_data, owner_id=self.get_scope_owner_id())
+        if row is None:
+            raise Http404
+        return Response(order_row_to_representation(row))
+
+    def destroy(self, request, *args, **kwargs):
+        """
+        DELETE ... WHERE id = ? [AND owner_id = ?] RETURNING ... — одна команда;
+        счётчики и версии обновляет post_delete в той же транзакции.
+        """
+        if delete_order(self.get_lookup_pk(), owner_id=self.get_scope_owner_id()) is None:
+            raise Http404
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @extend_schema(
+        parameters=[OpenApiParameter('q', str, required=True, description='Слова из описания заказа')],
+        responses={200: OrderSerializer(many=True)},
+        description="Полнотекстовый поиск по описанию, по релевантности: ?q=",
+    )
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """
+        Поиск по FTS5-индексу описаний. Для scope OWN фильтр по владельцу
+        стоит в том же запросе, что и MATCH, — чужие заказы не попадают даже в ранжирование.
+        """
+        text = request.query_params.get('q', '').strip()
+        search = OrderSearch(text, owner_id=request.user.id if request.access_scope == 'OWN' else None)
+        if search.match is None:
+            return Response({"error": "Query parameter 'q' is required"}, status=status.HTTP_400_BAD_REQUEST)
+
+        paginator = SearchPagination()
+        rows = paginator.paginate_queryset(search, request, view=self)
+        record_rows(len(rows))
+        with phase('serialize'):
+            data = [order_row_to_representation(row) for row in rows]
+        return paginator.get_paginated_response(data)
+
+    @extend_schema(
+        parameters=[OpenApiParameter('days', int, description='Глубина разбивки по дням (по умолчанию 30)')],
+        responses={200: None},
+        description="Число заказов: всего, по дням и по владельцам (в пределах scope)",
+    )
+    @action(detail=False, methods=['get'])
+    def stats(self, request):
+        """
+        Статистика из сводных счётчиков, без GROUP BY по заказам.
+        Scope OWN видит только свои цифры, ALL — общие и топ владельцев.
+        """
+        try:
+            days = min(max(int(request.query_params.get('days', 30)), 1), settings.ORDERS_STATS_MAX_DAYS)
+        except ValueError:
+            return Response({"error": "Invalid 'days'"}, status=status.HTTP_400_BAD_REQUEST)
+        owner = request.user if request.access_scope == 'OWN' else None
+        return Response(order_stats(owner=owner, days=days))
+
+    @extend_schema(responses={200: None}, description="Потоковая выгрузка заказов: ?export_format=ndjson|csv")
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Потоковая выгрузка всех доступных заказов (NDJSON или CSV).
+        Строки читаются из БД пачками, память воркера не зависит от размера таблицы
+        (под ASGI — через async-итератор, см. _async_batches).
+        """
+        export_format = request.query_params.get('export_format', 'ndjson')
+        if export_format not in EXPORT_FORMATS:
+            return Response({"error": f"Unknown export format: {export_format}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        chunk_size = getattr(settings, 'ORDERS_EXPORT_CHUNK_SIZE', 2000)
+        rows = (
+            self.get_queryset()
+            .annotate(owner_email=F('owner__email'))
+            .values(*ORDER_LIST_FIELDS)
+            .order_by('id')
+            .iterator(chunk_size=chunk_size)
+        )
+
+        to_chunks, content_type = EXPORT_FORMATS[export_format]
+        batches = _batched(to_chunks(rows), chunk_size)
+        if isinstance(request._request, ASGIRequest):
+            batches = _async_batches(batches)
+        response = StreamingHttpResponse(batches, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="orders.{export_format}"'
+        return response
+
+    @extend_schema(request=OrderBulkSerializer, responses={200: None},
+                   description="Пакет операций create/update/delete в одной транзакции")
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        Пакетные create/update/delete. Каждая операция проверяется по правам (OWN/ALL),
+        все валидные применяются одной транзакцией через bulk_create/bulk_update/DELETE ... IN.
+        Ответ — результат по каждой операции в исходном порядке.
+        """
+        envelope = OrderBulkSerializer(data=request.data)
+        if not envelope.is_valid():
+            return Response(envelope.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        user = request.user
+        scopes = {op: resolve_scope(user, self.resource_code, op) for op in ('create', 'update', 'delete')}
+
+        results = [None] * len(envelope.validated_data['operations'])
+        creates, updates, deletes = [], {}, {}
+        for index, raw in enumerate(envelope.validated_data['operations']):
+            item = OrderBulkItemSerializer(data=raw)
+            if not item.is_valid():
+                results[index] = {"index": index, "status": status.HTTP_400_BAD_REQUEST, "errors": item.errors}
+                continue
+            data = item.validated_data
+            if scopes[data['op']] is None:
+                results[index] = {"index": index, "status": status.HTTP_403_FORBIDDEN}
+            elif data['op'] == 'create':
+                creates.append((index, data))
+            elif data['op'] == 'update':
+                updates.setdefault(data['id'], []).append((index, data))
+            else:
+                deletes.setdefault(data['id'], []).append(index)
+
+        def scoped(op):
+            queryset = Order.objects.all()
+            if scopes[op] == 'OWN':
+                queryset = queryset.filter(owner_id=user.id)
+            return queryset
+
+        with transaction.atomic():
+            if creates:
+                objs = Order.objects.bulk_create(
+                    [Order(description=data['description'], owner_id=user.id) for _, data in creates],
+                    batch_size=500,
+                )
+                for (index, _), obj in zip(creates, objs):
+                    results[index] = {"index": index, "status": status.HTTP_201_CREATED, "id": obj.id}
+                orders_bulk_created(objs)
+
+            if updates:
+                found = scoped('update').only('id', 'owner_id', 'description').in_bulk(list(updates))
+                for pk, items in updates.items():
+                    for index, data in items:
+                        if pk in found:
+                            # При повторах одного id побеждает последняя операция
+                            found[pk].description = data['description']
+                            results[index] = {"index": index, "status": status.HTTP_200_OK, "id": pk}
+                        else:
+                            results[index] = {"index": index, "status": status.HTTP_404_NOT_FOUND, "id": pk}
+                Order.objects.bulk_update(found.values(), ['description'], batch_size=500)
+                if found:
+                    orders_bulk_updated(found.values())
+
+            if deletes:
+                doomed = list(scoped('delete').filter(id__in=list(deletes)).only('id', 'owner_id', 'created_at'))
+                found = {order.id for order in doomed}
+                if doomed:
+                    # Один DELETE ... WHERE id IN без Collector: зависимых строк у заказа нет, а post_delete
+                    # на каждую строку обновлял бы версии и счётчики по заказу — здесь это один шаг на пакет
+                    Order.objects.filter(id__in=found)._raw_delete(router.db_for_write(Order))
+                    orders_bulk_deleted(doomed)
+                for pk, indexes in deletes.items():
+                    for index in indexes:
+                        code = status.HTTP_204_NO_CONTENT if pk in found else status.HTTP_404_NOT_FOUND
+                        results[index] = {"index": index, "status": code, "id": pk}
+
+        return Response({"results": results}, status=status.HTTP_200_OK)
+
+    def create(self, request, *args, **kwargs):
+        """
+        С заголовком Idempotency-Key повтор запроса (того же пользователя с тем же ключом)
+        получает сохранённый ответ первого, не создавая заказ заново.
+        """
+        key = request.headers.get('Idempotency-Key')
+        if key is None:
+            return super().create(request, *args, **kwargs)
+        if not key or len(key) > IdempotencyKey._meta.get_field('key').max_length:
+            return Response({"error": "Invalid Idempotency-Key"}, status=status.HTTP_400_BAD_REQUEST)
+
+        user_id = request.user.id
+        try:
+            stored = claim_idempotency_key(user_id, key, request_fingerprint(request))
+        except IdempotencyKeyMismatch:
+            return Response({"error": "Idempotency-Key was used with a different request"},
+                            status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        except IdempotencyKeyInProgress:
+            return Response({"error": "A request with this Idempotency-Key is still in progress"},
+                            status=status.HTTP_409_CONFLICT)
+        if stored is not None:
+            response = Response(stored.response, status=stored.status_code)
+            response['Idempotent-Replayed'] = 'true'
+            return response
+
+        stored = False
+        try:
+            # Заказ и сохранённый ответ коммитятся вместе: после коммита повтор получит ответ,
+            # без коммита нет и заказа
+            with transaction.atomic():
+                response = super().create(request, *args, **kwargs)
+                store_idempotent_response(user_id, key, response.status_code, response.data)
+                stored = True
+        except Exception:
+            # Ошибка до коммита (в том числе валидации) всё откатила — ключ освобождается,
+            # исправленный повтор выполнится. Если упал сам коммит, исход неизвестен: ключ остаётся
+            # занятым до IDEMPOTENCY_IN_FLIGHT_TIMEOUT, и повтор не создаст второй заказ
+            if not stored:
+                release_idempotency_key(user_id, key)
+            raise
+        return response
+
     def perform_create(self, serializer):
-        serializer.save(owner=self.request.user)
\ No newline at end of file
+        # С Idempotency-Key заказ должен попасть в транзакцию create вместе с ответом,
+        # а писатель коммитит пачки в своём потоке — такие запросы идут мимо него
+        if settings.ORDERS_GROUP_COMMIT and 'Idempotency-Key' not in self.request.headers:
+            # Вставку делает общий писатель процесса пачкой с соседними запросами;
+            # возвращаемся, когда пачка закоммичена и у заказа есть id
+            order = Order(owner=self.request.user, **serializer.validated_data)
+            try:
+                serializer.instance = get_group_writer().submit(order, timeout=settings.ORDERS_GROUP_COMMIT_TIMEOUT)
+            except GroupCommitCancelled:
+                raise OrderNotCommitted()
+            except GroupCommitOutcomeUnknown:
+                raise OrderCommitUnknown()
+        else:
+            serializer.save(owner=self.request.user)
\ No newline at end of file